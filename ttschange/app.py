@@ -1,114 +1,290 @@
 import logging
 import os
+import io
+import sys
+import glob
+import time
+import signal
 import asyncio
-import aiohttp
 from aiogram import Bot, Dispatcher, executor, types
+from aiogram.bot.api import TelegramAPIServer, TELEGRAM_PRODUCTION
 from aiogram.dispatcher.filters import Filter
+from aiogram.utils import exceptions
 from sql import Database
+from database_migrations import Migrator
+from audio_cache import AudioCache, make_key
+from user_cache import UserCache
+from http_client import HttpClient
+from text_chunker import split_text
+from job_queue import JobQueue, QueueFull, QueueClosed, UserQueueFull
+from job_journal import JobJournal
+from coalesce import SingleFlight
+from deadline import RequestTracker, DeadlineExceeded
+import deadline
+from webhook import start_webhook
+from providers import ProviderRouter, PlayHTProvider, EspeakProvider, MockProvider
+from broadcast import BroadcastEngine
+from bot_context import BotContext
+from transcoder import Transcoder, TranscodeError
+from usage_log import UsageLog
+from phrase_library import PhraseLibrary
+from user_stats import UserStats
+from limiter import Limit
+from shared_state import create_state
+from throttling import ThrottlingMiddleware, StaleUpdateMiddleware, InflightUpdates
+import metrics
+from metrics import timed
+from log_pipeline import LogPipeline, SAMPLED
 from dotenv import load_dotenv
 
 load_dotenv()  # .env faylini o'qish
 
-# Bazaga ulanish
-db = Database(path_to_db="main.db")
+# Loglar navbat orqali fon oqimida yoziladi (event loop formatlash va I/O kutmaydi);
+# har bir xabardagi yozuvlar LOG_SAMPLE_EVERY tadan bittasi qoldiriladi
+log_pipeline = LogPipeline(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    mode=os.getenv("LOG_MODE", "queue"),
+    fmt=os.getenv("LOG_FORMAT", "text"),
+    sample_every=int(os.getenv("LOG_SAMPLE_EVERY", "100")),
+    filename=os.getenv("LOG_FILE") or None,
+).install()
+SQL_TRACE = os.getenv("SQL_TRACE", "0") == "1"
+
+# Bazaga ulanish (DATABASE_URL berilsa PostgreSQL, aks holda SQLite)
+DATABASE_URL = os.getenv("DATABASE_URL", "")
+if DATABASE_URL.startswith(("postgres://", "postgresql://")):
+    from postgres import PostgresDatabase
+    db = PostgresDatabase(
+        dsn=DATABASE_URL,
+        min_size=int(os.getenv("DB_POOL_MIN", "1")),
+        max_size=int(os.getenv("DB_POOL_MAX", "10")),
+        trace_sql=SQL_TRACE,
+    )
+else:
+    db = Database(path_to_db=os.getenv("DB_PATH", "main.db"), trace_sql=SQL_TRACE)
+
+# Sxema migratsiyalari startupda qo'llanadi; ma'lumot ko'chiradiganlari bot ishlay boshlagach fonda,
+# kichik partiyalarda bajariladi
+migrator = Migrator(
+    db,
+    batch_size=int(os.getenv("MIGRATION_BATCH_SIZE", "1000")),
+    batch_pause=float(os.getenv("MIGRATION_BATCH_PAUSE", "0.05")),
+)
+
+# Ishchilar o'rtasidagi umumiy holat: sozlamalar, file_id keshi, rate limit, broadcast lease va
+# bir xil so'rovlarni birlashtirish. memory - bitta jarayon; redis yoki database - bir nechta ishchi
+shared_state = create_state(os.getenv("STATE_BACKEND", "memory"), db=db, redis_url=os.getenv("REDIS_URL"))
 
 # Bot sozlamalari
 BOT_TOKEN = os.getenv("BOT_TOKEN")
-ADMIN_IDS = list(map(int, filter(None, os.getenv("ADMIN_IDS", "").split(","))))  # Bo'sh qiymatlarni filtrlash
-logging.basicConfig(level=logging.INFO)
-bot = Bot(token=BOT_TOKEN, parse_mode=types.ParseMode.HTML)
+ADMIN_IDS = frozenset(map(int, filter(None, os.getenv("ADMIN_IDS", "").split(","))))  # Bo'sh qiymatlarni filtrlash
+
+# Prometheus metrikalari uchun lokal HTTP endpoint
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))
+
+# Ishga tushirish rejimi: polling (standart) yoki webhook
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "")  # tashqi HTTPS manzil, masalan https://example.com
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBAPP_HOST = os.getenv("WEBAPP_HOST", "127.0.0.1")  # reverse proxy ortidagi lokal manzil
+WEBAPP_PORT = int(os.getenv("WEBAPP_PORT", "8080"))
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "1"))
+WEBHOOK_DRAIN_SECONDS = float(os.getenv("WEBHOOK_DRAIN_SECONDS", "30"))
+
+# Provayder javobi (MP3/WAV/...) mono Opus/OGG ovozli xabarga o'giriladi; keshda shu natija saqlanadi
+transcoder = Transcoder(
+    bitrate=os.getenv("TRANSCODE_BITRATE", "32k"),
+    loudnorm=os.getenv("TRANSCODE_LOUDNORM", "1") == "1",
+    workers=int(os.getenv("TRANSCODE_WORKERS", "0")) or None,
+    timeout=float(os.getenv("TRANSCODE_TIMEOUT", "60")),
+    enabled=os.getenv("TRANSCODE_ENABLED", "1") == "1",
+)
+
+# Foydalanuvchi sozlamalari keshi (yangi foydalanuvchilar paketlab yoziladi)
+user_cache = UserCache(db, flush_interval=float(os.getenv("USER_CACHE_FLUSH_SECONDS", "2")), state=shared_state)
+
+# Oldindan yuklangan iboralar (warmup.py to'ldiradi): qisqa mashhur matnlar uchun tayyor file_id
+PHRASE_MAX_CHARS = int(os.getenv("PHRASE_MAX_CHARS", "64"))
+phrases = PhraseLibrary(os.getenv("PHRASE_INDEX_PATH", "phrase_index.tsv"), max_chars=PHRASE_MAX_CHARS)
+
+# Foydalanish statistikasi (har bir so'rov xotiradagi buferga, bazaga paketlab yoziladi)
+usage_log = UsageLog(
+    db,
+    flush_interval=float(os.getenv("USAGE_FLUSH_SECONDS", "5")),
+    retention_days=int(os.getenv("USAGE_RETENTION_DAYS", "90")),
+    phrase_max_chars=PHRASE_MAX_CHARS,
+)
+
+# /stat uchun foydalanuvchi hisoblagichlari (triggerlar bilan yangilanadi, vaqti-vaqti bilan qayta sanaladi)
+user_stats = UserStats(db, reconcile_interval=float(os.getenv("USER_STATS_RECONCILE_SECONDS", "3600")))
+
+# Sintez qilingan audio keshi
+audio_cache = AudioCache(
+    cache_dir=os.getenv("AUDIO_CACHE_DIR", "audio_cache"),
+    memory_max_bytes=int(os.getenv("AUDIO_CACHE_MEMORY_MB", "32")) * 1024 * 1024,
+    disk_max_bytes=int(os.getenv("AUDIO_CACHE_DISK_MB", "512")) * 1024 * 1024,
+    disk_ttl=int(os.getenv("AUDIO_CACHE_TTL_HOURS", "168")) * 3600,
+    namespace=transcoder.format_tag,
+    state=shared_state,
+)
+
+# Shu hajmdan katta audio xotirada emas, vaqtinchalik faylda saqlanadi
+AUDIO_SPILL_BYTES = int(os.getenv("AUDIO_SPILL_MB", "8")) * 1024 * 1024
+
+# Uzun matn rejimi: TTS_CHUNK_CHARS dan uzun matn bo'laklarga ajratiladi
+TTS_CHUNK_CHARS = int(os.getenv("TTS_CHUNK_CHARS", "1000"))
+TTS_CHUNK_CONCURRENCY = int(os.getenv("TTS_CHUNK_CONCURRENCY", "3"))
+LONG_TEXT_MAX_CHARS = int(os.getenv("LONG_TEXT_MAX_CHARS", "10000"))
+VOICE_PART_MAX_BYTES = int(os.getenv("VOICE_PART_MAX_MB", "20")) * 1024 * 1024
+
+# Sintez navbati: ishchilar soni, navbat chuqurligi va har bir foydalanuvchi uchun cheklov
+job_queue = JobQueue(
+    workers=int(os.getenv("TTS_WORKERS", "8")),
+    max_depth=int(os.getenv("TTS_QUEUE_MAX_DEPTH", "200")),
+    per_user_limit=int(os.getenv("TTS_QUEUE_PER_USER", "3")),
+)
+# Bir xil (ovoz, matn) so'rovlarini birlashtirish
+flights = SingleFlight(state=shared_state)
+TTS_FLIGHT_TIMEOUT = float(os.getenv("TTS_FLIGHT_TIMEOUT", "60"))
+# Har bir so'rov uchun umumiy muddat (navbat, provayder, yuklab olish va Telegram'ga yuklash birga).
+# Foydalanuvchi yangi xabar yuborsa, avvalgi tugallanmagan so'rovi bekor qilinadi
+tracker = RequestTracker(
+    timeout=float(os.getenv("REQUEST_DEADLINE_SECONDS", "120")),
+    supersede=os.getenv("TTS_SUPERSEDE", "1") == "1",
+    grace=float(os.getenv("TTS_SUPERSEDE_GRACE_SECONDS", "3")),
+)
+# Bekor qilingan so'rov xabari (sabab bo'yicha)
+CANCEL_MESSAGES = {
+    'superseded': "⏭ Yangi xabaringiz qabul qilindi, bu so'rov bekor qilindi",
+    'deadline': "⌛ Audio tayyorlash juda uzoq davom etdi, qaytadan urinib ko'ring",
+}
+# Navbatga qo'yilgan ishlar jurnali: bot to'xtatilganda tugallanmagan ishlar keyingi ishga tushishda
+# JOB_REPLAY_RATE tezlikda qayta navbatga qo'yiladi (JOB_REPLAY_MAX_AGE dan eskilari tashlanadi)
+journal = JobJournal(
+    path=os.getenv("JOB_JOURNAL_PATH", "job_journal.db"),
+    replay_rate=float(os.getenv("JOB_REPLAY_RATE", "5")),
+    max_age=float(os.getenv("JOB_REPLAY_MAX_AGE", "3600")),
+    flush_interval=float(os.getenv("JOB_JOURNAL_FLUSH_SECONDS", "0.5")),
+)
+# To'xtashda navbatdagi ishlar va joriy broadcast sahifasi tugashini kutish vaqti
+SHUTDOWN_DRAIN_SECONDS = float(os.getenv("SHUTDOWN_DRAIN_SECONDS", "30"))
+RESTART_MESSAGE = "♻️ Bot yangilanmoqda, audio qayta ishga tushgach yuboriladi"
+# play.ht ga bir vaqtda yuboriladigan so'rovlarning umumiy chegarasi
+tts_slots = asyncio.Semaphore(int(os.getenv("TTS_MAX_CONCURRENCY", "8")))
+
+# Umumiy HTTP ulanishlar havzasi (play.ht va CDN uchun)
+http = HttpClient(
+    limit=int(os.getenv("HTTP_POOL_LIMIT", "100")),
+    limit_per_host=int(os.getenv("HTTP_POOL_PER_HOST", "20")),
+    keepalive_timeout=int(os.getenv("HTTP_KEEPALIVE_SECONDS", "30")),
+    dns_cache_ttl=int(os.getenv("HTTP_DNS_CACHE_SECONDS", "300")),
+    connect_timeout=float(os.getenv("HTTP_CONNECT_TIMEOUT", "5")),
+    read_timeout=float(os.getenv("HTTP_READ_TIMEOUT", "30")),
+)
+
+# TTS provayderlar (TTS_PROVIDERS tartibida; ovozlar registri har bir provayderda)
+def build_providers():
+    providers = []
+    for name in filter(None, os.getenv("TTS_PROVIDERS", "playht,espeak").split(",")):
+        name = name.strip()
+        if name == "playht":
+            providers.append(PlayHTProvider(
+                http,
+                url=os.getenv("PLAYHT_URL", "https://play.ht/api/transcribe"),
+                spill_bytes=AUDIO_SPILL_BYTES,
+            ))
+        elif name == "espeak":
+            espeak = EspeakProvider()
+            if espeak.available:
+                providers.append(espeak)
+            else:
+                logging.warning("⚠️ espeak-ng topilmadi, oflayn zaxira provayder o'chirilgan")
+        elif name == "mock":
+            providers.append(MockProvider(latency=float(os.getenv("MOCK_TTS_LATENCY", "0"))))
+        else:
+            logging.warning(f"⚠️ Noma'lum TTS provayder: {name}")
+    return providers
+
+tts_router = ProviderRouter(
+    build_providers(),
+    hedge_after=float(os.getenv("TTS_HEDGE_AFTER", "3")),
+    timeout=float(os.getenv("TTS_PROVIDER_TIMEOUT", "30")),
+    failure_threshold=int(os.getenv("TTS_BREAKER_FAILURES", "5")),
+    open_seconds=float(os.getenv("TTS_BREAKER_OPEN_SECONDS", "30")),
+)
+
+# O'z Bot API serveringiz (yoki benchmark uchun lokal mock) ishlatilsa
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "")
+bot = Bot(
+    token=BOT_TOKEN,
+    parse_mode=types.ParseMode.HTML,
+    server=TelegramAPIServer.from_base(TELEGRAM_API_URL) if TELEGRAM_API_URL else TELEGRAM_PRODUCTION,
+)
 dp = Dispatcher(bot)
 
+# Bot nomi, adminlar va klaviaturalar bir marta (on_startup'da) tayyorlanadi
+bot_ctx = BotContext(bot, ADMIN_IDS)
+
+# Qayta ishga tushgandan keyin kutib turgan yangilanishlar qayta ishlanadi;
+# faqat UPDATE_MAX_AGE_SECONDS dan eskilari jimgina tashlanadi
+stale_updates = StaleUpdateMiddleware(max_age=float(os.getenv("UPDATE_MAX_AGE_SECONDS", "600")))
+dp.middleware.setup(stale_updates)
+
+# To'xtashda ishlanayotgan yangilanishlar navbatga ish qo'yib ulgurishi uchun kutiladi
+inflight_updates = InflightUpdates()
+dp.middleware.setup(inflight_updates)
+
+# Rate limit: har bir foydalanuvchi va butun bot uchun (so'rov/daqiqa va belgi/daqiqa).
+# Chelaklar STATE_BACKEND=redis bo'lsa barcha ishchilar uchun umumiy, aks holda jarayon xotirasida
+throttling = ThrottlingMiddleware(
+    shared_state.buckets(),
+    user_limits=(
+        Limit.per_minute(float(os.getenv("THROTTLE_USER_RPM", "20"))),
+        Limit.per_minute(float(os.getenv("THROTTLE_USER_CPM", "6000"))),
+    ),
+    global_limits=(
+        Limit.per_minute(float(os.getenv("THROTTLE_GLOBAL_RPM", "1200"))),
+        Limit.per_minute(float(os.getenv("THROTTLE_GLOBAL_CPM", "300000"))),
+    ),
+    is_exempt=bot_ctx.is_admin,
+)
+dp.middleware.setup(throttling)
+
+# Ommaviy xabar yuborish mexanizmi
+broadcaster = BroadcastEngine(
+    bot, db,
+    rate=float(os.getenv("BROADCAST_RATE", "25")),
+    concurrency=int(os.getenv("BROADCAST_CONCURRENCY", "20")),
+    page_size=int(os.getenv("BROADCAST_PAGE_SIZE", "500")),
+    state=shared_state,
+    lease_ttl=float(os.getenv("BROADCAST_LEASE_SECONDS", "120")),
+)
+
 # Admin filtri
 class AdminFilter(Filter):
     def check(self, obj):
-        if isinstance(obj, types.Message):
-            return obj.from_user.id in ADMIN_IDS
-        elif isinstance(obj, types.CallbackQuery):
-            return obj.from_user.id in ADMIN_IDS
+        if isinstance(obj, (types.Message, types.CallbackQuery)):
+            return bot_ctx.is_admin(obj.from_user.id)
         return False
 
 # Admin filtrini ro'yxatga olish
 dp.filters_factory.bind(AdminFilter)
 
-# TTS API orqali matnni audio faylga aylantirish
-async def tts_change(mod, text):
-    headers = {
-        'Content-Type': 'application/json',
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-    }
-    
-    json_data = {
-        "userId": "public-access",
-        "platform": "landing_demo", 
-        "ssml": f"<speak><p>{text}</p></speak>",
-        "voice": f"{mod}",
-        "narrationStyle": "regular"
-    }
-
-    try:
-        async with aiohttp.ClientSession(
-            timeout=aiohttp.ClientTimeout(total=30),
-            headers=headers
-        ) as session:
-            async with session.post("https://play.ht/api/transcribe", json=json_data) as response:
-                content_type = response.headers.get("Content-Type", "")
-                
-                # Audio fayl kelgan holatda
-                if "audio" in content_type:
-                    logging.info(f"✅ Audio fayl olindi: {content_type}")
-                    return {
-                        'file_content': await response.read(),
-                        'content_type': content_type
-                    }
-                # JSON javob kelgan holatda
-                elif "application/json" in content_type:
-                    data = await response.json()
-                    logging.info(f"✅ JSON javob olindi: {data}")
-                    return data
-                else:
-                    logging.error(f"❌ Noma'lum content type: {content_type}")
-                    # Javobni text sifatida o'qib ko'ramiz
-                    text_response = await response.text()
-                    logging.error(f"❌ Javob matni: {text_response[:200]}...")
-                    return None
-                    
-    except asyncio.TimeoutError:
-        logging.error("❌ TTS API timeout")
-        return None
-    except Exception as e:
-        logging.error(f"❌ TTS API xatolik: {e}")
-        return None
-
-# URL'dan audio yuklab olish
-async def download_file(url, destination):
-    try:
-        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30)) as session:
-            async with session.get(url) as response:
-                if response.status == 200:
-                    with open(destination, 'wb') as f:
-                        f.write(await response.read())
-                    return 'save'
-                else:
-                    logging.error(f"Yuklab olishda xatolik: {response.status}")
-                    return None
-    except asyncio.TimeoutError:
-        logging.error("❌ Download timeout")
-        return None
-    except Exception as e:
-        logging.error(f"❌ Download xatolik: {e}")
-        return None
+# Matnni audio faylga aylantirish (provayderlar orqali: tezkor tanlov, hedge va failover)
+async def tts_change(voice, text):
+    return await tts_router.synthesize(voice, text)
 
 # /start buyrug'i
 @dp.message_handler(commands=['start'])
 async def send_welcome(message: types.Message):
-    try:
-        db.add_user(user_id=message.from_user.id, name=message.from_user.full_name, voice='women')
-    except Exception as e:
-        logging.error(f"Foydalanuvchi qo'shishda xatolik: {e}")
+    user_cache.ensure_user(user_id=message.from_user.id, name=message.from_user.full_name)
+    # Botni qayta ishga tushirgan (avval bloklagan) foydalanuvchini faollashtirish
+    await db.set_user_active(message.from_user.id, True)
     
     # Admin va oddiy foydalanuvchilar uchun turli xabarlar
-    if message.from_user.id in ADMIN_IDS:
+    if bot_ctx.is_admin(message.from_user.id):
         await message.answer(f"""<b>Assalomu alaykum, Admin {message.from_user.get_mention()}! 👑
 
 Menga biror bir matn yozib yuboring va men sizga o'qib beraman 🎤
@@ -127,24 +303,17 @@ Ovozni o'zgartirish uchun /settings dan foydalaning.</b>""")
 # /settings buyrug'i
 @dp.message_handler(commands=['settings'])
 async def change_voice(message: types.Message):
-    try:
-        db.add_user(user_id=message.from_user.id, name=message.from_user.full_name, voice='women')
-    except Exception as e:
-        logging.error(f"Foydalanuvchi qo'shishda xatolik: {e}")
-    
-    markup = types.InlineKeyboardMarkup(row_width=2).add(
-        types.InlineKeyboardButton("🧔‍♂️ Erkak ovoz", callback_data="male"),
-        types.InlineKeyboardButton("👩‍🦰 Ayol ovoz", callback_data="women")
-    )
-    await message.answer("<b>🔊 Ovozni tanlang:</b>", reply_markup=markup)
+    user_cache.ensure_user(user_id=message.from_user.id, name=message.from_user.full_name)
+    await message.answer("<b>🔊 Ovozni tanlang:</b>", reply_markup=bot_ctx.voice_keyboard)
 
 # Inline tugmalar uchun
-@dp.callback_query_handler(lambda call: call.data in ['male', 'women'])
+@dp.callback_query_handler(lambda call: call.data in bot_ctx.voices)
 async def change_voice_callback(call: types.CallbackQuery):
     try:
-        db.update_user_voice(voice=call.data, user_id=call.from_user.id)
-        txt = "🧔‍♂️ Erkak ovoz sozlandi!" if call.data == 'male' else "👩‍🦰 Ayol ovoz sozlandi!"
-        await call.answer(text=txt, show_alert=True)
+        if not await user_cache.set_voice(user_id=call.from_user.id, name=call.from_user.full_name, voice=call.data):
+            await call.answer("❌ Xatolik yuz berdi", show_alert=True)
+            return
+        await call.answer(text=bot_ctx.voice_replies[call.data], show_alert=True)
         await call.message.delete()
     except Exception as e:
         logging.error(f"Ovoz o'zgartirishda xatolik: {e}")
@@ -154,17 +323,86 @@ async def change_voice_callback(call: types.CallbackQuery):
 @dp.message_handler(commands=['stat'], user_id=ADMIN_IDS)
 async def stat_handler(message: types.Message):
     try:
-        stat = db.stat()
-        male_count = db.execute("SELECT COUNT(*) FROM Users WHERE voice = 'male'", fetchone=True)
-        female_count = db.execute("SELECT COUNT(*) FROM Users WHERE voice = 'women'", fetchone=True)
+        # Hisoblagichlar jadvalidan o'qiladi - Users skanerlanmaydi
+        counts = await user_stats.counts()
+        
+        users = user_cache.summary()
+        cache = audio_cache.summary()
+        library = phrases.summary()
+        pool = http.summary()
+        queue = job_queue.summary()
+        coalesced = flights.summary()
+        cancelled = tracker.summary()
+        journaled = journal.summary()
+        routing = tts_router.summary()
+        transcoding = transcoder.summary()
+        throttled = throttling.summary()
+        # Yozilmagan hodisalar ham hisobga kirishi uchun avval buferni yozamiz
+        await usage_log.flush()
+        now = int(time.time())
+        usage_days = await db.usage_by_day(since=(now // 86400 - 6) * 86400)
+        latency = await usage_log.latency_percentiles(since=now - 86400)
+        usage_text = "\n".join(
+            f"• {time.strftime('%d.%m', time.gmtime(day * 86400))}: <code>{dau}</code> foydalanuvchi, "
+            f"<code>{requests}</code> so'rov, <code>{chars}</code> belgi, keshdan <code>{hits}</code>"
+            for day, dau, requests, chars, hits in usage_days
+        ) or "—"
+        stages_text = "\n".join(
+            f"• {stage}: <code>{count}</code> ta, p50 <code>{p50:.2f}</code> s, p95 <code>{p95:.2f}</code> s"
+            for stage, (count, p50, p95) in metrics.stage_summary().items()
+        ) or "—"
+        loop_lag = metrics.LOOP_LAG.labels().quantile(0.95)
+        providers_text = "\n".join(
+            f"• {name}: <code>{info['state']}</code>, "
+            f"<code>{(info['latency'] or 0):.2f}</code> s, xato <code>{info['error_rate']:.0%}</code>"
+            for name, info in routing['providers'].items()
+        )
         
         await message.answer(f"""📊 <b>Bot statistikasi:</b>
 
-👥 Jami foydalanuvchilar: <code>{stat[0]}</code>
-🧔‍♂️ Erkak ovoz: <code>{male_count[0] if male_count else 0}</code>
-👩‍🦰 Ayol ovoz: <code>{female_count[0] if female_count else 0}</code>
+👥 Jami foydalanuvchilar: <code>{counts['total']}</code>
+🧔‍♂️ Erkak ovoz: <code>{counts['male']}</code>
+👩‍🦰 Ayol ovoz: <code>{counts['women']}</code>
+🗂 Keshda: <code>{users['size']}</code>, yozilishi kutilmoqda: <code>{users['pending']}</code>
+
+💾 <b>Audio kesh:</b>
+✅ Topildi: <code>{cache['hits']}</code> (file_id: <code>{cache['file_id_hits']}</code>, xotira: <code>{cache['memory_hits']}</code>, disk: <code>{cache['disk_hits']}</code>)
+❌ Topilmadi: <code>{cache['misses']}</code>
+📈 Samaradorlik: <code>{cache['hit_ratio']:.1%}</code>
+📚 Iboralar: <code>{library['phrases']}</code> ta, topildi <code>{library['hits']}</code>
+🗑 Chiqarildi: <code>{cache['memory_evictions']}</code> xotira, <code>{cache['disk_evictions'] + cache['disk_expired']}</code> disk
+📦 Hajm: <code>{cache['memory_bytes'] // 1024}</code> KB xotira, <code>{cache['disk_bytes'] // 1024}</code> KB disk
+
+🌐 <b>HTTP pool:</b>
+🔌 Band: <code>{pool['in_use']}</code>/<code>{pool['limit']}</code>, bo'sh: <code>{pool['idle']}</code>
+♻️ Qayta ishlatilgan: <code>{pool['connections_reused']}</code>, yangi: <code>{pool['connections_created']}</code>
+📨 So'rovlar: <code>{pool['requests']}</code>, xatolar: <code>{pool['errors']}</code>
+
+⚙️ <b>Sintez navbati:</b>
+📥 Navbatda: <code>{queue['depth']}</code>, bajarilmoqda: <code>{queue['active']}</code>
+⏱ Kutish p50/p95: <code>{queue['wait_p50']:.2f}</code>/<code>{queue['wait_p95']:.2f}</code> s
+✅ Bajarildi: <code>{queue['completed']}</code>, 🚫 rad etildi: <code>{queue['shed']}</code>
+🚦 Cheklandi: <code>{throttled['throttled_user']}</code> foydalanuvchi, <code>{throttled['throttled_global']}</code> umumiy
+🔗 Birlashtirildi: <code>{coalesced['followers']}</code> (<code>{coalesced['coalesce_ratio']:.1%}</code>)
+⏭ Bekor qilindi: <code>{cancelled['superseded']}</code> yangi xabar, <code>{cancelled['deadline']}</code> muddat tugashi
+♻️ Jurnal: <code>{journaled['replayed']}</code> tiklandi, <code>{journaled['expired']}</code> eskirgan, <code>{stale_updates.stats['stale']}</code> eski xabar o'tkazildi
 
-🔧 Admin ID'lar: <code>{', '.join(map(str, ADMIN_IDS))}</code>""")
+🎙 <b>TTS provayderlar:</b>
+{providers_text}
+🔀 Hedge: <code>{routing['hedged']}</code>, failover: <code>{routing['failovers']}</code>
+🎚 Transkod: <code>{transcoding['transcoded']}</code> ta, tejaldi <code>{transcoding['saved_ratio']:.0%}</code>, xato <code>{transcoding['failed']}</code>
+
+⏱ <b>Bosqichlar:</b>
+{stages_text}
+🔁 Event loop kechikishi p95: <code>{loop_lag * 1000:.1f}</code> ms
+
+📅 <b>Foydalanish (UTC, 7 kun):</b>
+{usage_text}
+⏱ Javob vaqti (24 soat) p50/p95/p99: <code>{latency[0.5]}</code>/<code>{latency[0.95]}</code>/<code>{latency[0.99]}</code> ms
+
+📤 Faol broadcastlar: <code>{broadcaster.running}</code>
+
+🔧 Admin ID'lar: <code>{', '.join(map(str, sorted(ADMIN_IDS)))}</code>""")
     except Exception as e:
         logging.error(f"Statistika olishda xatolik: {e}")
         await message.answer("❌ Statistikani olishda xatolik")
@@ -177,32 +415,13 @@ async def broadcast(message: types.Message):
         return
     
     broadcast_text = message.text[6:]  # "/send " ni olib tashlash
-    users = db.select_all_users()
-    success_count = 0
-    failed_count = 0
-    
-    msg = await message.answer("📤 Xabar yuborilmoqda...")
     
-    for user in users:
-        try:
-            # HTML entities dan himoyalanish
-            safe_text = broadcast_text.replace('<', '&lt;').replace('>', '&gt;')
-            await bot.send_message(
-                chat_id=user[1],
-                text=safe_text,
-                parse_mode=None  # HTML parsing o'chirish
-            )
-            success_count += 1
-            await asyncio.sleep(0.05)  # Spam himoyasi
-        except Exception as e:
-            failed_count += 1
-            logging.error(f"Foydalanuvchi {user[1]}ga xabar yuborishda xatolik: {e}")
-    
-    await msg.edit_text(f"""✅ <b>Xabar yuborish yakunlandi!</b>
-
-📊 Muvaffaqiyatli: <code>{success_count}</code>
-❌ Muvaffaqiyatsiz: <code>{failed_count}</code>
-👥 Jami: <code>{len(users)}</code>""")
+    # Fon rejimida yuboriladi, progress xabari jonli yangilanadi
+    try:
+        await broadcaster.start(chat_id=message.chat.id, text=broadcast_text)
+    except Exception as e:
+        logging.error(f"Broadcastni boshlashda xatolik: {e}")
+        await message.answer("❌ Xabar yuborishni boshlashda xatolik")
 
 # Admin bo'lmagan foydalanuvchilar admin buyruqlarini ishlatganda
 @dp.message_handler(commands=['stat', 'send'])
@@ -213,10 +432,64 @@ async def admin_commands_non_admin(message: types.Message):
 def is_text_valid(text):
     if len(text.strip()) == 0:
         return False, "❌ Bo'sh matn"
-    if len(text) > 1000:
-        return False, "❌ Matn juda uzun (maksimal 1000 ta belgi)"
+    if len(text) > LONG_TEXT_MAX_CHARS:
+        return False, f"❌ Matn juda uzun (maksimal {LONG_TEXT_MAX_CHARS} ta belgi)"
     return True, ""
 
+# Matn uchun audio olish (avval keshdan, bo'lmasa TTS API orqali)
+# (audio, xatolik_matni, manba, keshlanadi) qaytaradi; audio - bytes yoki katta kliplar uchun vaqtinchalik
+# fayl, manba - "cache" yoki provayder nomi. Zaxira provayder (espeak, mock) klipi va uning file_id'si
+# keshlanmaydi - asosiy provayder tiklangach foydalanuvchilar yana asl ovozni oladi
+async def synthesize(voice, text):
+    audio = await audio_cache.get_audio(voice, text)
+    if audio is not None:
+        metrics.AUDIO_BYTES.labels("cache").observe(len(audio))
+        return audio, None, "cache", True
+    
+    # Provayderga bir vaqtdagi so'rovlar soni umumiy cheklangan
+    async with tts_slots:
+        with timed("tts"):
+            res = await tts_change(voice=voice, text=text)
+    if not res:
+        return None, "❌ Audio yaratishda xatolik yuz berdi", None, False
+    
+    source = res['provider'].name
+    cacheable = res['provider'].cacheable
+    raw = res['audio']
+    try:
+        audio = await transcoder.transcode(raw)
+    except TranscodeError as e:
+        # Asl audio yuboriladi, lekin keshga olinmaydi (kesh faqat transkod natijasini saqlaydi)
+        logging.error(f"Transkod xatoligi ({res['content_type']}): {e}")
+        if not isinstance(raw, bytes):
+            raw.seek(0)
+        return raw, None, source, cacheable
+    if audio is not raw and not isinstance(raw, bytes):
+        raw.close()
+    
+    # Juda katta (diskka tushgan) kliplar keshga olinmaydi, faqat file_id saqlanadi
+    if cacheable and isinstance(audio, bytes):
+        await audio_cache.put_audio(voice, text, audio)
+    return audio, None, source, cacheable
+
+# Audio to'g'ridan-to'g'ri Telegram'ga uzatiladi (oraliq fayl yozilmaydi).
+# Yuklash ham so'rov muddati ichida: qolgan vaqt HTTP timeout sifatida beriladi
+@timed("send_voice")
+async def send_audio(message, audio, caption):
+    stream = io.BytesIO(audio) if isinstance(audio, bytes) else audio
+    try:
+        if deadline.expired():
+            raise DeadlineExceeded("so'rov muddati tugadi")
+        with bot.request_timeout(deadline.remaining()):
+            return await bot.send_voice(
+                chat_id=message.from_user.id,
+                voice=types.InputFile(stream, filename="voice.ogg"),
+                caption=caption,
+                reply_to_message_id=message.message_id
+            )
+    finally:
+        stream.close()
+
 # Oddiy matn yuborilganda
 @dp.message_handler(content_types=['text'])
 async def handle_text(message: types.Message):
@@ -225,83 +498,319 @@ async def handle_text(message: types.Message):
     if not is_valid:
         await message.reply(error_msg)
         return
+    # Avvalgi ishga tushishda jurnalga yozilgan xabar qayta kelgan - u jurnaldan tiklanadi
+    if journal.is_pending(message):
+        return
+    started = time.monotonic()
     
-    # Foydalanuvchi ma'lumotlarini olish
-    try:
-        user_data = db.is_user(user_id=message.from_user.id)
-        if user_data and len(user_data) > 0:
-            voice = user_data[0][3]  # voice ustuni
-            logging.info(f"🎤 Foydalanuvchi ovozi: {voice}")
-        else:
-            voice = 'women'
-            # Yangi foydalanuvchini qo'shish
-            db.add_user(user_id=message.from_user.id, name=message.from_user.full_name, voice='women')
-            logging.info(f"➕ Yangi foydalanuvchi qo'shildi: {message.from_user.id}")
-    except Exception as e:
-        logging.error(f"Foydalanuvchi ma'lumotlarini olishda xatolik: {e}")
-        voice = 'women'
+    # Foydalanuvchi ovozini olish (keshdan, SQL so'rovsiz)
+    with timed("user_lookup"):
+        voice = await user_cache.resolve(user_id=message.from_user.id, name=message.from_user.full_name)
+    
+    # Bot nomi startupda olingan; bu yerda Telegram'ga so'rov yuborilmaydi
+    await bot_ctx.ensure()
+    
+    long_text = len(message.text) > TTS_CHUNK_CHARS
+    caption = bot_ctx.caption(message.text)
+    
+    # Oldindan yuklangan ibora - indeksdan (bazaga ham, keshga ham murojaat qilmasdan)
+    file_id = phrases.get(voice, message.text)
+    if file_id and await send_file_id(message, voice, file_id, caption):
+        log_usage(message, voice, started, cache_hit=True, provider="phrase")
+        return
+    
+    # Avval yuklangan audio bo'lsa - file_id orqali qayta yuborish (HTTP so'rovsiz, navbatsiz)
+    file_id = None if long_text else await audio_cache.get_file_id(voice, message.text)
+    if file_id and await send_file_id(message, voice, file_id, caption):
+        log_usage(message, voice, started, cache_hit=True, provider="file_id")
+        return
     
     msg = await message.reply("🔄 Audio tayyorlanmoqda...")
+    await enqueue_text(message, msg, voice, started)
+
+# Sintez ishini navbatga qo'yish: yangi xabar ham, jurnaldan tiklangan ish (job_id) ham shu yo'ldan o'tadi.
+# Tiklangan ish navbat to'lganda rad etilmaydi - QueueFull chaqiruvchiga uzatiladi
+async def enqueue_text(message, msg, voice, started, job_id=None):
+    replayed = job_id is not None
+    request = tracker.create(message.from_user.id, started)
+    long_text = len(message.text) > TTS_CHUNK_CHARS
+    caption = bot_ctx.caption(message.text)
     
+    if long_text:
+        job = lambda: handle_long_text(message, msg, voice, started, request)
+    else:
+        # Bir xil so'rovlarni birlashtirish navbat ishchisida (process_text) - handler kutib qolmaydi
+        job = lambda: process_text(message, msg, voice, caption, started, request)
+    
+    # Sintez ishchilar havzasida, o'z vazifasida va muddat bilan bajariladi; ish tugaguncha jurnalda
+    # turadi. Navbat to'lgan bo'lsa yuk tashlab yuboriladi
     try:
-        voice_model = "uz-UZ-SardorNeural" if voice == 'male' else "uz-UZ-MadinaNeural"
-        res = await tts_change(mod=voice_model, text=message.text)
-        
-        if not res:
-            await msg.edit_text("❌ Audio yaratishda xatolik yuz berdi")
+        if not replayed:
+            job_id = await journal.add("long" if long_text else "short", message, msg, voice)
+        job_queue.submit(message.from_user.id, lambda: journal.run(job_id, lambda: tracker.run(request, job)))
+        tracker.activate(request)
+    except QueueFull as e:
+        if isinstance(e, QueueClosed):
+            # Bot to'xtatilmoqda - ish jurnalda qoladi va qayta ishga tushgach bajariladi
+            await msg.edit_text(RESTART_MESSAGE)
+            return
+        if replayed:
+            raise
+        await journal.remove(job_id)
+        log_usage(message, voice, started, outcome="rejected")
+        if isinstance(e, UserQueueFull):
+            await msg.edit_text("⏳ Avvalgi so'rovlaringiz hali bajarilmoqda, biroz kutib qayta yuboring")
+        else:
+            await msg.edit_text("😔 Hozir bot juda band, birozdan so'ng qayta urinib ko'ring")
+
+# Jurnal yozuvidan foydalanuvchi xabari va "tayyorlanmoqda" xabarini tiklash
+def journal_messages(entry):
+    user = {'id': entry['user_id'], 'is_bot': False, 'first_name': entry['name'] or str(entry['user_id'])}
+    chat = {'id': entry['user_id'], 'type': 'private'}
+    message = types.Message.to_object({
+        'message_id': entry['message_id'], 'date': entry['created_at'], 'chat': chat, 'from': user,
+        'text': entry['text'],
+    })
+    msg = types.Message.to_object({'message_id': entry['placeholder_id'], 'date': entry['created_at'], 'chat': chat})
+    return message, msg
+
+# Avvalgi ishga tushishdan qolgan ishni qayta navbatga qo'yish (muddat yangidan hisoblanadi)
+async def replay_job(entry):
+    message, msg = journal_messages(entry)
+    while True:
+        try:
+            await enqueue_text(message, msg, entry['voice'], time.monotonic(), job_id=entry['id'])
             return
+        except QueueFull:
+            await asyncio.sleep(1.0)
+
+# Juda eski ish tiklanmaydi - foydalanuvchidan qayta yuborish so'raladi
+async def expire_job(entry):
+    _, msg = journal_messages(entry)
+    try:
+        await msg.edit_text("⌛ Bot qayta ishga tushdi, matnni qaytadan yuboring")
+    except Exception as e:
+        logging.error(f"Eskirgan ish xabarini yangilashda xatolik: {e}")
+
+# So'rov natijasini statistika jurnaliga yozish (faqat xotiradagi buferga).
+# Log yozuvi tanlab olinadi (SAMPLED); LOG_FORMAT=json da maydonlar alohida chiqadi
+def log_usage(message, voice, started, cache_hit=False, provider=None, outcome="ok"):
+    latency = time.monotonic() - started
+    usage_log.record(
+        user_id=message.from_user.id,
+        chars=len(message.text),
+        voice=voice,
+        latency=latency,
+        cache_hit=cache_hit,
+        provider=provider,
+        outcome=outcome,
+        text=message.text,
+    )
+    logging.info("📨 So'rov: %s (%s)", outcome, provider, extra={
+        **SAMPLED, 'user_id': message.from_user.id, 'chars': len(message.text), 'voice': voice,
+        'latency_ms': int(latency * 1000), 'cache_hit': cache_hit,
+    })
+
+# Telegram file_id'ni rad etdi - u endi yaroqsiz, qayta urinishning ma'nosi yo'q
+_STALE_FILE_ID = (
+    exceptions.WrongFileIdentifier,
+    exceptions.WrongRemoteFileIdSpecified,
+    exceptions.TypeOfFileMismatch,
+)
+
+# Keshdagi file_id bilan yuborish. Telegram file_id'ni rad etsa u unutiladi; boshqa xatolarda
+# (tarmoq, flood-wait) file_id saqlanib qoladi - chaqiruvchi oddiy sintez yo'liga o'tadi
+@timed("send_file_id")
+async def send_file_id(message, voice, file_id, caption):
+    try:
+        await bot.send_voice(
+            chat_id=message.from_user.id,
+            voice=file_id,
+            caption=caption,
+            reply_to_message_id=message.message_id
+        )
+        return True
+    except _STALE_FILE_ID as e:
+        logging.error(f"Keshdagi file_id yaroqsiz: {e}")
+        phrases.forget(voice, message.text)
+        await audio_cache.forget_file_id(voice, message.text)
+        return False
+    except Exception as e:
+        logging.error(f"Keshdagi file_id bilan yuborishda xatolik: {e}")
+        return False
+
+# Qisqa matnni ovozlashtirish (navbat ishchisida bajariladi).
+# Bir xil (ovoz, matn) so'rovlaridan bittasi yetakchi bo'lib sintez qiladi, qolganlari uning file_id'sini
+# oladi; yetakchi xato bersa, kutganlardan faqat bittasi yetakchilikni oladi. Izdoshlar kutayotganda
+# ishchi o'rnini bo'shatadi - mashhur matn navbatdagi boshqa foydalanuvchilarning ishini to'smaydi.
+@timed("pipeline")
+async def process_text(message, msg, voice, caption, started, request):
+    key = make_key(voice, message.text)
+    leader = False
+    file_id = None
+    source, outcome = None, "error"
+    try:
+        # Navbatda kutayotganda bekor qilingan so'rov provayderga yuborilmaydi
+        request.raise_if_cancelled()
+        while not (leader := flights.begin(key)):
+            job_queue.release_slot()
+            coalesced = await flights.wait(key, timeout=request.remaining(TTS_FLIGHT_TIMEOUT))
+            request.raise_if_cancelled()
+            if coalesced and await send_file_id(message, voice, coalesced, caption):
+                source, outcome = "coalesced", "ok"
+                await msg.delete()
+                return
+        # Yetakchilik o'tdi - sintez uchun ishchi o'rni qaytarib olinadi
+        await job_queue.acquire_slot()
         
-        file_path = f"audio_{message.message_id}_{message.from_user.id}.ogg"
+        # Navbatda kutgan vaqtda shu matn boshqa so'rov bilan yuborilib bo'lgan bo'lishi mumkin
+        cached = await audio_cache.get_file_id(voice, message.text)
+        if cached and await send_file_id(message, voice, cached, caption):
+            file_id, source, outcome = cached, "file_id", "ok"
+            await msg.delete()
+            return
         
-        # Agar to'g'ridan-to'g'ri audio fayl kelgan bo'lsa
-        if 'file_content' in res:
-            try:
-                with open(file_path, 'wb') as f:
-                    f.write(res['file_content'])
-                
-                with open(file_path, "rb") as voice_file:
-                    bot_info = await bot.get_me()
-                    await bot.send_voice(
-                        chat_id=message.from_user.id,
-                        voice=voice_file,
-                        caption=f"🎵 <i>{message.text}</i>\n\n🤖 @{bot_info.username}",
-                        reply_to_message_id=message.message_id
-                    )
-                await msg.delete()
-            except Exception as e:
-                logging.error(f"To'g'ridan-to'g'ri audio yuborishda xatolik: {e}")
-                await msg.edit_text("❌ Audio yuborishda xatolik")
-            finally:
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-                    
-        # Agar URL kelgan bo'lsa (JSON javob)
-        elif 'file' in res and isinstance(res['file'], str):
-            if await download_file(res['file'], file_path) == 'save':
-                try:
-                    with open(file_path, "rb") as voice_file:
-                        bot_info = await bot.get_me()
-                        await bot.send_voice(
-                            chat_id=message.from_user.id,
-                            voice=voice_file,
-                            caption=f"🎵 <i>{message.text}</i>\n\n🤖 @{bot_info.username}",
-                            reply_to_message_id=message.message_id
-                        )
+        # Boshqa ishchi shu matnni tayyorlayotgan bo'lsa - tugashini kutib, uning file_id'sini ishlatamiz
+        if not await flights.claim(key, TTS_FLIGHT_TIMEOUT):
+            job_queue.release_slot()
+            if await flights.wait_remote(key, timeout=request.remaining(TTS_FLIGHT_TIMEOUT)):
+                remote = await audio_cache.get_file_id(voice, message.text)
+                if remote and await send_file_id(message, voice, remote, caption):
+                    file_id, source, outcome = remote, "coalesced", "ok"
                     await msg.delete()
-                except Exception as e:
-                    logging.error(f"URL orqali audio yuborishda xatolik: {e}")
-                    await msg.edit_text("❌ Audio yuborishda xatolik")
-                finally:
-                    if os.path.exists(file_path):
-                        os.remove(file_path)
-            else:
-                await msg.edit_text("❌ Audio faylini yuklab olishda xatolik")
+                    return
+            await job_queue.acquire_slot()
+            await flights.claim(key, TTS_FLIGHT_TIMEOUT)
+        
+        audio, error_msg, source, cacheable = await synthesize(voice, message.text)
+        if audio is None:
+            await msg.edit_text(error_msg)
+            return
+        
+        try:
+            sent = await send_audio(message, audio, caption)
+            outcome = "ok"
+            # Zaxira ovozning file_id'si saqlanmaydi va kutganlarga ham berilmaydi
+            if sent.voice and cacheable:
+                file_id = sent.voice.file_id
+                await audio_cache.put_file_id(voice, message.text, file_id)
+            await msg.delete()
+        except Exception as e:
+            if request.interrupted is not None:
+                raise
+            logging.error(f"Audio yuborishda xatolik: {e}")
+            await msg.edit_text("❌ Audio yuborishda xatolik")
+            
+    except asyncio.CancelledError:
+        # Yangi xabar yoki muddat tugashi; sababsiz bekor qilish - ishchi to'xtatilmoqda
+        if request.reason is not None:
+            outcome = request.reason
+            await msg.edit_text(CANCEL_MESSAGES[outcome])
+        raise
+    except Exception as e:
+        if request.interrupted is not None:
+            outcome = request.reason
+            await msg.edit_text(CANCEL_MESSAGES[outcome])
         else:
-            await msg.edit_text("❌ Noma'lum javob formati")
+            logging.error(f"Handle text da umumiy xatolik: {e}")
+            await msg.edit_text("❌ Xatolik yuz berdi, qaytadan urinib ko'ring")
+    finally:
+        if leader:
+            flights.finish(key, file_id)
+            await flights.release(key)
+        log_usage(message, voice, started, cache_hit=source in ("cache", "file_id", "coalesced"), provider=source,
+                  outcome=outcome)
+
+# Uzun matn: bo'laklarga ajratib, parallel sintez qilib, tartib bilan yuborish.
+# Birinchi bo'lak tayyor bo'lishi bilan yuboriladi, qolganlari VOICE_PART_MAX_BYTES
+# hajmgacha birlashtirilib keyingi qismlarda yuboriladi.
+async def handle_long_text(message, msg, voice, started, request):
+    chunks = split_text(message.text, TTS_CHUNK_CHARS)
+    
+    semaphore = asyncio.Semaphore(TTS_CHUNK_CONCURRENCY)
+    
+    async def render(chunk):
+        async with semaphore:
+            audio, error_msg, source, _ = await synthesize(voice, chunk)
+        if audio is not None and not isinstance(audio, bytes):
+            # Birlashtirish uchun xotiraga o'qiymiz (bo'lak hajmi cheklangan)
+            with audio:
+                audio = audio.read()
+        sources.add(source)
+        return audio, error_msg
+    
+    sources = set()
+    
+    tasks = []
+    parts_sent = 0
+    outcome = "error"
+    
+    async def flush(part):
+        nonlocal parts_sent
+        try:
+            # Bo'laklar bitta OGG oqimiga qayta kodlashsiz birlashtiriladi
+            clips = [await transcoder.concat(part)]
+        except TranscodeError as e:
+            # Alohida oqimlarni baytlab qo'shib bo'lmaydi - har bir bo'lak alohida qism bo'ladi
+            logging.error(f"Bo'laklarni birlashtirishda xatolik: {e}")
+            clips = part
+        for audio in clips:
+            parts_sent += 1
+            await send_audio(message, audio, bot_ctx.caption(f"{parts_sent}-qism"))
+    
+    try:
+        request.raise_if_cancelled()
+        await msg.edit_text(f"🔄 Audio tayyorlanmoqda... (<code>{len(chunks)}</code> bo'lak)")
+        tasks = [asyncio.create_task(render(chunk)) for chunk in chunks]
+        part, part_bytes = [], 0
+        for index, task in enumerate(tasks):
+            audio, error_msg = await task
+            if audio is None:
+                raise RuntimeError(error_msg)
+            
+            # Transkod qilinmagan (OGG bo'lmagan) bo'lak boshqalar bilan birlashtirilmaydi
+            if not audio.startswith(b"OggS"):
+                if part:
+                    await flush(part)
+                    part, part_bytes = [], 0
+                await flush([audio])
+                continue
             
+            if part and part_bytes + len(audio) > VOICE_PART_MAX_BYTES:
+                await flush(part)
+                part, part_bytes = [], 0
+            part.append(audio)
+            part_bytes += len(audio)
+            
+            # Birinchi bo'lak kutmasdan alohida yuboriladi
+            if index == 0:
+                await flush(part)
+                part, part_bytes = [], 0
+        
+        if part:
+            await flush(part)
+        outcome = "ok"
+        await msg.delete()
+    except asyncio.CancelledError:
+        if request.reason is not None:
+            outcome = request.reason
+            await msg.edit_text(f"{CANCEL_MESSAGES[outcome]} (<code>{parts_sent}</code> qism yuborildi)")
+        raise
     except Exception as e:
-        logging.error(f"Handle text da umumiy xatolik: {e}")
-        await msg.edit_text("❌ Xatolik yuz berdi, qaytadan urinib ko'ring")
+        if request.interrupted is not None:
+            outcome = request.reason
+            await msg.edit_text(f"{CANCEL_MESSAGES[outcome]} (<code>{parts_sent}</code> qism yuborildi)")
+        else:
+            logging.error(f"Uzun matnni ovozlashtirishda xatolik: {e}")
+            await msg.edit_text(f"❌ Audio yaratishda xatolik (<code>{parts_sent}</code> qism yuborildi)")
+    finally:
+        # Qolgan bo'laklar sintezi ham to'xtatiladi
+        for task in tasks:
+            task.cancel()
+        providers = ",".join(sorted(source for source in sources if source not in (None, "cache")))
+        cache_hit = not providers and "cache" in sources
+        log_usage(message, voice, started, cache_hit=cache_hit, provider=providers or ("cache" if cache_hit else None),
+                  outcome=outcome)
 
 # Bot komandalarini sozlash (adminlar uchun)
 async def set_admin_commands():
@@ -330,13 +839,113 @@ async def set_user_commands():
     await bot.set_my_commands(user_commands, scope=types.BotCommandScopeDefault())
     logging.info("✅ Foydalanuvchi buyruqlari sozlandi")
 
+# Metrikalar: har bir ishchi o'z portida (METRICS_PORT + WORKER_INDEX)
+def collect_metrics():
+    metrics.QUEUE_DEPTH.set(job_queue.depth)
+    metrics.QUEUE_ACTIVE.set(job_queue.active)
+    metrics.export_summary("audio_cache", audio_cache.summary())
+    metrics.export_summary("user_cache", user_cache.summary())
+    metrics.export_summary("http", http.summary())
+    metrics.export_summary("coalesce", flights.summary())
+    metrics.export_summary("requests", tracker.summary())
+    metrics.export_summary("job_journal", journal.summary())
+    metrics.export_summary("stale_updates", stale_updates.summary())
+    metrics.export_summary("router", tts_router.summary())
+    metrics.export_summary("transcoder", transcoder.summary())
+    metrics.export_summary("usage_log", usage_log.summary())
+    metrics.export_summary("user_stats", user_stats.stats)
+    metrics.export_summary("throttling", throttling.summary())
+    metrics.export_summary("shared_state", shared_state.summary())
+    metrics.export_summary("phrases", phrases.summary())
+    metrics.export_summary("logging", log_pipeline.summary())
+
+metrics.REGISTRY.add_collector(collect_metrics)
+metrics_server = metrics.MetricsServer(host=os.getenv("METRICS_HOST", "127.0.0.1"))
+
+async def start_metrics():
+    if not METRICS_ENABLED:
+        return
+    metrics_server.port = METRICS_PORT + int(os.getenv("WORKER_INDEX", "0"))
+    try:
+        await metrics_server.start()
+    except OSError as e:
+        logging.error(f"Metrika serverini ishga tushirishda xatolik: {e}")
+
+# Webhook rejimida har bir ishchi jarayon WORKER_INDEX oladi; 0 - asosiy ishchi
+def is_primary_worker():
+    return os.getenv("WORKER_INDEX", "0") == "0"
+
 # Bot ishga tushganda
 async def on_startup(dp):
+    try:
+        await db.connect()
+        await db.create_table_users()
+        await db.create_table_broadcasts()
+        await db.create_table_usage()
+        await db.create_table_user_stats()
+        await db.create_table_phrases()
+        await user_cache.warm()
+        user_cache.start()
+        logging.info("📊 Ma'lumotlar bazasi tayyorlandi")
+    except Exception as e:
+        logging.error(f"Ma'lumotlar bazasini yaratishda xatolik: {e}")
+    
+    try:
+        await journal.start()
+    except Exception as e:
+        logging.error(f"Ishlar jurnalini ochishda xatolik: {e}")
+    
+    try:
+        # Faqat sxema o'zgarishlari - ma'lumot ko'chirish quyida, fonda
+        await migrator.run(background=False)
+    except Exception as e:
+        # Qo'llanmagan migratsiya keyingi ishga tushishda qayta bajariladi
+        logging.error(f"Migratsiyada xatolik: {e}")
+    usage_log.start()
+    
+    try:
+        await shared_state.start()
+    except Exception as e:
+        logging.error(f"Umumiy holatga ulanishda xatolik: {e}")
+    
+    try:
+        await bot_ctx.refresh()
+    except Exception as e:
+        # Birinchi xabarda bot_ctx.ensure() qayta urinadi
+        logging.error(f"Bot ma'lumotlarini olishda xatolik: {e}")
+    
+    audio_cache.load()
+    phrases.load()
+    phrases.start()
+    await http.start()
+    job_queue.start()
+    await start_metrics()
+    
+    logging.info("🚀 Bot ishga tushdi!")
+    
+    # Umumiy holat bilan to'xtab qolgan broadcastlarni istalgan ishchi lease orqali davom ettiradi
+    if shared_state.shared:
+        await broadcaster.resume()
+        broadcaster.watch()
+    
+    # Bir martalik ishlar faqat asosiy ishchida (webhook rejimida bir nechta jarayon bo'lishi mumkin)
+    if not is_primary_worker():
+        return
+    
+    if not shared_state.shared:
+        await broadcaster.resume()
+    user_stats.start()
+    # Katta jadvallarni ko'chirish/to'ldirish bot so'rovlarni qabul qilayotganda bajariladi
+    migrator.start()
+    
+    # Avvalgi ishga tushishdan qolgan ishlar fonda, bir tekis tezlikda tiklanadi
+    journal.replay(replay_job, expire_job)
+    sweep_temp_files()
+    
     await set_user_commands()  # Avval oddiy foydalanuvchilar uchun
     await set_admin_commands()  # Keyin adminlar uchun
     
-    logging.info("🚀 Bot ishga tushdi!")
-    logging.info(f"👑 Adminlar: {ADMIN_IDS}")
+    logging.info(f"👑 Adminlar: {sorted(ADMIN_IDS)}")
     
     # Adminlarga bot ishga tushgani haqida xabar
     for admin_id in ADMIN_IDS:
@@ -345,16 +954,54 @@ async def on_startup(dp):
         except Exception as e:
             logging.error(f"Admin {admin_id}ga xabar yuborishda xatolik: {e}")
 
+# Majburan to'xtatilgan jarayondan qolgan vaqtinchalik fayllar (faqat asosiy ishchida)
+def sweep_temp_files(max_age=300.0):
+    removed = transcoder.sweep(max_age)
+    # Eski versiyadagi audio_*.ogg fayllari va yozilayotganda uzilgan ibora indeksi
+    for path in glob.glob("audio_*.ogg") + glob.glob(f"{phrases.path}.tmp"):
+        try:
+            if time.time() - os.path.getmtime(path) > max_age:
+                os.remove(path)
+                removed += 1
+        except OSError:
+            continue
+    if removed:
+        logging.info(f"🧹 Vaqtinchalik fayllar tozalandi: {removed} ta")
+
 # Bot to'xtaganda
 async def on_shutdown(dp):
+    logging.info("🛑 Bot to'xtatilmoqda...")
+    
+    # Yangi yangilanishlar olinmaydi; ishlanayotganlari ishni navbatga qo'yib bo'lgach navbatdagi ishlar
+    # va joriy broadcast sahifasi SHUTDOWN_DRAIN_SECONDS ichida tugatiladi. Jurnaldan tiklash faqat
+    # shu muddatda ulgurmagan ishlar uchun (zaxira yo'l)
+    dp.stop_polling()
+    await inflight_updates.drain(SHUTDOWN_DRAIN_SECONDS)
+    await asyncio.gather(
+        job_queue.drain(SHUTDOWN_DRAIN_SECONDS),
+        broadcaster.stop(SHUTDOWN_DRAIN_SECONDS),
+    )
+    await job_queue.stop()
+    await journal.close()
     logging.info("🛑 Bot to'xtatildi!")
     
     # Adminlarga bot to'xtagani haqida xabar
-    for admin_id in ADMIN_IDS:
-        try:
-            await bot.send_message(admin_id, "🛑 <b>Bot to'xtatildi!</b>")
-        except Exception as e:
-            logging.error(f"Admin {admin_id}ga xabar yuborishda xatolik: {e}")
+    if is_primary_worker():
+        for admin_id in ADMIN_IDS:
+            try:
+                await bot.send_message(admin_id, "🛑 <b>Bot to'xtatildi!</b>")
+            except Exception as e:
+                logging.error(f"Admin {admin_id}ga xabar yuborishda xatolik: {e}")
+    
+    await migrator.stop()
+    await metrics_server.stop()
+    await http.close()
+    await user_cache.stop()
+    await phrases.stop()
+    await user_stats.stop()
+    await usage_log.stop()
+    await shared_state.close()
+    await db.close()
 
 if __name__ == '__main__':
     # Admin ID'larini tekshirish
@@ -362,17 +1009,28 @@ if __name__ == '__main__':
         logging.warning("⚠️ ADMIN_IDS bo'sh! .env faylida ADMIN_IDS ni to'g'ri sozlang")
         logging.warning("⚠️ Misol: ADMIN_IDS=123456789,987654321")
     else:
-        logging.info(f"👑 Adminlar ro'yxati: {ADMIN_IDS}")
-    
-    try:
-        db.create_table_users()
-        logging.info("📊 Ma'lumotlar bazasi tayyorlandi")
-    except Exception as e:
-        logging.error(f"Ma'lumotlar bazasini yaratishda xatolik: {e}")
+        logging.info(f"👑 Adminlar ro'yxati: {sorted(ADMIN_IDS)}")
     
-    executor.start_polling(
-        dp, 
-        skip_updates=True, 
-        on_startup=on_startup,
-        on_shutdown=on_shutdown
-    )
\ No newline at end of file
+    if BOT_MODE == "webhook":
+        start_webhook(
+            dp,
+            url=f"{WEBHOOK_HOST.rstrip('/')}{WEBHOOK_PATH}",
+            path=WEBHOOK_PATH,
+            secret=WEBHOOK_SECRET,
+            host=WEBAPP_HOST,
+            port=WEBAPP_PORT,
+            workers=WEBHOOK_WORKERS,
+            drain_timeout=WEBHOOK_DRAIN_SECONDS,
+            on_startup=on_startup,
+            on_shutdown=on_shutdown,
+            shared_state=shared_state.shared,
+        )
+    else:
+        # SIGTERM (systemd, docker stop) ham Ctrl+C kabi on_shutdown orqali to'xtatadi
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        executor.start_polling(
+            dp, 
+            skip_updates=False, 
+            on_startup=on_startup,
+            on_shutdown=on_shutdown
+        )
\ No newline at end of file
@@ -0,0 +1,265 @@
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+
+def normalize_text(text: str) -> str:
+    """Normalize text so that trivially different copies share one cache key"""
+    text = unicodedata.normalize("NFC", text)
+    return " ".join(text.split())
+
+
+def make_key(voice_model: str, text: str, namespace: str = "") -> str:
+    """Build content-addressed cache key from (namespace, voice model, normalized text)"""
+    raw = f"{namespace}\x00{voice_model}\x00{normalize_text(text)}".encode("utf-8")
+    return hashlib.sha256(raw).hexdigest()
+
+
+class AudioCache:
+    """Two-tier synthesized audio cache with Telegram file_id memo.
+
+    - file_id: Telegram'ga allaqachon yuklangan audio (qayta yuklash shart emas)
+    - memory: LRU bo'yicha chegaralangan "issiq" qatlam
+    - disk: hajm va TTL bo'yicha chegaralangan katta qatlam
+
+    ``state`` umumiy bo'lsa (bir nechta ishchi), file_id'lar u yerda ham saqlanadi: bir ishchi
+    yuklagan audio boshqalarida ham qayta yuklanmaydi.
+    """
+
+    def __init__(self, cache_dir="audio_cache", memory_max_bytes=32 * 1024 * 1024,
+                 disk_max_bytes=512 * 1024 * 1024, disk_ttl=7 * 24 * 3600, file_id_max_items=100_000,
+                 namespace="", state=None):
+        self.cache_dir = cache_dir
+        self.state = state if state is not None and state.shared else None
+        # Audio formati (masalan, "opus-32k") - format o'zgarsa eski yozuvlar ishlatilmaydi
+        self.namespace = namespace
+        self.memory_max_bytes = memory_max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        self.disk_ttl = disk_ttl
+        self.file_id_max_items = file_id_max_items
+
+        self._memory = OrderedDict()  # key -> bytes
+        self._memory_bytes = 0
+        self._file_ids = OrderedDict()  # key -> file_id
+        self._disk = OrderedDict()  # key -> (size, mtime), oxirgi murojaat bo'yicha (LRU)
+        self._disk_written = OrderedDict()  # key -> mtime, yozilgan vaqt bo'yicha (TTL uchun)
+        self._disk_bytes = 0
+
+        self.stats = {
+            'file_id_hits': 0,
+            'shared_file_id_hits': 0,
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'memory_evictions': 0,
+            'disk_evictions': 0,
+            'disk_expired': 0,
+        }
+
+    # --- Ishga tushirish ---
+
+    def load(self):
+        """Scan disk tier and rebuild its index (call once at startup)"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        entries = []
+        now = time.time()
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(path)
+                # Yozish paytida to'xtatilgan jarayondan qolgan .tmp (yangilari boshqa ishchiniki bo'lishi mumkin)
+                if name.endswith(".tmp") and now - st.st_mtime > 300:
+                    os.remove(path)
+                    continue
+            except OSError:
+                continue
+            if not name.endswith(".audio"):
+                continue
+            entries.append((st.st_mtime, name[:-len(".audio")], st.st_size))
+
+        entries.sort()
+        self._disk.clear()
+        self._disk_written.clear()
+        self._disk_bytes = 0
+        for mtime, key, size in entries:
+            self._disk[key] = (size, mtime)
+            self._disk_written[key] = mtime
+            self._disk_bytes += size
+        self._evict_disk()
+        logging.info(f"💾 Audio kesh yuklandi: {len(self._disk)} ta fayl, {self._disk_bytes} bayt")
+
+    # --- file_id qatlami ---
+
+    async def get_file_id(self, voice_model: str, text: str):
+        key = make_key(voice_model, text, self.namespace)
+        file_id = self._file_ids.get(key)
+        if file_id is not None:
+            self._file_ids.move_to_end(key)
+            self.stats['file_id_hits'] += 1
+        elif self.state is not None:
+            file_id = await self.state.get(f"fid:{key}")
+            if file_id is not None:
+                self._remember(key, file_id)
+                self.stats['file_id_hits'] += 1
+                self.stats['shared_file_id_hits'] += 1
+        return file_id
+
+    async def put_file_id(self, voice_model: str, text: str, file_id: str):
+        key = make_key(voice_model, text, self.namespace)
+        self._remember(key, file_id)
+        if self.state is not None:
+            await self.state.set(f"fid:{key}", file_id, ttl=self.disk_ttl)
+
+    async def forget_file_id(self, voice_model: str, text: str):
+        """Drop a file_id Telegram no longer accepts"""
+        key = make_key(voice_model, text, self.namespace)
+        file_id = self._file_ids.pop(key, None)
+        if self.state is not None and file_id is not None:
+            await self.state.delete(f"fid:{key}", file_id)
+
+    def _remember(self, key, file_id):
+        self._file_ids[key] = file_id
+        self._file_ids.move_to_end(key)
+        while len(self._file_ids) > self.file_id_max_items:
+            self._file_ids.popitem(last=False)
+
+    # --- Audio qatlamlari ---
+
+    async def get_audio(self, voice_model: str, text: str):
+        key = make_key(voice_model, text, self.namespace)
+
+        data = self._memory.get(key)
+        if data is not None:
+            self._memory.move_to_end(key)
+            self.stats['memory_hits'] += 1
+            return data
+
+        entry = self._disk.get(key)
+        if entry is not None:
+            size, mtime = entry
+            if time.time() - mtime > self.disk_ttl:
+                self._drop_disk(key)
+                self.stats['disk_expired'] += 1
+            else:
+                data = await asyncio.get_running_loop().run_in_executor(None, self._read, key)
+                if data is not None:
+                    # O'qish paytida boshqa vazifa kalitni chiqarib yuborgan bo'lishi mumkin
+                    if key in self._disk:
+                        self._disk.move_to_end(key)
+                    self.stats['disk_hits'] += 1
+                    self._put_memory(key, data)
+                    return data
+                self._drop_disk(key)
+
+        self.stats['misses'] += 1
+        return None
+
+    async def put_audio(self, voice_model: str, text: str, data: bytes):
+        if not data:
+            return
+        key = make_key(voice_model, text, self.namespace)
+        self._put_memory(key, data)
+
+        if len(data) > self.disk_max_bytes:
+            return
+        ok = await asyncio.get_running_loop().run_in_executor(None, self._write, key, data)
+        if ok:
+            # Indeks yozuvdan keyin yangilanadi: shu kalit parallel yozilgan bo'lsa, eski hajm ayiriladi
+            old = self._disk.pop(key, None)
+            if old is not None:
+                self._disk_bytes -= old[0]
+            mtime = time.time()
+            self._disk[key] = (len(data), mtime)
+            self._disk_written.pop(key, None)
+            self._disk_written[key] = mtime
+            self._disk_bytes += len(data)
+            self._evict_disk()
+
+    def _put_memory(self, key, data):
+        if len(data) > self.memory_max_bytes:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= len(old)
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.memory_max_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+            self.stats['memory_evictions'] += 1
+
+    def _evict_disk(self):
+        now = time.time()
+        # Avval muddati o'tganlarni (yozilish tartibida), keyin eng kam ishlatilganlarini o'chirish
+        while self._disk_written:
+            key, mtime = next(iter(self._disk_written.items()))
+            if now - mtime <= self.disk_ttl:
+                break
+            self._drop_disk(key)
+            self.stats['disk_expired'] += 1
+        while self._disk_bytes > self.disk_max_bytes and self._disk:
+            key = next(iter(self._disk))
+            self._drop_disk(key)
+            self.stats['disk_evictions'] += 1
+
+    def _drop_disk(self, key):
+        entry = self._disk.pop(key, None)
+        if entry is None:
+            return
+        self._disk_written.pop(key, None)
+        self._disk_bytes -= entry[0]
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    # --- Disk I/O (executor ichida ishlaydi) ---
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.audio")
+
+    def _read(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                return f.read()
+        except OSError as e:
+            logging.error(f"❌ Kesh faylini o'qishda xatolik: {e}")
+            return None
+
+    def _write(self, key, data):
+        path = self._path(key)
+        # Shu kalitning parallel yozuvlari bir-birining vaqtinchalik faylini buzmasligi uchun
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            return True
+        except OSError as e:
+            logging.error(f"❌ Kesh faylini yozishda xatolik: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return False
+
+    # --- Statistika ---
+
+    def summary(self):
+        hits = self.stats['file_id_hits'] + self.stats['memory_hits'] + self.stats['disk_hits']
+        total = hits + self.stats['misses']
+        return {
+            **self.stats,
+            'hits': hits,
+            'hit_ratio': hits / total if total else 0.0,
+            'file_ids': len(self._file_ids),
+            'memory_items': len(self._memory),
+            'memory_bytes': self._memory_bytes,
+            'disk_items': len(self._disk),
+            'disk_bytes': self._disk_bytes,
+        }
@@ -0,0 +1,431 @@
+"""Offline benchmark: the real bot pipeline against local play.ht and Bot API stand-ins.
+
+    python benchmark.py --profile bursty --requests 500
+    python benchmark.py --profile all --json results.json
+    python benchmark.py --profile all --baseline results.json   # regressiyalarni tekshirish
+    python benchmark.py --profile logging --log-level INFO --log-mode sync --log-sample-every 1 --sql-trace
+
+Bot sozlamalari (TTS_WORKERS, TTS_MAX_CONCURRENCY, ...) odatdagidek muhit o'zgaruvchilaridan o'qiladi.
+"""
+import argparse
+import asyncio
+import importlib
+import itertools
+import json
+import logging
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from mock_servers import MockPlayHT, MockTelegram
+
+ADMIN_ID = 1
+BENCH_TOKEN = "123456:BENCHMARK-TOKEN-NOT-USED-AGAINST-TELEGRAM"
+PROFILES = ("bursty", "repeated", "broadcast", "database", "logging")
+WORDS = (
+    "salom", "dunyo", "kitob", "maktab", "bugun", "ertaga", "shahar", "daryo", "tog'", "osmon",
+    "yaxshi", "katta", "kichik", "yangi", "eski", "ovoz", "matn", "xabar", "do'st", "vaqt",
+)
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of an already sorted list"""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, int(round(q * len(values))) - 1))
+    return values[index]
+
+
+def latency_summary(values):
+    values = sorted(values)
+    return {
+        'p50': percentile(values, 0.50),
+        'p95': percentile(values, 0.95),
+        'p99': percentile(values, 0.99),
+        'max': values[-1] if values else 0.0,
+        'mean': sum(values) / len(values) if values else 0.0,
+    }
+
+
+def make_text(rng, chars):
+    words = []
+    length = 0
+    while length < chars:
+        word = rng.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words).capitalize() + "."
+
+
+def rss_mb():
+    # Linux'da ru_maxrss kilobaytlarda
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Bench:
+    """Boots ``app`` against the mocks and drives it with synthetic updates"""
+
+    def __init__(self, args, playht, telegram):
+        self.args = args
+        self.playht = playht
+        self.telegram = telegram
+        self.rng = random.Random(args.seed)
+        self.app = None
+        self._message_ids = itertools.count(1)
+        self._update_ids = itertools.count(1)
+
+    async def start(self):
+        os.environ.update({
+            "BOT_TOKEN": BENCH_TOKEN,
+            "ADMIN_IDS": str(ADMIN_ID),
+            "TELEGRAM_API_URL": self.telegram.base_url,
+            "PLAYHT_URL": self.playht.url,
+            "TTS_PROVIDERS": "playht",
+            "DATABASE_URL": self.args.database_url,
+            "METRICS_ENABLED": "0",
+            "AUDIO_CACHE_DIR": os.path.join(os.getcwd(), "audio_cache"),
+            "BROADCAST_RATE": str(self.args.broadcast_rate),
+            "LOG_LEVEL": self.args.log_level,
+            "LOG_MODE": self.args.log_mode,
+            "LOG_SAMPLE_EVERY": str(self.args.log_sample_every),
+            "SQL_TRACE": "1" if self.args.sql_trace else "0",
+        })
+        # Batafsil loglar terminalni to'ldirmasligi uchun vaqtinchalik katalogdagi faylga yoziladi
+        if logging.getLevelName(self.args.log_level) < logging.WARNING:
+            os.environ["LOG_FILE"] = os.path.join(os.getcwd(), "bench.log")
+        # Rate limit sukut bo'yicha o'chiq: cheklangan xabarlarga javob bo'lmaydi va ular timeout sifatida
+        # hisoblanadi. Cheklovni sinash uchun THROTTLE_* qiymatlarini muhitda bering.
+        for name in ("THROTTLE_USER_RPM", "THROTTLE_USER_CPM", "THROTTLE_GLOBAL_RPM", "THROTTLE_GLOBAL_CPM"):
+            os.environ.setdefault(name, "1e9")
+        # app modul darajasida sozlamalarni o'qiydi, shuning uchun muhit tayyor bo'lgach import qilinadi
+        self.app = importlib.import_module("app")
+        from aiogram import Bot, Dispatcher
+        Bot.set_current(self.app.bot)
+        Dispatcher.set_current(self.app.dp)
+        await self.app.on_startup(self.app.dp)
+
+    async def stop(self):
+        await self.app.on_shutdown(self.app.dp)
+        session = await self.app.bot.get_session()
+        await session.close()
+
+    def _update(self, user_id, text):
+        message_id = next(self._message_ids)
+        user = {'id': user_id, 'is_bot': False, 'first_name': f"User{user_id}"}
+        return message_id, {
+            'update_id': next(self._update_ids),
+            'message': {
+                'message_id': message_id,
+                'date': int(time.time()),
+                'chat': {'id': user_id, 'type': 'private'},
+                'from': user,
+                'text': text,
+            },
+        }
+
+    async def send(self, user_id, text):
+        """Dispatch one text message; returns (latency, outcome)"""
+        from aiogram import types
+        message_id, data = self._update(user_id, text)
+        waiter = self.telegram.expect(message_id)
+        started = time.monotonic()
+        await self.app.dp.process_update(types.Update.to_object(data))
+        try:
+            finished, outcome = await asyncio.wait_for(waiter, self.args.timeout)
+        except asyncio.TimeoutError:
+            return None, "timeout"
+        return finished - started, outcome
+
+    async def replay(self, schedule):
+        """Replay ``[(offset_seconds, user_id, text), ...]`` and collect per-request results"""
+        started = time.monotonic()
+
+        async def fire(offset, user_id, text):
+            delay = started + offset - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            return await self.send(user_id, text)
+
+        results = await asyncio.gather(*(fire(*item) for item in schedule))
+        elapsed = time.monotonic() - started
+        outcomes = {}
+        for _, outcome in results:
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+        latencies = [latency for latency, outcome in results if outcome == "ok"]
+        return {
+            'requests': len(schedule),
+            'outcomes': outcomes,
+            'elapsed': elapsed,
+            'throughput': len(latencies) / elapsed if elapsed else 0.0,
+            'latency': latency_summary(latencies),
+        }
+
+    # --- Trafik profillari ---
+
+    def _bursts(self, texts):
+        """Spread messages over bursts of ``--burst`` simultaneous requests"""
+        args = self.args
+        schedule = []
+        for i, text in enumerate(texts):
+            offset = (i // args.burst) * args.interval
+            schedule.append((offset, 100_000 + i % args.users, text))
+        return schedule
+
+    async def profile_bursty(self):
+        """Every message is unique: cold path through queue, provider and upload"""
+        texts = [f"{i}. {make_text(self.rng, self.args.text_chars)}" for i in range(self.args.requests)]
+        return await self.replay(self._bursts(texts))
+
+    async def profile_repeated(self):
+        """Few distinct texts: exercises coalescing, the audio cache and file_id reuse"""
+        pool = [f"#{i} {make_text(self.rng, self.args.text_chars)}" for i in range(self.args.distinct)]
+        texts = [self.rng.choice(pool) for _ in range(self.args.requests)]
+        return await self.replay(self._bursts(texts))
+
+    async def profile_broadcast(self):
+        """/send to all active users (``--broadcast-users`` are seeded); latency = time until each user got it"""
+        app, telegram = self.app, self.telegram
+        first_id = 1_000_000
+        rows = [(first_id + i, f"Bench {i}", "women") for i in range(self.args.broadcast_users)]
+        await app.db.add_users(rows)
+
+        # Oldingi profillardagi foydalanuvchilar ham faol - ular ham xabar oladi
+        total = await app.db.count_active_users()
+        sent_before = len(telegram.sent)
+        stats_before = dict(telegram.stats)
+        started = time.monotonic()
+        await app.broadcaster.start(chat_id=ADMIN_ID, text="📢 Benchmark xabari")
+        while app.broadcaster.running:
+            if time.monotonic() - started > self.args.timeout * 10:
+                await app.broadcaster.stop()
+                break
+            await asyncio.sleep(0.05)
+        elapsed = time.monotonic() - started
+
+        delivered = [at - started for at, _ in telegram.sent[sent_before:]]
+        return {
+            'requests': total,
+            'outcomes': {
+                'ok': len(delivered),
+                'flood': telegram.stats['flood'] - stats_before['flood'],
+                'blocked': telegram.stats['blocked'] - stats_before['blocked'],
+            },
+            'elapsed': elapsed,
+            'throughput': len(delivered) / elapsed if elapsed else 0.0,
+            'latency': latency_summary(delivered),
+        }
+
+    async def profile_database(self):
+        """Mixed point reads and writes on ``Database`` from ``--concurrency`` tasks"""
+        db = self.app.db
+        ids = [2_000_000 + i for i in range(self.args.users)]
+        await db.add_users([(user_id, f"Db {user_id}", "women") for user_id in ids])
+        latencies = []
+        errors = 0
+
+        async def worker(count):
+            nonlocal errors
+            for _ in range(count):
+                user_id = self.rng.choice(ids)
+                roll = self.rng.random()
+                started = time.monotonic()
+                if roll < 0.6:
+                    ok = await db.get_user_voice(user_id) is not None
+                elif roll < 0.8:
+                    ok = await db.add_user(user_id + len(ids), "Db new")
+                else:
+                    ok = await db.update_user_voice(self.rng.choice(("male", "women")), user_id)
+                latencies.append(time.monotonic() - started)
+                errors += not ok
+
+        started = time.monotonic()
+        per_worker = max(1, self.args.requests // self.args.concurrency)
+        await asyncio.gather(*(worker(per_worker) for _ in range(self.args.concurrency)))
+        elapsed = time.monotonic() - started
+        return {
+            'requests': len(latencies),
+            'outcomes': {'ok': len(latencies) - errors, 'error': errors},
+            'elapsed': elapsed,
+            'throughput': len(latencies) / elapsed if elapsed else 0.0,
+            'latency': latency_summary(latencies),
+        }
+
+    async def profile_logging(self):
+        """Cold-path workload; measures time spent inside logging calls per message"""
+        spent = [0.0, 0]  # soniya, chaqiruvlar soni
+        original = logging.Logger._log
+
+        def measured(logger, *args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return original(logger, *args, **kwargs)
+            finally:
+                spent[0] += time.perf_counter() - started
+                spent[1] += 1
+
+        logging.Logger._log = measured
+        try:
+            result = await self.profile_bursty()
+        finally:
+            logging.Logger._log = original
+        result['log_us_per_msg'] = spent[0] / result['requests'] * 1e6 if result['requests'] else 0.0
+        result['log_calls_per_msg'] = spent[1] / result['requests'] if result['requests'] else 0.0
+        return result
+
+    async def run(self, profile):
+        playht_before = self.playht.stats['requests']
+        telegram_before = self.telegram.stats['requests']
+        if self.args.trace_memory:
+            tracemalloc.start()
+
+        result = await getattr(self, f"profile_{profile}")()
+
+        if self.args.trace_memory:
+            result['py_peak_mb'] = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+            tracemalloc.stop()
+        result['rss_max_mb'] = rss_mb()
+        result['playht_requests'] = self.playht.stats['requests'] - playht_before
+        result['telegram_requests'] = self.telegram.stats['requests'] - telegram_before
+        return result
+
+
+def print_report(results):
+    header = f"{'profil':<10} {'so`rov':>7} {'ok':>6} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'RSS MB':>7} {'play.ht':>8}"
+    print(header)
+    print("-" * len(header))
+    for profile, result in results.items():
+        latency = result['latency']
+        print(
+            f"{profile:<10} {result['requests']:>7} {result['outcomes'].get('ok', 0):>6} "
+            f"{result['throughput']:>8.1f} {latency['p50'] * 1000:>8.1f} {latency['p95'] * 1000:>8.1f} "
+            f"{latency['p99'] * 1000:>8.1f} {result['rss_max_mb']:>7.1f} {result['playht_requests']:>8}"
+        )
+        other = {k: v for k, v in result['outcomes'].items() if k != 'ok' and v}
+        if other:
+            print(f"{'':<10} boshqa natijalar: {other}")
+        if 'log_us_per_msg' in result:
+            print(f"{'':<10} log: {result['log_us_per_msg']:.1f} µs/xabar, {result['log_calls_per_msg']:.1f} chaqiruv/xabar")
+        if 'py_peak_mb' in result:
+            print(f"{'':<10} Python xotira cho'qqisi: {result['py_peak_mb']:.1f} MB")
+
+
+def print_stages():
+    import metrics
+    stages = metrics.stage_summary()
+    if not stages:
+        return
+    print("\nBosqichlar (p50 / p95, ms):")
+    for stage, (count, p50, p95) in stages.items():
+        print(f"  {stage:<14} {count:>7}  {p50 * 1000:>8.1f} / {p95 * 1000:.1f}")
+
+
+def compare(results, baseline, tolerance):
+    """Return human-readable regressions against a previous ``--json`` run"""
+    regressions = []
+    for profile, result in results.items():
+        base = baseline.get(profile)
+        if not base:
+            continue
+        if base['throughput'] and result['throughput'] < base['throughput'] * (1 - tolerance):
+            regressions.append(
+                f"{profile}: o'tkazuvchanlik {base['throughput']:.1f} -> {result['throughput']:.1f} so'rov/s"
+            )
+        for key in ('p95', 'p99'):
+            before, after = base['latency'][key], result['latency'][key]
+            if before and after > before * (1 + tolerance):
+                regressions.append(f"{profile}: {key} {before * 1000:.1f} -> {after * 1000:.1f} ms")
+        before, after = base.get('log_us_per_msg'), result.get('log_us_per_msg')
+        if before and after and after > before * (1 + tolerance):
+            regressions.append(f"{profile}: log {before:.1f} -> {after:.1f} µs/xabar")
+    return regressions
+
+
+async def main(args):
+    playht = MockPlayHT(
+        latency=args.playht_latency, jitter=args.playht_jitter,
+        error_rate=args.playht_error_rate, mode=args.playht_mode,
+    )
+    telegram = MockTelegram(
+        latency=args.telegram_latency, flood_rate=args.flood_rate,
+        blocked_rate=args.blocked_rate, admin_id=ADMIN_ID,
+    )
+    await playht.start()
+    await telegram.start()
+
+    bench = Bench(args, playht, telegram)
+    results = {}
+    try:
+        await bench.start()
+        profiles = PROFILES if args.profile == "all" else (args.profile,)
+        for profile in profiles:
+            logging.warning(f"⏱ Profil: {profile}")
+            results[profile] = await bench.run(profile)
+    finally:
+        if bench.app is not None:
+            await bench.stop()
+        await telegram.stop()
+        await playht.stop()
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline TTS bot benchmark")
+    parser.add_argument("--profile", choices=(*PROFILES, "all"), default="all")
+    parser.add_argument("--requests", type=int, default=300, help="xabarlar (yoki DB amallari) soni")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--burst", type=int, default=50, help="bir vaqtda keladigan xabarlar")
+    parser.add_argument("--interval", type=float, default=0.5, help="to'lqinlar orasidagi vaqt, s")
+    parser.add_argument("--distinct", type=int, default=10, help="repeated profilida turli matnlar soni")
+    parser.add_argument("--text-chars", type=int, default=80)
+    parser.add_argument("--concurrency", type=int, default=20, help="database profilidagi parallel vazifalar")
+    parser.add_argument("--broadcast-users", type=int, default=200)
+    parser.add_argument("--broadcast-rate", type=float, default=float(os.getenv("BROADCAST_RATE", "25")))
+    parser.add_argument("--playht-latency", type=float, default=0.3)
+    parser.add_argument("--playht-jitter", type=float, default=0.1)
+    parser.add_argument("--playht-error-rate", type=float, default=0.0)
+    parser.add_argument("--playht-mode", choices=("audio", "json"), default="audio")
+    parser.add_argument("--telegram-latency", type=float, default=0.01)
+    parser.add_argument("--flood-rate", type=float, default=0.0, help="broadcast'da 429 ulushi")
+    parser.add_argument("--blocked-rate", type=float, default=0.0, help="broadcast'da bloklagan userlar ulushi")
+    parser.add_argument("--database-url", default="", help="bo'sh - vaqtinchalik SQLite")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--log-level", default="WARNING", help="INFO/DEBUG loglari bench.log fayliga yoziladi")
+    parser.add_argument("--log-mode", choices=("queue", "sync"), default="queue")
+    parser.add_argument("--log-sample-every", type=int, default=100)
+    parser.add_argument("--sql-trace", action="store_true", help="har bir SQL so'rovni loglash")
+    parser.add_argument("--trace-memory", action="store_true", help="tracemalloc bilan Python xotira cho'qqisi")
+    parser.add_argument("--json", help="natijalarni faylga yozish")
+    parser.add_argument("--baseline", help="avvalgi --json natijasi bilan solishtirish")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="ruxsat etilgan yomonlashuv ulushi")
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    output = os.path.abspath(args.json) if args.json else None
+
+    # Baza, audio kesh va boshqa fayllar vaqtinchalik katalogda yaratiladi
+    with tempfile.TemporaryDirectory(prefix="tts-bench-") as workdir:
+        os.chdir(workdir)
+        results = asyncio.run(main(args))
+
+    print_report(results)
+    print_stages()
+    if output:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.tolerance)
+        for line in regressions:
+            print(f"⚠️ Regressiya: {line}")
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,50 @@
+import logging
+from aiogram import types
+
+# Ovoz kodi -> (tugma matni, tanlanganda ko'rsatiladigan xabar)
+VOICE_LABELS = {
+    'male': ("🧔‍♂️ Erkak ovoz", "🧔‍♂️ Erkak ovoz sozlandi!"),
+    'women': ("👩‍🦰 Ayol ovoz", "👩‍🦰 Ayol ovoz sozlandi!"),
+}
+
+
+class BotContext:
+    """Static per-process data resolved once at startup instead of on every message.
+
+    Bot username (``get_me``), admin to'plami, ovozlar xaritasi va tayyor klaviaturalar
+    shu yerda saqlanadi. ``refresh()`` on_startup'da chaqiriladi va kerak bo'lsa (masalan,
+    bot nomi o'zgarganda) qayta chaqirilishi mumkin.
+    """
+
+    def __init__(self, bot, admin_ids, voices=VOICE_LABELS):
+        self.bot = bot
+        self.admins = frozenset(admin_ids)
+        self.voices = {voice: label for voice, (label, _) in voices.items()}
+        self.voice_replies = {voice: reply for voice, (_, reply) in voices.items()}
+        self.voice_keyboard = types.InlineKeyboardMarkup(row_width=2).add(*(
+            types.InlineKeyboardButton(label, callback_data=voice)
+            for voice, label in self.voices.items()
+        ))
+
+        self.bot_id = None
+        self.username = None
+        self._signature = ""
+
+    async def refresh(self):
+        """Fetch the bot identity from Telegram (the only remote call this class makes)"""
+        me = await self.bot.get_me()
+        self.bot_id = me.id
+        self.username = me.username
+        self._signature = f"\n\n🤖 @{me.username}"
+        logging.info(f"🤖 Bot: @{me.username} ({me.id})")
+
+    async def ensure(self):
+        """Refresh only if startup could not reach Telegram"""
+        if self.username is None:
+            await self.refresh()
+
+    def is_admin(self, user_id: int) -> bool:
+        return user_id in self.admins
+
+    def caption(self, title: str) -> str:
+        return f"🎵 <i>{title}</i>{self._signature}"
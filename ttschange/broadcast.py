@@ -0,0 +1,234 @@
+import asyncio
+import logging
+import time
+from aiogram.utils import exceptions
+from limiter import TokenBucket
+
+# Foydalanuvchi botni bloklagan yoki o'chirilgan - qayta urinishning ma'nosi yo'q
+_UNREACHABLE = (
+    exceptions.BotBlocked,
+    exceptions.UserDeactivated,
+    exceptions.ChatNotFound,
+    exceptions.CantInitiateConversation,
+    exceptions.BotKicked,
+)
+
+
+class BroadcastEngine:
+    """Background /send runner with keyset paging, token-bucket pacing and a persisted cursor.
+
+    Telegram umumiy cheklovi ~30 xabar/s. Har bir foydalanuvchiga bitta xabar yuborilgani uchun
+    chat bo'yicha cheklov faqat admin progress xabarini tahrirlashga tegishli
+    (``progress_interval`` bilan siyraklashtiriladi). 429 (RetryAfter) kelganda tezlik
+    kamaytiriladi va keyin asta-sekin tiklanadi (AIMD).
+
+    Umumiy ``state`` bilan har bir broadcast ``lease_ttl`` muddatli lease orqali bitta ishchida
+    bajariladi; lease har sahifada yangilanadi. Ishchi to'xtab qolsa, lease muddati o'tgach boshqa
+    ishchi ``resume`` (``watch`` davriy chaqiradi) orqali cursor'dan davom ettiradi.
+    """
+
+    def __init__(self, bot, db, rate=25.0, min_rate=5.0, concurrency=20, page_size=500,
+                 progress_interval=3.0, max_retries=3, state=None, lease_ttl=120.0):
+        self.bot = bot
+        self.db = db
+        self.state = state if state is not None and state.shared else None
+        self.lease_ttl = lease_ttl
+        self.max_rate = rate
+        self.min_rate = min_rate
+        self.concurrency = concurrency
+        self.page_size = page_size
+        self.progress_interval = progress_interval
+        self.max_retries = max_retries
+
+        self.bucket = TokenBucket(rate=rate, capacity=rate)
+        self._tasks = {}  # broadcast_id -> asyncio.Task
+        self._watch_task = None
+        self._stopping = False
+
+    async def start(self, chat_id: int, text: str):
+        """Create a broadcast job and run it in the background; returns its id"""
+        total = await self.db.count_active_users()
+        broadcast_id = await self.db.create_broadcast(chat_id=chat_id, text=text, total=total)
+        if broadcast_id is None:
+            raise RuntimeError("Broadcast yozuvini yaratib bo'lmadi")
+        await self._claim(broadcast_id)
+
+        msg = await self.bot.send_message(chat_id, "📤 Xabar yuborilmoqda...")
+        await self.db.update_broadcast(broadcast_id, message_id=msg.message_id)
+
+        job = {
+            'id': broadcast_id, 'chat_id': chat_id, 'message_id': msg.message_id, 'text': text,
+            'last_id': 0, 'total': total, 'success': 0, 'failed': 0, 'blocked': 0,
+        }
+        self._spawn(job)
+        return broadcast_id
+
+    async def resume(self):
+        """Restart broadcasts interrupted by a restart from their persisted cursor"""
+        for row in await self.db.select_running_broadcasts() or ():
+            broadcast_id, chat_id, message_id, text, last_id, total, success, failed, blocked = row
+            if broadcast_id in self._tasks or not await self._claim(broadcast_id):
+                continue
+            job = {
+                'id': broadcast_id, 'chat_id': chat_id, 'message_id': message_id, 'text': text,
+                'last_id': last_id, 'total': total, 'success': success, 'failed': failed, 'blocked': blocked,
+            }
+            logging.info(f"📤 Broadcast #{broadcast_id} davom ettirilmoqda (cursor={last_id})")
+            self._spawn(job)
+
+    def watch(self):
+        """Periodically take over broadcasts whose worker stopped renewing the lease"""
+        if self.state is not None and self._watch_task is None:
+            self._watch_task = asyncio.create_task(self._watch_loop())
+
+    async def _watch_loop(self):
+        while True:
+            await asyncio.sleep(self.lease_ttl)
+            try:
+                await self.resume()
+            except Exception as e:
+                logging.error(f"Broadcastlarni tekshirishda xatolik: {e}")
+
+    async def stop(self, timeout: float = 0.0):
+        """Let running jobs finish their current page (up to ``timeout`` seconds), then cancel.
+
+        Cursor har sahifadan keyin saqlanadi; sahifa o'rtasida bekor qilinsa, shu sahifa qayta
+        ishga tushganda yana yuboriladi - shuning uchun avval sahifa tugashi kutiladi.
+        """
+        self._stopping = True
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+            self._watch_task = None
+        tasks = list(self._tasks.values())
+        if tasks and timeout > 0:
+            await asyncio.wait(tasks, timeout=timeout)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    @property
+    def running(self):
+        return len(self._tasks)
+
+    async def _claim(self, broadcast_id):
+        if self.state is None:
+            return True
+        return await self.state.add(f"broadcast:{broadcast_id}", self.state.owner, self.lease_ttl)
+
+    async def _renew(self, broadcast_id):
+        if self.state is not None:
+            await self.state.set(f"broadcast:{broadcast_id}", self.state.owner, self.lease_ttl)
+
+    async def _release(self, broadcast_id):
+        if self.state is not None:
+            await self.state.delete(f"broadcast:{broadcast_id}", self.state.owner)
+
+    def _spawn(self, job):
+        task = asyncio.create_task(self._run(job))
+        self._tasks[job['id']] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job['id'], None))
+
+    async def _run(self, job):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        last_progress = 0.0
+
+        async def send(user_id):
+            async with semaphore:
+                outcome = await self._send(user_id, job['text'])
+            job[outcome] += 1
+
+        try:
+            while True:
+                if self._stopping:
+                    logging.info(f"⏸ Broadcast #{job['id']} to'xtatildi (cursor={job['last_id']})")
+                    return
+                page = await self.db.select_active_user_ids(after_id=job['last_id'], limit=self.page_size)
+                if page is None:
+                    raise RuntimeError("Foydalanuvchilar sahifasini o'qib bo'lmadi")
+                if not page:
+                    break
+
+                await asyncio.gather(*(send(user_id) for _, user_id in page))
+
+                job['last_id'] = page[-1][0]
+                await self.db.update_broadcast(
+                    job['id'], last_id=job['last_id'],
+                    success=job['success'], failed=job['failed'], blocked=job['blocked'],
+                )
+                await self._renew(job['id'])
+
+                now = time.monotonic()
+                if now - last_progress >= self.progress_interval:
+                    last_progress = now
+                    await self._edit_progress(job, self._progress_text(job))
+
+            await self.db.update_broadcast(job['id'], status='done')
+            await self._edit_progress(job, f"""✅ <b>Xabar yuborish yakunlandi!</b>
+
+📊 Muvaffaqiyatli: <code>{job['success']}</code>
+❌ Muvaffaqiyatsiz: <code>{job['failed']}</code>
+🚫 Bloklagan: <code>{job['blocked']}</code>
+👥 Jami: <code>{job['success'] + job['failed'] + job['blocked']}</code>""")
+        except asyncio.CancelledError:
+            logging.info(f"⏸ Broadcast #{job['id']} to'xtatildi (cursor={job['last_id']})")
+            raise
+        except Exception as e:
+            logging.error(f"Broadcast #{job['id']} da xatolik: {e}")
+            await self.db.update_broadcast(job['id'], status='failed')
+            await self._edit_progress(job, f"❌ Xabar yuborish to'xtadi: {e}")
+        finally:
+            # To'xtatilganda ham bo'shatiladi - qayta ishga tushgan ishchi darhol davom ettirishi uchun
+            await asyncio.shield(self._release(job['id']))
+
+    async def _send(self, user_id, text):
+        """Send one message; returns 'success', 'failed' or 'blocked'"""
+        # HTML entities dan himoyalanish
+        safe_text = text.replace('<', '&lt;').replace('>', '&gt;')
+        for _ in range(self.max_retries + 1):
+            await self.bucket.acquire()
+            try:
+                await self.bot.send_message(chat_id=user_id, text=safe_text, parse_mode=None)
+                self._on_success()
+                return 'success'
+            except exceptions.RetryAfter as e:
+                self._on_retry_after(e.timeout)
+            except _UNREACHABLE:
+                await self.db.set_user_active(user_id, False)
+                return 'blocked'
+            except Exception as e:
+                logging.error(f"Foydalanuvchi {user_id}ga xabar yuborishda xatolik: {e}")
+                return 'failed'
+        return 'failed'
+
+    def _on_retry_after(self, timeout):
+        # Ko'paytiruvchi kamaytirish va umumiy pauza
+        self.bucket.pause(timeout)
+        self.bucket.set_rate(max(self.min_rate, self.bucket.rate * 0.5))
+        logging.warning(f"⚠️ Telegram 429: {timeout}s kutish, yangi tezlik {self.bucket.rate:.1f} msg/s")
+
+    def _on_success(self):
+        # Qo'shiluvchi tiklanish
+        if self.bucket.rate < self.max_rate:
+            self.bucket.set_rate(min(self.max_rate, self.bucket.rate + 0.05))
+
+    @staticmethod
+    def _progress_text(job):
+        done = job['success'] + job['failed'] + job['blocked']
+        total = max(job['total'], done)
+        percent = done / total if total else 1.0
+        return f"""📤 <b>Xabar yuborilmoqda...</b> <code>{percent:.0%}</code>
+
+✅ Muvaffaqiyatli: <code>{job['success']}</code>
+❌ Muvaffaqiyatsiz: <code>{job['failed']}</code>
+🚫 Bloklagan: <code>{job['blocked']}</code>
+👥 <code>{done}</code>/<code>{total}</code>"""
+
+    async def _edit_progress(self, job, text):
+        if not job['message_id']:
+            return
+        try:
+            await self.bot.edit_message_text(text, chat_id=job['chat_id'], message_id=job['message_id'])
+        except exceptions.MessageNotModified:
+            pass
+        except Exception as e:
+            logging.error(f"Broadcast progress xabarini yangilashda xatolik: {e}")
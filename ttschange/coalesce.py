@@ -0,0 +1,79 @@
+import asyncio
+
+
+class SingleFlight:
+    """In-flight request coalescing: identical concurrent jobs share one result.
+
+    Birinchi so'rov (lider) ``begin`` bilan reys ochadi va natijani ``finish`` bilan e'lon qiladi;
+    shu vaqt ichida kelgan bir xil so'rovlar (izdoshlar) ``wait`` orqali o'sha natijani kutadi.
+    Kutish navbat ishida bo'ladi (ishchi o'rnini bo'shatgan holda) - update handler bloklanmaydi.
+
+    ``state`` umumiy bo'lsa, lider ``claim`` bilan barcha ishchilar uchun qulf oladi; boshqa ishchidagi
+    so'rov ``wait_remote`` bilan qulf bo'shashini kutadi va natijani umumiy file_id keshidan oladi.
+    """
+
+    def __init__(self, state=None, poll_interval=0.2):
+        self.state = state if state is not None and state.shared else None
+        self.poll_interval = poll_interval
+        self._flights = {}  # key -> asyncio.Future
+        self.stats = {'leaders': 0, 'followers': 0, 'remote_followers': 0}
+
+    def in_flight(self, key) -> bool:
+        return key in self._flights
+
+    def begin(self, key) -> bool:
+        """Become the leader for ``key``; False if a flight is already open (``wait`` for it instead).
+
+        Yetakchi xato bilan tugasa (``finish(key, None)``), kutganlar qayta ``begin`` chaqiradi -
+        yetakchilikni faqat birinchisi oladi, qolganlari yangi reysni kutadi.
+        """
+        if key in self._flights:
+            return False
+        self._flights[key] = asyncio.get_running_loop().create_future()
+        self.stats['leaders'] += 1
+        return True
+
+    def finish(self, key, result=None):
+        """Publish the leader's result (None means failure) and close the flight"""
+        future = self._flights.pop(key, None)
+        if future is not None and not future.done():
+            future.set_result(result)
+
+    async def wait(self, key, timeout=None):
+        """Wait for the leader's result; returns None if there is no flight or it failed"""
+        future = self._flights.get(key)
+        if future is None:
+            return None
+        self.stats['followers'] += 1
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def claim(self, key, ttl: float) -> bool:
+        """Take the cluster-wide lock for ``key``; False if another worker holds it"""
+        if self.state is None:
+            return True
+        return await self.state.add(f"flight:{key}", self.state.owner, ttl)
+
+    async def release(self, key):
+        if self.state is not None:
+            await self.state.delete(f"flight:{key}", self.state.owner)
+
+    async def wait_remote(self, key, timeout: float) -> bool:
+        """Poll until another worker releases ``key``; False on timeout"""
+        self.stats['remote_followers'] += 1
+        deadline = asyncio.get_running_loop().time() + timeout
+        while await self.state.get(f"flight:{key}") is not None:
+            if asyncio.get_running_loop().time() >= deadline:
+                return False
+            await asyncio.sleep(self.poll_interval)
+        return True
+
+    def summary(self):
+        total = self.stats['leaders'] + self.stats['followers']
+        return {
+            **self.stats,
+            'in_flight': len(self._flights),
+            'coalesce_ratio': self.stats['followers'] / total if total else 0.0,
+        }
@@ -1,61 +1,385 @@
-import sqlite3
-import os
-
-def migrate_database():
-    """Mavjud ma'lumotlar bazasini yangi strukturaga o'tkazish"""
-    
-    if not os.path.exists("main.db"):
-        print("❌ main.db fayli topilmadi")
+"""Versioned forward-only schema migrations, applied at startup (``on_startup``) or by hand.
+
+    python database_migrations.py            # kutilayotgan migratsiyalarni qo'llash
+    python database_migrations.py --status   # qo'llangan va kutilayotgan versiyalar
+
+Qo'llangan versiyalar ``schema_version`` jadvalida saqlanadi. Faqat sxemani o'zgartiradigan
+migratsiyalar bot so'rovlarni qabul qilishidan oldin qo'llanadi; ma'lumot ko'chiradiganlari
+(``background=True``) bot ishlay boshlagach fonda bajariladi va ``MIGRATION_BATCH_SIZE`` qatorli
+partiyalarda ko'chiradi - yozish qulfi har bir partiya uchun qisqa vaqt ushlanadi. Fondagi migratsiya
+tugaguncha bot eski sxema bilan ham ishlay olishi, keyingi sxema migratsiyalari undan oldin
+qo'llanishiga ham chidashi kerak. Yangi migratsiya ``@migration(N, "nom")`` bilan qo'shiladi va qayta
+ishga tushirilsa ham xavfsiz bo'lishi kerak (versiya yozilishidan oldin to'xtasa, keyingi ishga
+tushishda yana bajariladi).
+"""
+import argparse
+import asyncio
+import importlib
+import logging
+import time
+from shared_state import DatabaseState
+from usage_log import LATENCY_BOUNDS_MS
+
+MIGRATIONS = []
+
+
+class MigrationError(Exception):
+    """A migration statement failed; the version is not recorded and the next start retries it"""
+
+
+class Migration:
+    """One forward schema change: ``apply(migrator)`` is an idempotent coroutine"""
+
+    def __init__(self, version: int, name: str, apply, background=False):
+        self.version = version
+        self.name = name
+        self.apply = apply
+        self.background = background
+
+
+def migration(version: int, name: str, background=False):
+    """Register the decorated coroutine as migration ``version`` (versions must increase).
+
+    ``background=True`` - ma'lumot ko'chiradigan migratsiya, bot ishlayotganda fonda bajariladi.
+    """
+    def register(apply):
+        assert not MIGRATIONS or version > MIGRATIONS[-1].version, "migratsiya versiyalari o'sib borishi kerak"
+        MIGRATIONS.append(Migration(version, name, apply, background))
+        return apply
+    return register
+
+
+class Migrator:
+    """Applies pending ``MIGRATIONS`` in version order under a lease, so only one worker migrates.
+
+    Lease ``SharedState`` jadvalida (``DatabaseState``) - ``STATE_BACKEND`` dan qat'i nazar, chunki
+    migratsiya baza bilan bog'liq. Boshqa ishchi migratsiya qilayotgan bo'lsa, tugashini kutadi
+    (kutilayotgan migratsiyalar qolmasa - darhol qaytadi).
+    """
+
+    LOCK_KEY = "schema_migrations"
+
+    def __init__(self, db, migrations=MIGRATIONS, batch_size=1000, batch_pause=0.05,
+                 progress_interval=5.0, lease_ttl=60.0):
+        self.db = db
+        self.migrations = migrations
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+        self.progress_interval = progress_interval
+        self.lease_ttl = lease_ttl
+
+        self._lock = DatabaseState(db)
+        self._task = None
+        self._current = None
+        self._lease_renewed = 0.0
+        self._progress_logged = 0.0
+
+    async def _ensure_table(self):
+        await self.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at BIGINT NOT NULL
+        );
+        """)
+
+    async def applied(self):
+        """``{version: (name, applied_at)}`` of migrations already recorded"""
+        await self._ensure_table()
+        rows = await self.db.execute("SELECT version, name, applied_at FROM schema_version", fetchall=True) or []
+        return {version: (name, applied_at) for version, name, applied_at in rows}
+
+    async def pending(self, background=True):
+        """Migrations not applied yet; ``background=False`` leaves out the data-moving ones"""
+        applied = await self.applied()
+        return [m for m in self.migrations if m.version not in applied and (background or not m.background)]
+
+    async def run(self, background=True):
+        """Apply pending migrations (only schema-only ones if ``background=False``); returns how many"""
+        if not await self.pending(background):
+            return 0
+
+        if not await self._acquire(background):
+            return 0
+        count = 0
+        try:
+            # Lease kutilayotganda boshqa ishchi ularni qo'llagan bo'lishi mumkin
+            for item in await self.pending(background):
+                self._current = item
+                logging.info(f"🔧 Migratsiya {item.version} ({item.name}) boshlandi")
+                started = time.monotonic()
+                await item.apply(self)
+                await self.execute(
+                    "INSERT INTO schema_version(version, name, applied_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT(version) DO NOTHING",
+                    (item.version, item.name, int(time.time())),
+                )
+                count += 1
+                logging.info(f"✅ Migratsiya {item.version} ({item.name}): {time.monotonic() - started:.1f} s")
+        finally:
+            self._current = None
+            await self._lock.delete(self.LOCK_KEY, self._lock.owner)
+        return count
+
+    async def _acquire(self, background=True):
+        """Take the lease; False if meanwhile another worker applied everything we were waiting for"""
+        await self.db.create_table_shared_state()
+        waiting = False
+        while not await self._lock.add(self.LOCK_KEY, self._lock.owner, ttl=self.lease_ttl):
+            if not waiting:
+                logging.info("⏳ Boshqa ishchi migratsiya qilmoqda, kutilmoqda...")
+                waiting = True
+            await asyncio.sleep(1.0)
+            # Lease egasi fondagi uzoq ko'chirishni bajarayotgan bo'lishi mumkin - sxema tayyor bo'lsa kutmaymiz
+            if not await self.pending(background):
+                return False
+        self._lease_renewed = time.monotonic()
+        return True
+
+    def start(self):
+        """Apply the remaining (data-moving) migrations in a background task while the bot serves"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run_background())
+
+    async def _run_background(self):
+        try:
+            await self.run()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Qo'llanmagan migratsiya keyingi ishga tushishda qayta bajariladi
+            logging.error(f"Fondagi migratsiyada xatolik: {e}")
+
+    async def stop(self):
+        """Interrupt the background migration; it resumes on the next start"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    # --- migratsiyalar uchun yordamchilar ---
+
+    async def execute(self, sql: str, parameters: tuple = None):
+        """Run one statement; unlike ``db.execute`` a failure raises ``MigrationError``"""
+        result = await self.db.execute(sql, parameters=parameters, commit=True)
+        if result is None:
+            raise MigrationError(sql.strip().splitlines()[0])
+        return result
+
+    async def transaction(self, statements):
+        """Run ``[(sql, parameters), ...]`` atomically or raise ``MigrationError``"""
+        if await self.db.execute_transaction(statements) is None:
+            raise MigrationError(statements[0][0].strip().splitlines()[0])
+
+    async def add_column(self, table: str, column: str, definition: str):
+        """``ALTER TABLE ... ADD COLUMN`` if missing (metadata-only in SQLite and PostgreSQL 11+)"""
+        await self.db.ensure_column(table, column, definition)
+        if column.lower() not in [name.lower() for name in await self.db.table_columns(table)]:
+            raise MigrationError(f"{table}.{column} ustuni qo'shilmadi")
+
+    async def copy_batches(self, table: str, sql: str, after_id: int = 0, up_to: int = None):
+        """Run ``sql`` over ``table`` in id ranges of ``batch_size`` rows; returns the last id.
+
+        ``sql`` ikki parametr oladi: ``id > ? AND id <= ?``. Har bir partiya alohida qisqa
+        tranzaksiya, orasida ``batch_pause`` - botning o'z yozuvlari navbat kutib qolmaydi.
+        ``up_to`` berilsa, undan katta id'lar ko'chirilmaydi.
+        """
+        limit = "" if up_to is None else f" AND id <= {int(up_to)}"
+        row = await self.db.execute(
+            f"SELECT COUNT(*) FROM {table} WHERE id > ?{limit}", parameters=(after_id,), fetchone=True,
+        )
+        total, done = (row[0] if row else 0), 0
+        while True:
+            row = await self.db.execute(
+                f"SELECT MAX(id) FROM (SELECT id FROM {table} WHERE id > ?{limit} ORDER BY id LIMIT ?) AS batch",
+                parameters=(after_id, self.batch_size), fetchone=True,
+            )
+            upper = row[0] if row else None
+            if upper is None:
+                return after_id
+            await self.execute(sql, (after_id, upper))
+            after_id = upper
+            done = min(total, done + self.batch_size)
+            await self.progress(done, total)
+
+    async def progress(self, done: int, total: int):
+        """Report batch progress, keep the lease alive and yield to the bot's own queries"""
+        now = time.monotonic()
+        if now - self._progress_logged >= self.progress_interval:
+            self._progress_logged = now
+            percent = done / total if total else 1.0
+            logging.info(f"🔄 Migratsiya {self._current.version} ({self._current.name}): {done}/{total} ({percent:.0%})")
+        if now - self._lease_renewed >= self.lease_ttl / 3:
+            await self._lock.set(self.LOCK_KEY, self._lock.owner, ttl=self.lease_ttl)
+            self._lease_renewed = now
+        await asyncio.sleep(self.batch_pause)
+
+    async def status(self):
+        applied = await self.applied()
+        return [(m.version, m.name, applied.get(m.version, (None, None))[1]) for m in self.migrations]
+
+
+@migration(1, "users_drop_updated_at", background=True)
+async def users_drop_updated_at(migrator):
+    """Eski SQLite sxemasi (updated_at ustuni, matnli created_at) yangi Users jadvaliga ko'chiriladi.
+
+    Ko'chirish davomida bot eski jadval bilan ishlaydi (2 va 3 migratsiyalar undan oldin qo'llangan
+    bo'lishi mumkin - ``active`` ham ko'chiriladi).
+    """
+    db = migrator.db
+    if db.dialect != "sqlite":
+        return
+    columns = await db.table_columns("Users")
+    if 'updated_at' not in columns:
+        return
+
+    # Eski sxemada created_at matn (CURRENT_TIMESTAMP) edi - unix vaqtga o'tkaziladi
+    created_at = "CAST(strftime('%s', created_at) AS INTEGER)" if 'created_at' in columns else "NULL"
+    active = "active" if 'active' in columns else "1"
+    insert = (
+        "INSERT OR IGNORE INTO Users_new(id, user_id, name, voice, created_at, active) "
+        f"SELECT id, user_id, name, voice, {created_at}, {active} FROM Users"
+    )
+
+    await migrator.execute("""
+    CREATE TABLE IF NOT EXISTS Users_new (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL UNIQUE,
+        name TEXT NOT NULL,
+        voice TEXT DEFAULT 'women',
+        created_at INTEGER,
+        active INTEGER DEFAULT 1
+    );
+    """)
+    # Ko'chirish davomida allaqachon ko'chirilgan qatorlardagi o'zgarishlar yangi jadvalga ham yoziladi;
+    # yangi foydalanuvchilar katta id bilan qo'shiladi va keyingi partiyalarda ko'chiriladi
+    mirrored = "name = NEW.name, voice = NEW.voice" + (", active = NEW.active" if 'active' in columns else "")
+    await migrator.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_users_migrate_update AFTER UPDATE ON Users
+    BEGIN
+        UPDATE Users_new SET {mirrored} WHERE id = NEW.id;
+    END;
+    """)
+    await migrator.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_users_migrate_delete AFTER DELETE ON Users
+    BEGIN
+        DELETE FROM Users_new WHERE id = OLD.id;
+    END;
+    """)
+
+    # To'xtab qolgan migratsiya oxirgi ko'chirilgan id dan davom etadi
+    row = await db.execute("SELECT COALESCE(MAX(id), 0) FROM Users_new", fetchone=True)
+    last_id = await migrator.copy_batches("Users", f"{insert} WHERE id > ? AND id <= ?", after_id=row[0] if row else 0)
+
+    # Almashtirish bitta qisqa tranzaksiyada; eski jadval bilan uning triggerlari ham o'chadi
+    await migrator.transaction([
+        (f"{insert} WHERE id > ?", (last_id,)),
+        ("DROP TABLE Users", None),
+        ("ALTER TABLE Users_new RENAME TO Users", None),
+        ("CREATE INDEX IF NOT EXISTS idx_user_id ON Users(user_id)", None),
+    ])
+
+    # UserStats triggerlari qayta yaratiladi, hisoblagichlar qayta sanaladi
+    if await db.table_columns("UserStats"):
+        await db.create_table_user_stats()
+        await db.reconcile_user_stats()
+
+
+@migration(2, "users_active")
+async def users_active(migrator):
+    """Broadcast bloklagan foydalanuvchilarni o'tkazib yuborishi uchun Users.active"""
+    await migrator.add_column("Users", "active", "INTEGER DEFAULT 1")
+
+
+@migration(3, "users_created_at")
+async def users_created_at(migrator):
+    """Statistika uchun Users.created_at (unix vaqt)"""
+    await migrator.add_column("Users", "created_at", "BIGINT" if migrator.db.dialect == "postgres" else "INTEGER")
+
+
+@migration(4, "usage_rollups", background=True)
+async def usage_rollups(migrator):
+    """/stat agregatlari (UsageDaily, UsageDayUsers, UsageLatency) mavjud SynthesisEvents'dan to'ldiriladi.
+
+    Bot shu vaqtda yangi hodisalarni agregatlar bilan bitta tranzaksiyada yozadi. Agregatlar tozalanadigan
+    tranzaksiyada hodisalarning eng katta id'si belgilanadi va faqat undan oldingilari to'ldiriladi -
+    hech biri ikki marta sanalmaydi. To'xtab qolgan migratsiya boshidan boshlanadi. To'ldirilguncha
+    /stat oldingi kunlar uchun kamroq ko'rsatadi.
+    """
+    db = migrator.db
+    if not await db.table_columns("SynthesisEvents"):
         return
-    
+    await db.create_table_usage()
+    await db.create_table_shared_state()
+    mark = "usage_rollups_backfill"
+    statements = [(f"DELETE FROM {table}", None) for table in ("UsageDaily", "UsageDayUsers", "UsageLatency")]
+    if db.dialect == "postgres":
+        # Ochiq yozish tranzaksiyalari tugashini kutamiz - ulardan keyingi id'lar belgidan katta bo'ladi
+        statements.insert(0, ("LOCK TABLE SynthesisEvents IN SHARE MODE", None))
+    statements.append((
+        "INSERT INTO SharedState(key, value, expires_at) "
+        "SELECT ?, CAST(COALESCE(MAX(id), 0) AS TEXT), NULL FROM SynthesisEvents WHERE true "
+        "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = NULL",
+        (mark,),
+    ))
+    await migrator.transaction(statements)
+    row = await db.execute("SELECT value FROM SharedState WHERE key = ?", parameters=(mark,), fetchone=True)
+    if row is None:
+        raise MigrationError("to'ldirish chegarasi o'qilmadi")
+    up_to = int(row[0])
+
+    bucket = "CASE " + " ".join(
+        f"WHEN latency_ms <= {bound} THEN {index}" for index, bound in enumerate(LATENCY_BOUNDS_MS)
+    ) + f" ELSE {len(LATENCY_BOUNDS_MS)} END"
+    await migrator.copy_batches("SynthesisEvents", """
+    INSERT INTO UsageDaily(day, requests, chars, cache_hits)
+    SELECT created_at / 86400, COUNT(*), SUM(chars), SUM(cache_hit) FROM SynthesisEvents
+    WHERE id > ? AND id <= ? GROUP BY 1
+    ON CONFLICT(day) DO UPDATE SET requests = UsageDaily.requests + excluded.requests,
+        chars = UsageDaily.chars + excluded.chars, cache_hits = UsageDaily.cache_hits + excluded.cache_hits
+    """, up_to=up_to)
+    # UsageDaily.users trigger orqali oshadi
+    await migrator.copy_batches("SynthesisEvents", """
+    INSERT INTO UsageDayUsers(day, user_id)
+    SELECT DISTINCT created_at / 86400, user_id FROM SynthesisEvents WHERE id > ? AND id <= ?
+    ON CONFLICT(day, user_id) DO NOTHING
+    """, up_to=up_to)
+    await migrator.copy_batches("SynthesisEvents", f"""
+    INSERT INTO UsageLatency(hour, bucket, requests)
+    SELECT created_at / 3600, {bucket}, COUNT(*) FROM SynthesisEvents
+    WHERE id > ? AND id <= ? AND outcome = 'ok' AND latency_ms IS NOT NULL GROUP BY 1, 2
+    ON CONFLICT(hour, bucket) DO UPDATE SET requests = UsageLatency.requests + excluded.requests
+    """, up_to=up_to)
+    await db.execute("DELETE FROM SharedState WHERE key = ?", parameters=(mark,), commit=True)
+
+
+async def main(args):
+    # app modul darajasida sozlamalarni o'qiydi va bazani tanlaydi (DATABASE_URL yoki DB_PATH)
+    app = importlib.import_module("app")
+    await app.db.connect()
     try:
-        conn = sqlite3.connect("main.db")
-        cursor = conn.cursor()
-        
-        # Mavjud jadval strukturasini tekshirish
-        cursor.execute("PRAGMA table_info(Users)")
-        columns = [column[1] for column in cursor.fetchall()]
-        print(f"📊 Mavjud ustunlar: {columns}")
-        
-        # Agar eski ustunlar mavjud bo'lsa, ularni o'chirish
-        if 'created_at' in columns or 'updated_at' in columns:
-            print("🔄 Eski jadval strukturasini yangilash...")
-            
-            # Yangi jadval yaratish
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS Users_new (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL UNIQUE,
-                    name TEXT NOT NULL,
-                    voice TEXT DEFAULT 'women'
-                );
-            """)
-            
-            # Eski ma'lumotlarni ko'chirish
-            cursor.execute("""
-                INSERT OR IGNORE INTO Users_new (id, user_id, name, voice)
-                SELECT id, user_id, name, voice FROM Users;
-            """)
-            
-            # Eski jadvalni o'chirish
-            cursor.execute("DROP TABLE Users;")
-            
-            # Yangi jadvalni qayta nomlash
-            cursor.execute("ALTER TABLE Users_new RENAME TO Users;")
-            
-            # Index qo'shish
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_user_id ON Users(user_id);")
-            
-            conn.commit()
-            print("✅ Ma'lumotlar bazasi muvaffaqiyatli yangilandi!")
-        else:
-            print("✅ Ma'lumotlar bazasi allaqachon to'g'ri strukturada")
-            
-    except Exception as e:
-        print(f"❌ Migration xatolik: {e}")
-        conn.rollback()
+        await app.db.create_table_users()
+        if args.status:
+            for version, name, applied_at in await app.migrator.status():
+                state = time.strftime('%Y-%m-%d %H:%M', time.localtime(applied_at)) if applied_at else "kutilmoqda"
+                print(f"{version:>4}  {name:<28} {state}")
+            return
+        applied = await app.migrator.run()
+        print(f"✅ Qo'llangan migratsiyalar: {applied}")
     finally:
-        conn.close()
+        await app.db.close()
+        session = await app.bot.get_session()
+        await session.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Apply pending schema migrations")
+    parser.add_argument("--status", action="store_true", help="faqat holatni ko'rsatish")
+    return parser.parse_args(argv)
+
 
 if __name__ == "__main__":
-    migrate_database()
\ No newline at end of file
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,112 @@
+import asyncio
+import contextvars
+import time
+
+# Joriy so'rovning muddati (time.monotonic() bo'yicha); so'rov vazifasi va uning ichki vazifalari ko'radi
+_deadline = contextvars.ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """The request ran out of its overall time budget (not a failure of the stage that hit it)"""
+
+
+def remaining(default: float = None):
+    """Seconds left until the current request's deadline, capped at ``default``"""
+    deadline = _deadline.get()
+    if deadline is None:
+        return default
+    left = max(0.0, deadline - time.monotonic())
+    return left if default is None else min(default, left)
+
+
+def expired() -> bool:
+    deadline = _deadline.get()
+    return deadline is not None and time.monotonic() >= deadline
+
+
+class Request:
+    """One tracked synthesis request: its deadline and, once cancelled, the reason"""
+
+    __slots__ = ('user_id', 'started', 'deadline', 'reason', 'task')
+
+    def __init__(self, user_id: int, started: float, deadline: float):
+        self.user_id = user_id
+        self.started = started
+        self.deadline = deadline
+        self.reason = None  # 'superseded' yoki 'deadline'
+        self.task = None
+
+    @property
+    def interrupted(self):
+        """Why the request must stop (``'superseded'``/``'deadline'``), or None"""
+        if self.reason is None and time.monotonic() >= self.deadline:
+            self.reason = "deadline"
+        return self.reason
+
+    def remaining(self, default: float = None):
+        left = max(0.0, self.deadline - time.monotonic())
+        return left if default is None else min(default, left)
+
+    def cancel(self, reason: str):
+        if self.reason is None:
+            self.reason = reason
+            if self.task is not None and not self.task.done():
+                self.task.cancel()
+
+    def raise_if_cancelled(self):
+        """Call at the start of the job: a request cancelled while queued never reaches the provider"""
+        if self.interrupted is not None:
+            raise asyncio.CancelledError(self.reason)
+
+
+class RequestTracker:
+    """Per-request deadline and cancellation of a user's superseded requests.
+
+    Har bir so'rov o'z vazifasida bajariladi: muddat tugaganda yoki shu foydalanuvchidan yangi
+    xabar kelganda (``supersede``) vazifa bekor qilinadi - provayder so'rovi, yuklab olish va
+    Telegram'ga yuklash birga to'xtaydi. ``grace`` ichida kelgan xabarlar (masalan, Telegram
+    uzun matnni bo'lib yuborganda) avvalgisini bekor qilmaydi.
+    """
+
+    def __init__(self, timeout=60.0, supersede=True, grace=3.0):
+        self.timeout = timeout
+        self.supersede = supersede
+        self.grace = grace
+        self._latest = {}  # user_id -> eng so'nggi faol Request
+        self.stats = {'completed': 0, 'superseded': 0, 'deadline': 0}
+
+    def create(self, user_id: int, started: float):
+        """New request whose deadline counts from ``started`` (monotonic), so queue wait is included"""
+        return Request(user_id, started, started + self.timeout)
+
+    def activate(self, request: Request):
+        """Register ``request`` as the user's latest, cancelling the previous one if superseded"""
+        previous = self._latest.get(request.user_id)
+        if self.supersede and previous is not None and request.started - previous.started >= self.grace:
+            previous.cancel("superseded")
+        self._latest[request.user_id] = request
+
+    async def run(self, request: Request, job):
+        """Run ``job()`` in its own task under the request's deadline; cancellation is not an error"""
+        token = _deadline.set(request.deadline)
+        try:
+            request.task = asyncio.create_task(job())
+        finally:
+            _deadline.reset(token)
+        timer = asyncio.get_running_loop().call_later(
+            max(0.0, request.deadline - time.monotonic()), request.cancel, "deadline",
+        )
+        try:
+            await request.task
+        except asyncio.CancelledError:
+            # Sababsiz bekor qilish - ishchi to'xtatilmoqda, yuqoriga uzatiladi
+            if request.reason is None:
+                raise
+        finally:
+            timer.cancel()
+            if self._latest.get(request.user_id) is request:
+                del self._latest[request.user_id]
+        self.stats[request.reason or 'completed'] += 1
+
+    def summary(self):
+        return {**self.stats, 'active': len(self._latest)}
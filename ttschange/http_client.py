@@ -0,0 +1,104 @@
+import logging
+import aiohttp
+from metrics import HTTP_RESPONSES
+
+
+class HttpClient:
+    """Long-lived pooled aiohttp session shared by TTS and download calls"""
+
+    def __init__(self, limit=100, limit_per_host=20, keepalive_timeout=30, dns_cache_ttl=300,
+                 connect_timeout=5, read_timeout=30, total_timeout=None):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_cache_ttl = dns_cache_ttl
+        self.timeout = aiohttp.ClientTimeout(
+            total=total_timeout,
+            connect=connect_timeout,
+            sock_read=read_timeout,
+        )
+        self._session = None
+        self._connector = None
+
+        self.stats = {
+            'requests': 0,
+            'errors': 0,
+            'timeouts': 0,
+            'connections_created': 0,
+            'connections_reused': 0,
+        }
+
+    async def start(self):
+        """Create the connector and session (call from on_startup)"""
+        if self._session is not None and not self._session.closed:
+            return
+
+        self._connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+            ttl_dns_cache=self.dns_cache_ttl,
+            use_dns_cache=True,
+        )
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(self._on_request_start)
+        trace_config.on_request_end.append(self._on_request_end)
+        trace_config.on_request_exception.append(self._on_request_exception)
+        trace_config.on_connection_create_end.append(self._on_connection_create)
+        trace_config.on_connection_reuseconn.append(self._on_connection_reuse)
+
+        self._session = aiohttp.ClientSession(
+            connector=self._connector,
+            timeout=self.timeout,
+            trace_configs=[trace_config],
+        )
+        logging.info(f"🌐 HTTP pool ishga tushdi: limit={self.limit}, har bir host uchun={self.limit_per_host}")
+
+    async def close(self):
+        """Close the session and all pooled connections (call from on_shutdown)"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self._connector = None
+        logging.info("🌐 HTTP pool yopildi")
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            raise RuntimeError("HttpClient ishga tushirilmagan (start() chaqirilmagan)")
+        return self._session
+
+    # --- Trace hooks ---
+
+    async def _on_request_start(self, session, ctx, params):
+        self.stats['requests'] += 1
+
+    async def _on_request_end(self, session, ctx, params):
+        HTTP_RESPONSES.labels(params.url.host, params.response.status).inc()
+
+    async def _on_request_exception(self, session, ctx, params):
+        self.stats['errors'] += 1
+        if isinstance(params.exception, aiohttp.ServerTimeoutError):
+            self.stats['timeouts'] += 1
+
+    async def _on_connection_create(self, session, ctx, params):
+        self.stats['connections_created'] += 1
+
+    async def _on_connection_reuse(self, session, ctx, params):
+        self.stats['connections_reused'] += 1
+
+    # --- Statistika ---
+
+    def pool_usage(self):
+        """Current connection pool occupancy"""
+        connector = self._connector
+        if connector is None or connector.closed:
+            return {'in_use': 0, 'idle': 0, 'limit': self.limit, 'limit_per_host': self.limit_per_host}
+        # aiohttp ochiq API bermaydi, shuning uchun ichki tuzilmalardan o'qiymiz
+        in_use = len(getattr(connector, '_acquired', ()))
+        idle = sum(len(conns) for conns in getattr(connector, '_conns', {}).values())
+        return {'in_use': in_use, 'idle': idle, 'limit': self.limit, 'limit_per_host': self.limit_per_host}
+
+    def summary(self):
+        return {**self.stats, **self.pool_usage()}
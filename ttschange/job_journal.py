@@ -0,0 +1,186 @@
+import asyncio
+import logging
+import time
+import uuid
+from limiter import TokenBucket
+from sql import Database
+
+
+class JobJournal:
+    """Durable record of accepted synthesis jobs in a local SQLite file.
+
+    Navbatga qo'yilgan har bir ish jurnalga yoziladi va tugagach o'chiriladi. Jarayon to'xtatilganda
+    tugamay qolgan (yoki navbatda kutayotgan) ishlar jurnalda qoladi va keyingi ishga tushishda
+    ``replay`` orqali qayta navbatga qo'yiladi. ``boot_id`` ota jarayonda yaratiladi, shuning uchun
+    fork qilingan webhook ishchilari uni bo'lishadi - avvalgi ishga tushishdagi yozuvlarni bitta
+    (asosiy) ishchi tiklaydi. Jurnal har doim lokal SQLite (``DATABASE_URL`` dan qat'i nazar).
+
+    Yozish va o'chirish so'rov yo'lida SQL bajarmaydi: ular xotirada to'planadi va har
+    ``flush_interval`` soniyada bittadan ``executemany`` bilan yoziladi. Yozilishidan oldin tugagan
+    ish bazaga umuman tushmaydi. Buferdagi yozuvlar to'xtashda (``close``) yoziladi.
+    """
+
+    def __init__(self, path="job_journal.db", replay_rate=5.0, max_age=3600.0, flush_interval=0.5,
+                 batch_size=500):
+        self.db = Database(path_to_db=path, metrics_prefix="journal_")
+        self.boot_id = uuid.uuid4().hex
+        self.max_age = max_age
+        # Qayta tiklangan ishlar bir vaqtda navbatga tushmasligi uchun (thundering herd)
+        self.bucket = TokenBucket(rate=replay_rate, capacity=1)
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._task = None
+        self._flusher = None
+        self._flush_lock = asyncio.Lock()
+        self._adds = {}  # id -> hali yozilmagan INSERT parametrlari
+        self._removes = []  # bazadan o'chirilishi kerak bo'lgan id'lar
+        self._previous = {}  # (user_id, message_id) -> avvalgi ishga tushishdan qolgan yozuv
+        self.stats = {'journaled': 0, 'replayed': 0, 'expired': 0, 'lost': 0}
+
+    async def start(self):
+        await self.db.connect()
+        await self.db.execute("""
+        CREATE TABLE IF NOT EXISTS PendingJobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            boot_id TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            name TEXT,
+            message_id INTEGER NOT NULL,
+            placeholder_id INTEGER NOT NULL,
+            voice TEXT NOT NULL,
+            text TEXT NOT NULL,
+            created_at INTEGER NOT NULL
+        );
+        """)
+        self._previous = {(entry['user_id'], entry['message_id']): entry for entry in await self.pending()}
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    def is_pending(self, message):
+        """True if ``message`` is a journaled job from a previous run (Telegram may deliver it again)"""
+        return (message.from_user.id, message.message_id) in self._previous
+
+    async def add(self, kind: str, message, placeholder, voice: str):
+        """Journal a job about to be queued; returns its id"""
+        # id jarayonda yaratiladi (RETURNING kutilmaydi); 63 bit - fork qilingan ishchilar to'qnashmaydi
+        job_id = uuid.uuid4().int >> 65
+        self._adds[job_id] = (
+            job_id, self.boot_id, kind, message.from_user.id, message.from_user.full_name, message.message_id,
+            placeholder.message_id, voice, message.text, int(time.time()),
+        )
+        self.stats['journaled'] += 1
+        if len(self._adds) >= self.batch_size:
+            await self.flush()
+        return job_id
+
+    async def remove(self, job_id):
+        if job_id is None:
+            return
+        # Hali yozilmagan yozuv shunchaki buferdan olib tashlanadi
+        if self._adds.pop(job_id, None) is None:
+            self._removes.append(job_id)
+            if len(self._removes) >= self.batch_size:
+                await self.flush()
+
+    async def flush(self):
+        """Write buffered entries and deletions, one ``executemany`` each"""
+        async with self._flush_lock:
+            adds, self._adds = self._adds, {}
+            removes, self._removes = self._removes, []
+            if adds:
+                sql = """
+                INSERT INTO PendingJobs(id, boot_id, kind, user_id, name, message_id, placeholder_id, voice, text,
+                                        created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """
+                if await self.db.executemany(sql, adds.values()) is None:
+                    # Yozilmagan ishlar jurnalsiz bajariladi (avvalgidek); tugaganlari keyin qayta qo'shilmaydi
+                    self.stats['lost'] += len(adds)
+            if removes:
+                if await self.db.executemany("DELETE FROM PendingJobs WHERE id = ?", [(i,) for i in removes]) is None:
+                    # Keyingi urinishda qayta o'chirish uchun (aks holda ish qayta tiklanadi)
+                    self._removes[:0] = removes
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logging.error(f"Ishlar jurnalini yozishda xatolik: {e}")
+
+    async def run(self, job_id, job):
+        """Await ``job()`` and drop its entry; a job cancelled by shutdown stays journaled for replay"""
+        try:
+            await job()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            await self.remove(job_id)
+            raise
+        await self.remove(job_id)
+
+    async def pending(self):
+        """Entries left by previous runs, oldest first"""
+        sql = """
+        SELECT id, kind, user_id, name, message_id, placeholder_id, voice, text, created_at
+        FROM PendingJobs WHERE boot_id <> ? ORDER BY created_at, id
+        """
+        rows = await self.db.execute(sql, parameters=(self.boot_id,), fetchall=True) or []
+        keys = ('id', 'kind', 'user_id', 'name', 'message_id', 'placeholder_id', 'voice', 'text', 'created_at')
+        return [dict(zip(keys, row)) for row in rows]
+
+    def replay(self, submit, expire):
+        """Hand previous runs' entries to ``submit(entry)`` in the background at ``replay_rate``.
+
+        Yozuvlar ``start()`` da o'qiladi. ``max_age`` dan eski yozuvlar ``expire(entry)`` ga beriladi va
+        o'chiriladi. Yozuv qayta navbatga qo'yilishidan oldin joriy ``boot_id`` ga o'tkaziladi.
+        """
+        if self._task is None:
+            self._task = asyncio.create_task(self._replay(submit, expire))
+
+    async def _replay(self, submit, expire):
+        entries = list(self._previous.values())
+        if entries:
+            logging.info(f"♻️ Jurnaldan {len(entries)} ta tugallanmagan ish tiklanmoqda")
+        for entry in entries:
+            try:
+                if time.time() - entry['created_at'] > self.max_age:
+                    await self.remove(entry['id'])
+                    self.stats['expired'] += 1
+                    await expire(entry)
+                    continue
+                await self.db.execute(
+                    "UPDATE PendingJobs SET boot_id = ? WHERE id = ?", parameters=(self.boot_id, entry['id']), commit=True,
+                )
+                await self.bucket.acquire()
+                await submit(entry)
+                self.stats['replayed'] += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Jurnaldagi ishni tiklashda xatolik (#{entry['id']}): {e}")
+        # Tiklash tugadi - qayta yetkazilgan xabarlar endi oddiy ish sifatida qabul qilinadi
+        self._previous.clear()
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        await self.flush()
+        await self.db.close()
+
+    def summary(self):
+        return {**self.stats, 'previous': len(self._previous)}
@@ -0,0 +1,188 @@
+import asyncio
+import contextvars
+import logging
+import time
+from collections import deque
+from metrics import QUEUE_WAIT
+
+# Joriy ish egallagan ishchi o'rni (ish vazifasida va undan yaratilgan vazifalarda ko'rinadi)
+_slot = contextvars.ContextVar("job_queue_slot", default=None)
+
+
+class QueueFull(Exception):
+    """Raised when the whole queue is saturated (load shedding)"""
+
+
+class UserQueueFull(QueueFull):
+    """Raised when one user already has too many pending jobs"""
+
+
+class QueueClosed(QueueFull):
+    """Raised when the queue is draining for shutdown and takes no new jobs"""
+
+
+class JobQueue:
+    """Bounded job queue with a worker pool and round-robin fairness between users.
+
+    Har bir foydalanuvchining o'z navbati bor; ishchilar foydalanuvchilarni aylana bo'yicha
+    tanlaydi, shuning uchun bitta foydalanuvchining ko'p xabari boshqalarni to'sib qo'ymaydi.
+
+    Bir vaqtda ``workers`` ta ish bajariladi. Tashqi natijani kutayotgan ish (masalan, birlashtirilgan
+    so'rovning izdoshi) ``release_slot`` bilan o'z o'rnini navbatdagi boshqa ishga beradi va kerak
+    bo'lsa ``acquire_slot`` bilan qaytarib oladi.
+    """
+
+    def __init__(self, workers=8, max_depth=200, per_user_limit=3, wait_samples=1000):
+        self.workers = workers
+        self.max_depth = max_depth
+        self.per_user_limit = per_user_limit
+
+        self._queues = {}  # user_id -> deque[(enqueued_at, job)]
+        self._ready = deque()  # navbatida ish bor foydalanuvchilar (aylana tartibida)
+        self._depth = 0
+        self._active = 0  # ishchi o'rnini egallagan ishlar
+        self._waiting = 0  # o'rnini bo'shatib, tashqi natijani kutayotgan ishlar
+        self._available = asyncio.Semaphore(0)  # navbatdagi ishlar soni
+        self._slots = asyncio.Semaphore(workers)  # bo'sh ishchi o'rinlari
+        self._dispatcher = None
+        self._running = set()  # bajarilayotgan ish vazifalari
+        self._closed = False
+
+        self._wait_times = deque(maxlen=wait_samples)
+        self.stats = {'submitted': 0, 'completed': 0, 'failed': 0, 'shed': 0, 'max_wait': 0.0}
+
+    def start(self):
+        if self._dispatcher is None:
+            self._dispatcher = asyncio.create_task(self._dispatch())
+            logging.info(f"⚙️ Navbat ishga tushdi: {self.workers} ta ishchi, maksimal chuqurlik {self.max_depth}")
+
+    async def drain(self, timeout: float):
+        """Stop accepting jobs and wait up to ``timeout`` seconds for queued and running ones.
+
+        Muddat ichida tugamagan ishlar ``stop()`` da bekor qilinadi.
+        Returns the number of jobs still unfinished.
+        """
+        self._closed = True
+        deadline = time.monotonic() + timeout
+        while (self._depth or self._running) and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        left = self._depth + len(self._running)
+        if left:
+            logging.warning(f"⚠️ Navbat to'liq bo'shamadi: {left} ta ish tugallanmadi")
+        return left
+
+    async def stop(self):
+        tasks = [*self._running]
+        if self._dispatcher is not None:
+            tasks.append(self._dispatcher)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._dispatcher = None
+
+    @property
+    def depth(self):
+        return self._depth
+
+    @property
+    def active(self):
+        return self._active
+
+    def submit(self, user_id: int, job):
+        """Enqueue ``job`` (a zero-argument coroutine function) for ``user_id``"""
+        if self._closed:
+            raise QueueClosed()
+        if self._depth >= self.max_depth:
+            self.stats['shed'] += 1
+            raise QueueFull()
+
+        queue = self._queues.get(user_id)
+        if queue is None:
+            queue = self._queues[user_id] = deque()
+            self._ready.append(user_id)
+        elif len(queue) >= self.per_user_limit:
+            self.stats['shed'] += 1
+            raise UserQueueFull()
+
+        queue.append((time.monotonic(), job))
+        self._depth += 1
+        self.stats['submitted'] += 1
+        self._available.release()
+
+    def _next_job(self):
+        user_id = self._ready.popleft()
+        queue = self._queues[user_id]
+        enqueued_at, job = queue.popleft()
+        if queue:
+            self._ready.append(user_id)
+        else:
+            del self._queues[user_id]
+        self._depth -= 1
+        return enqueued_at, job
+
+    def release_slot(self):
+        """Give the current job's worker slot to the next queued job while it waits on something else"""
+        slot = _slot.get()
+        if slot is not None and slot['held']:
+            slot['held'] = False
+            self._active -= 1
+            self._waiting += 1
+            self._slots.release()
+
+    async def acquire_slot(self):
+        """Take a worker slot back after ``release_slot`` (waits like any queued job would)"""
+        slot = _slot.get()
+        if slot is not None and not slot['held']:
+            await self._slots.acquire()
+            slot['held'] = True
+            self._waiting -= 1
+            self._active += 1
+
+    async def _dispatch(self):
+        while True:
+            await self._available.acquire()
+            await self._slots.acquire()
+            enqueued_at, job = self._next_job()
+
+            wait = time.monotonic() - enqueued_at
+            self._wait_times.append(wait)
+            QUEUE_WAIT.observe(wait)
+            if wait > self.stats['max_wait']:
+                self.stats['max_wait'] = wait
+
+            self._active += 1
+            task = asyncio.create_task(self._run(job))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run(self, job):
+        slot = {'held': True}
+        _slot.set(slot)
+        try:
+            await job()
+            self.stats['completed'] += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.stats['failed'] += 1
+            logging.error(f"Navbatdagi ishni bajarishda xatolik: {e}")
+        finally:
+            if slot['held']:
+                self._active -= 1
+                self._slots.release()
+            else:
+                self._waiting -= 1
+
+    def summary(self):
+        waits = sorted(self._wait_times)
+        p50 = waits[len(waits) // 2] if waits else 0.0
+        p95 = waits[min(len(waits) - 1, int(len(waits) * 0.95))] if waits else 0.0
+        return {
+            **self.stats,
+            'depth': self._depth,
+            'active': self._active,
+            'waiting': self._waiting,
+            'users_waiting': len(self._queues),
+            'wait_p50': p50,
+            'wait_p95': p95,
+        }
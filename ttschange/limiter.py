@@ -0,0 +1,136 @@
+import asyncio
+import time
+from typing import NamedTuple
+
+
+class TokenBucket:
+    """Token bucket: ``rate`` tokens per second, bursts up to ``capacity``"""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+
+    def _refill(self, now):
+        elapsed = now - self._updated
+        if elapsed > 0:
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+            self._updated = now
+
+    def try_acquire(self, cost: float = 1) -> bool:
+        """Take tokens if available right now"""
+        now = time.monotonic()
+        if now < self._paused_until:
+            return False
+        self._refill(now)
+        if self._tokens >= cost:
+            self._tokens -= cost
+            return True
+        return False
+
+    async def acquire(self, cost: float = 1):
+        """Wait until tokens are available and take them"""
+        while True:
+            now = time.monotonic()
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+            self._refill(now)
+            if self._tokens >= cost:
+                self._tokens -= cost
+                return
+            await asyncio.sleep((cost - self._tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """Stop handing out tokens for ``seconds`` (e.g. after Telegram RetryAfter)"""
+        now = time.monotonic()
+        self._paused_until = max(self._paused_until, now + seconds)
+        self._tokens = 0
+        self._updated = self._paused_until
+
+    def set_rate(self, rate: float):
+        self._refill(time.monotonic())
+        self.rate = rate
+
+
+class Limit(NamedTuple):
+    """One token-bucket dimension: ``rate`` tokens per second, bursts up to ``capacity``"""
+
+    rate: float
+    capacity: float
+
+    @classmethod
+    def per_minute(cls, amount: float, burst: float = None):
+        return cls(rate=amount / 60, capacity=burst if burst is not None else amount)
+
+    @property
+    def refill_seconds(self):
+        """Time for an empty bucket to become full (an idle entry older than this is redundant)"""
+        return self.capacity / self.rate if self.rate else 0.0
+
+
+class MemoryBucketStore:
+    """Multi-dimension token buckets for many keys, kept in one dict of tuples.
+
+    Har bir kalit uchun ``(updated, idle_at, tokens1, tokens2, ...)`` kortej saqlanadi.
+    ``idle_at`` dan keyin yozuv to'liq chelak bilan bir xil - ``sweep`` uni yo'qotishsiz o'chiradi.
+    """
+
+    def __init__(self, sweep_interval=60.0):
+        self.sweep_interval = sweep_interval
+        self._buckets = {}  # key -> (updated, idle_at, *tokens)
+        self._swept_at = time.monotonic()
+        self.stats = {'evicted': 0}
+
+    def __len__(self):
+        return len(self._buckets)
+
+    @staticmethod
+    def _refilled(state, limits, now):
+        if state is None:
+            return [limit.capacity for limit in limits]
+        elapsed = max(0.0, now - state[0])
+        return [min(limit.capacity, tokens + elapsed * limit.rate) for tokens, limit in zip(state[2:], limits)]
+
+    async def take(self, requests):
+        """Atomically take ``costs`` from every ``(key, limits, costs)``.
+
+        ``(0, None)`` - ruxsat; aks holda ``(kutish soniyalari, cheklagan kalit)``, hech narsa olinmaydi.
+        So'rov narxi chelak sig'imidan oshsa, sig'imgacha kamaytiriladi.
+        """
+        now = time.monotonic()
+        refilled = []
+        wait, blocked = 0.0, None
+        for key, limits, costs in requests:
+            tokens = self._refilled(self._buckets.get(key), limits, now)
+            for available, limit, cost in zip(tokens, limits, costs):
+                cost = min(cost, limit.capacity)
+                if available < cost and (cost - available) / limit.rate > wait:
+                    wait, blocked = (cost - available) / limit.rate, key
+            refilled.append(tokens)
+
+        if not wait:
+            for (key, limits, costs), tokens in zip(requests, refilled):
+                left = [available - min(cost, limit.capacity) for available, limit, cost in zip(tokens, limits, costs)]
+                self._buckets[key] = (now, now + max(limit.refill_seconds for limit in limits), *left)
+
+        if now - self._swept_at >= self.sweep_interval:
+            self.sweep(now)
+        return wait, blocked
+
+    def sweep(self, now=None):
+        """Drop entries idle long enough to have refilled completely"""
+        now = time.monotonic() if now is None else now
+        self._swept_at = now
+        stale = [key for key, state in self._buckets.items() if state[1] <= now]
+        for key in stale:
+            del self._buckets[key]
+        self.stats['evicted'] += len(stale)
+
+    def summary(self):
+        return {**self.stats, 'tracked': len(self._buckets)}
+
+    async def close(self):
+        pass
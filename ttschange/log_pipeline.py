@@ -0,0 +1,153 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import multiprocessing.util
+import os
+import queue
+
+# Ko'p takrorlanadigan (har bir xabardagi) yozuvlar uchun: logging.info("...", x, extra=SAMPLED)
+SAMPLED = {'sampled': True}
+
+TEXT_FORMAT = "%(levelname)s:%(name)s:%(message)s"
+
+
+class SamplingFilter(logging.Filter):
+    """Pass only every ``every``-th record marked with ``extra=SAMPLED``, counted per message template.
+
+    Kechiktirilgan formatlash (``"... %s", x``) tufayli ``record.msg`` o'zgarmas shablon bo'ladi,
+    shuning uchun hisoblagichlar soni shablonlar soni bilan cheklangan. WARNING va undan
+    yuqori darajalar hech qachon tashlanmaydi.
+    """
+
+    def __init__(self, every=100):
+        super().__init__()
+        self.every = every
+        self._counts = {}
+        self.dropped = 0
+
+    def filter(self, record):
+        if self.every <= 1 or record.levelno >= logging.WARNING or not getattr(record, 'sampled', False):
+            return True
+        count = self._counts.get(record.msg, 0)
+        self._counts[record.msg] = count + 1
+        if count % self.every == 0:
+            record.sample_rate = self.every
+            return True
+        self.dropped += 1
+        return False
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, msg plus any ``extra`` fields"""
+
+    _RESERVED = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {'message', 'asctime', 'sampled'}
+
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        entry.update((key, value) for key, value in vars(record).items() if key not in self._RESERVED)
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that leaves all formatting to the writer thread.
+
+    Standart ``QueueHandler.prepare`` xabarni chaqiruvchi oqimda (event loop'da) formatlaydi -
+    bu yerda yozuv o'zgarishsiz navbatga qo'yiladi. Navbat to'lsa yozuv tashlanadi, loop bloklanmaydi.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogPipeline:
+    """Root logging setup: sync handler or a bounded queue drained by a background writer thread.
+
+    ``mode="queue"`` da event loop faqat yozuvni navbatga qo'yadi; formatlash va I/O alohida
+    oqimda bajariladi. Fork qilingan ishchilarda (webhook) yozuvchi oqim qayta ishga tushiriladi.
+    """
+
+    def __init__(self, level="INFO", mode="queue", fmt="text", sample_every=100, queue_size=10_000, filename=None):
+        self.level = level
+        self.mode = mode
+        self.fmt = fmt
+        self.sample_every = sample_every
+        self.queue_size = queue_size
+        self.filename = filename
+
+        self.sampler = SamplingFilter(sample_every)
+        self.handler = None
+        self._target = None
+        self._listener = None
+
+    def install(self):
+        """Replace the root logger's handlers with this pipeline"""
+        target = logging.FileHandler(self.filename, encoding="utf-8") if self.filename else logging.StreamHandler()
+        target.setFormatter(JsonFormatter() if self.fmt == "json" else logging.Formatter(TEXT_FORMAT))
+        self._target = target
+
+        if self.mode == "queue":
+            self.handler = DeferredQueueHandler(queue.Queue(self.queue_size))
+            self._start_listener()
+            atexit.register(self.stop)
+            os.register_at_fork(after_in_child=self._after_fork)
+            multiprocessing.util.register_after_fork(self, LogPipeline._register_finalizer)
+        else:
+            self.handler = target
+        self.handler.addFilter(self.sampler)
+
+        root = logging.getLogger()
+        for handler in root.handlers[:]:
+            root.removeHandler(handler)
+        root.addHandler(self.handler)
+        root.setLevel(self.level)
+        return self
+
+    def _start_listener(self):
+        self._listener = logging.handlers.QueueListener(self.handler.queue, self._target)
+        self._listener.start()
+
+    def _after_fork(self):
+        # Ota jarayonning yozuvchi oqimi fork'dan keyin mavjud emas - yangi navbat va oqim
+        self.handler.queue = queue.Queue(self.queue_size)
+        self._start_listener()
+
+    def _register_finalizer(self):
+        # multiprocessing ishchisi os._exit bilan tugaydi (atexit ishlamaydi) - navbat finalizer bilan yoziladi
+        multiprocessing.util.Finalize(self, self.stop, exitpriority=0)
+
+    def stop(self):
+        """Flush queued records and stop the writer thread"""
+        if self._listener is not None:
+            listener, self._listener = self._listener, None
+            try:
+                listener.stop()
+            except queue.Full:
+                pass
+        if self._target is not None:
+            self._target.flush()
+
+    def summary(self):
+        return {
+            'mode': self.mode,
+            'queued': self.handler.queue.qsize() if self._listener is not None else 0,
+            'dropped': getattr(self.handler, 'dropped', 0),
+            'sampled_out': self.sampler.dropped,
+        }
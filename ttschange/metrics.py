@@ -0,0 +1,269 @@
+import asyncio
+import functools
+import logging
+import time
+from aiohttp import web
+
+# Kechikishlar uchun standart chegaralar (soniya)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Audio hajmi uchun chegaralar (bayt)
+SIZE_BUCKETS = (4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ""
+    body = ",".join(f'{name}="{_escape(value)}"' for name, value in pairs)
+    return "{" + body + "}"
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def labels(self, *values, **kwargs):
+        if kwargs:
+            values = tuple(kwargs[name] for name in self.labelnames)
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            child = self._children[key] = self._new_child()
+        return child
+
+    def _default(self):
+        return self.labels()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in sorted(self._children.items()):
+            lines.extend(child.render(self.name, self.labelnames, key))
+        return lines
+
+
+class _Value:
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount=1.0):
+        self.value += amount
+
+    def set(self, value):
+        self.value = value
+
+    def render(self, name, labelnames, key):
+        return [f"{name}{_format_labels(labelnames, key)} {self.value}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1.0):
+        self._default().inc(amount)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _Value()
+
+    def set(self, value):
+        self._default().set(value)
+
+
+class _HistogramValue:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # oxirgisi +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                return
+        self.counts[-1] += 1
+
+    def quantile(self, q):
+        """Estimate a quantile by linear interpolation inside the matching bucket"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for i, bound in enumerate(self.buckets):
+            if seen + self.counts[i] >= rank:
+                fraction = (rank - seen) / self.counts[i] if self.counts[i] else 0.0
+                return lower + (bound - lower) * fraction
+            seen += self.counts[i]
+            lower = bound
+        return self.buckets[-1]
+
+    def render(self, name, labelnames, key):
+        lines = []
+        cumulative = 0
+        for bound, count in zip((*self.buckets, "+Inf"), self.counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{_format_labels(labelnames, key, [('le', bound)])} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(labelnames, key)} {self.sum}")
+        lines.append(f"{name}_count{_format_labels(labelnames, key)} {self.count}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS, registry=None):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self._default().observe(value)
+
+
+class Registry:
+    """Metric registry rendered in Prometheus text exposition format"""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+
+    def add_collector(self, collector):
+        """Register a callback run before every scrape (e.g. to refresh gauges)"""
+        self._collectors.append(collector)
+
+    def collect(self):
+        for collector in self._collectors:
+            try:
+                collector()
+            except Exception as e:
+                logging.error(f"Metrika yig'ishda xatolik: {e}")
+
+    def render(self):
+        self.collect()
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# --- Bot metrikalari ---
+
+REQUESTS = Counter("tts_bot_stage_total", "Stage executions by outcome", ("stage", "outcome"))
+STAGE_LATENCY = Histogram("tts_bot_stage_seconds", "Per-stage latency of the text pipeline", ("stage",))
+PROVIDER_RESPONSES = Counter("tts_bot_provider_responses_total", "Provider HTTP responses by status code", ("provider", "status"))
+PROVIDER_ATTEMPTS = Counter("tts_bot_provider_attempts_total", "Routed synthesis attempts by outcome", ("provider", "outcome"))
+HTTP_RESPONSES = Counter("tts_bot_http_responses_total", "Outgoing HTTP responses by host and status", ("host", "status"))
+AUDIO_BYTES = Histogram("tts_bot_audio_bytes", "Size of synthesized audio payloads", ("source",), buckets=SIZE_BUCKETS)
+DB_QUERY_LATENCY = Histogram("tts_bot_db_query_seconds", "Database query latency", ("op",))
+LOOP_LAG = Histogram("tts_bot_event_loop_lag_seconds", "Event loop scheduling lag", buckets=LATENCY_BUCKETS)
+QUEUE_DEPTH = Gauge("tts_bot_queue_depth", "Jobs waiting in the synthesis queue")
+QUEUE_ACTIVE = Gauge("tts_bot_queue_active", "Jobs currently being processed")
+QUEUE_WAIT = Histogram("tts_bot_queue_wait_seconds", "Time jobs spend waiting in the queue")
+TRANSCODE_BYTES = Counter("tts_bot_transcode_bytes_total", "Audio bytes before (in) and after (out) transcoding", ("direction",))
+THROTTLED = Counter("tts_bot_throttled_total", "Messages rejected by rate limits", ("scope",))
+GAUGES = Gauge("tts_bot_component", "Component counters exported from in-process summaries", ("component", "key"))
+
+
+class timed:
+    """Time a pipeline stage; usable as ``with timed("tts"):`` or ``@timed("tts")``"""
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        STAGE_LATENCY.labels(self.stage).observe(time.perf_counter() - self._started)
+        REQUESTS.labels(self.stage, "ok" if exc_type is None else "error").inc()
+        return False
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with timed(self.stage):
+                return await func(*args, **kwargs)
+        return wrapper
+
+
+def export_summary(component, summary):
+    """Expose numeric values of a ``summary()`` dict as gauges"""
+    for key, value in summary.items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            GAUGES.labels(component, key).set(value)
+
+
+def stage_summary():
+    """Per-stage (count, p50, p95) for a quick /stat overview"""
+    return {
+        key[0]: (child.count, child.quantile(0.5), child.quantile(0.95))
+        for key, child in sorted(STAGE_LATENCY._children.items())
+    }
+
+
+async def monitor_loop_lag(interval=0.5):
+    """Measure how late the event loop wakes us up (time spent blocked by other work)"""
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        LOOP_LAG.observe(max(0.0, loop.time() - started - interval))
+
+
+class MetricsServer:
+    """Local HTTP endpoint serving ``/metrics`` plus the event loop lag monitor"""
+
+    def __init__(self, host="127.0.0.1", port=9100, registry=REGISTRY):
+        self.host = host
+        self.port = port
+        self.registry = registry
+        self._runner = None
+        self._lag_task = None
+
+    async def _handle(self, request):
+        return web.Response(text=self.registry.render(), content_type="text/plain", charset="utf-8")
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self._lag_task = asyncio.create_task(monitor_loop_lag())
+        logging.info(f"📈 Metrikalar: http://{self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        if self._lag_task is not None:
+            self._lag_task.cancel()
+            self._lag_task = None
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
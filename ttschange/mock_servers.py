@@ -0,0 +1,197 @@
+import asyncio
+import itertools
+import random
+import time
+from aiohttp import web
+
+
+class _MockServer:
+    """Local aiohttp server bound to a free port on 127.0.0.1"""
+
+    def __init__(self):
+        self.app = web.Application()
+        self.port = None
+        self._runner = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    async def start(self):
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+class MockPlayHT(_MockServer):
+    """Stand-in for play.ht ``/api/transcribe``.
+
+    ``mode='audio'`` - audio to'g'ridan-to'g'ri javob tanasida qaytadi,
+    ``mode='json'`` - ``{"file": url}`` qaytadi va audio alohida GET bilan yuklab olinadi.
+    """
+
+    def __init__(self, latency=0.3, jitter=0.1, error_rate=0.0, mode="audio", bytes_per_char=400):
+        super().__init__()
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.mode = mode
+        self.bytes_per_char = bytes_per_char
+        self.stats = {'requests': 0, 'errors': 0, 'downloads': 0, 'bytes': 0}
+        self._files = {}
+        self._ids = itertools.count(1)
+
+        self.app.router.add_post("/api/transcribe", self._transcribe)
+        self.app.router.add_get("/files/{name}", self._download)
+
+    @property
+    def url(self):
+        return f"{self.base_url}/api/transcribe"
+
+    def _audio(self, text):
+        return bytes(max(1024, len(text) * self.bytes_per_char))
+
+    async def _transcribe(self, request):
+        self.stats['requests'] += 1
+        data = await request.json()
+        await asyncio.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+
+        if random.random() < self.error_rate:
+            self.stats['errors'] += 1
+            return web.Response(status=500, text="mock: internal error")
+
+        audio = self._audio(data.get("ssml", ""))
+        self.stats['bytes'] += len(audio)
+        if self.mode == "json":
+            name = f"{next(self._ids)}.mp3"
+            self._files[name] = audio
+            return web.json_response({"file": f"{self.base_url}/files/{name}"})
+        return web.Response(body=audio, content_type="audio/mpeg")
+
+    async def _download(self, request):
+        audio = self._files.pop(request.match_info["name"], None)
+        if audio is None:
+            return web.Response(status=404)
+        self.stats['downloads'] += 1
+        return web.Response(body=audio, content_type="audio/mpeg")
+
+
+class MockTelegram(_MockServer):
+    """Stand-in for the Bot API: answers every method and records what the bot sent.
+
+    ``expect(message_id)`` foydalanuvchi xabariga yakuniy javob (ovozli xabar yoki xatolik matni)
+    kelishini kutadi - benchmark shu orqali uchdan-uchgacha kechikishni o'lchaydi.
+    """
+
+    # Yakuniy javob matnining birinchi belgisi -> natija (qolganlari "error")
+    OUTCOMES = {"⏳": "rejected", "😔": "rejected", "⏭": "superseded", "⌛": "deadline"}
+
+    def __init__(self, latency=0.01, flood_rate=0.0, blocked_rate=0.0, username="bench_tts_bot", admin_id=1):
+        super().__init__()
+        self.latency = latency
+        self.flood_rate = flood_rate
+        self.blocked_rate = blocked_rate
+        self.username = username
+        self.admin_id = admin_id  # admin chatiga sun'iy xatoliklar qo'llanilmaydi
+        self.stats = {'requests': 0, 'flood': 0, 'blocked': 0, 'uploaded_bytes': 0}
+        self.calls = {}  # method -> soni
+        self.sent = []  # (monotonic vaqt, chat_id) - reply bo'lmagan sendMessage'lar
+
+        self._ids = itertools.count(1_000_000)
+        self._placeholders = {}  # placeholder message_id -> foydalanuvchi xabari id si
+        self._waiters = {}  # foydalanuvchi xabari id si -> Future(outcome)
+
+        self.app.router.add_post("/bot{token}/{method}", self._handle)
+
+    def expect(self, message_id):
+        """Register interest in the final reply to ``message_id`` (call before dispatching it)"""
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[message_id] = future
+        return future
+
+    def _resolve(self, message_id, outcome):
+        future = self._waiters.pop(message_id, None)
+        if future is not None and not future.done():
+            future.set_result((time.monotonic(), outcome))
+
+    def _message(self, chat_id, **extra):
+        return {
+            'message_id': next(self._ids),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            **extra,
+        }
+
+    @staticmethod
+    def _error(code, description, **parameters):
+        body = {'ok': False, 'error_code': code, 'description': description}
+        if parameters:
+            body['parameters'] = parameters
+        return web.json_response(body, status=code)
+
+    async def _handle(self, request):
+        method = request.match_info["method"]
+        self.stats['requests'] += 1
+        self.calls[method] = self.calls.get(method, 0) + 1
+        form = await request.post()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        result = self._dispatch(method, form)
+        if isinstance(result, web.Response):
+            return result
+        return web.json_response({'ok': True, 'result': result})
+
+    def _dispatch(self, method, form):
+        if method == "getMe":
+            return {'id': 1, 'is_bot': True, 'first_name': "Bench", 'username': self.username}
+
+        chat_id = int(form.get("chat_id", 0) or 0)
+        reply_to = int(form.get("reply_to_message_id", 0) or 0)
+
+        if method == "sendMessage":
+            if not reply_to and chat_id != self.admin_id:
+                if random.random() < self.flood_rate:
+                    self.stats['flood'] += 1
+                    return self._error(429, "Too Many Requests: retry after 1", retry_after=1)
+                if random.random() < self.blocked_rate:
+                    self.stats['blocked'] += 1
+                    return self._error(403, "Forbidden: bot was blocked by the user")
+                self.sent.append((time.monotonic(), chat_id))
+            message = self._message(chat_id, text=form.get("text", ""))
+            if reply_to:
+                self._placeholders[message['message_id']] = reply_to
+            return message
+
+        if method == "sendVoice":
+            voice = form.get("voice")
+            if isinstance(voice, web.FileField):
+                self.stats['uploaded_bytes'] += len(voice.file.read())
+            message = self._message(chat_id, voice={
+                'file_id': f"voice-{next(self._ids)}",
+                'file_unique_id': f"u{next(self._ids)}",
+                'duration': 1,
+            })
+            self._resolve(reply_to, "ok")
+            return message
+
+        if method == "editMessageText":
+            message_id = int(form.get("message_id", 0) or 0)
+            text = form.get("text", "")
+            # "🔄 ..." - oraliq holat; boshqa matn - foydalanuvchiga yakuniy xatolik/rad javobi
+            if message_id in self._placeholders and not text.startswith("🔄"):
+                self._resolve(self._placeholders[message_id], self.OUTCOMES.get(text[:1], "error"))
+            return self._message(chat_id, text=text)
+
+        if method == "deleteMessage":
+            self._placeholders.pop(int(form.get("message_id", 0) or 0), None)
+            return True
+
+        return True
@@ -0,0 +1,109 @@
+import asyncio
+import logging
+import os
+from audio_cache import make_key, normalize_text
+
+
+class PhraseLibrary:
+    """Pre-uploaded voice clips for popular short phrases (``warmup.py`` fills it).
+
+    Diskda ``ovoz<TAB>file_id<TAB>matn`` qatorlari; xotirada 16 baytlik kalit -> file_id
+    lug'ati. ``max_chars`` dan uzun matnlar uchun hash ham hisoblanmaydi. Fayl o'zgarsa
+    (warm-up qayta ishga tushganda) ``reload_interval`` da qayta o'qiladi.
+    """
+
+    def __init__(self, path="phrase_index.tsv", max_chars=64, reload_interval=60.0):
+        self.path = path
+        self.max_chars = max_chars
+        self.reload_interval = reload_interval
+
+        self._file_ids = {}  # 16 baytlik kalit -> file_id
+        self._entries = {}  # (ovoz, matn) -> file_id, faqat save() uchun
+        self._mtime = None
+        self._task = None
+
+        self.stats = {'hits': 0, 'forgotten': 0}
+
+    def __len__(self):
+        return len(self._file_ids)
+
+    @staticmethod
+    def _key(voice, text):
+        return bytes.fromhex(make_key(voice, text))[:16]
+
+    def load(self):
+        """Read the index file (missing file means an empty library)"""
+        try:
+            mtime = os.stat(self.path).st_mtime
+            with open(self.path, encoding="utf-8") as f:
+                lines = f.read().splitlines()
+        except FileNotFoundError:
+            return
+        except OSError as e:
+            logging.error(f"❌ Iboralar indeksini o'qishda xatolik: {e}")
+            return
+
+        entries = {}
+        for line in lines:
+            parts = line.split("\t", 2)
+            if len(parts) == 3 and not line.startswith("#"):
+                voice, file_id, text = parts
+                entries[(voice, text)] = file_id
+        self._entries = entries
+        self._file_ids = {self._key(voice, text): file_id for (voice, text), file_id in entries.items()}
+        self._mtime = mtime
+        logging.info(f"📚 Iboralar indeksi yuklandi: {len(entries)} ta")
+
+    def save(self):
+        """Atomically rewrite the index file"""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for (voice, text), file_id in sorted(self._entries.items()):
+                f.write(f"{voice}\t{file_id}\t{text}\n")
+        os.replace(tmp_path, self.path)
+        self._mtime = os.stat(self.path).st_mtime
+
+    def get(self, voice: str, text: str):
+        if len(text) > self.max_chars or not self._file_ids:
+            return None
+        file_id = self._file_ids.get(self._key(voice, text))
+        if file_id is not None:
+            self.stats['hits'] += 1
+        return file_id
+
+    def put(self, voice: str, text: str, file_id: str):
+        self._entries[(voice, normalize_text(text))] = file_id
+        self._file_ids[self._key(voice, text)] = file_id
+
+    def forget(self, voice: str, text: str):
+        """Drop a file_id Telegram no longer accepts (until the next warm-up)"""
+        if self._file_ids.pop(self._key(voice, text), None) is not None:
+            self._entries.pop((voice, normalize_text(text)), None)
+            self.stats['forgotten'] += 1
+
+    def start(self):
+        if self._task is None and self.reload_interval:
+            self._task = asyncio.create_task(self._reload_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _reload_loop(self):
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            try:
+                if os.stat(self.path).st_mtime != self._mtime:
+                    await asyncio.get_running_loop().run_in_executor(None, self.load)
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                logging.error(f"Iboralar indeksini yangilashda xatolik: {e}")
+
+    def summary(self):
+        return {**self.stats, 'phrases': len(self._file_ids)}
@@ -0,0 +1,334 @@
+import re
+import time
+import logging
+import asyncpg
+from sql import Database, query_op, sql_log
+from metrics import DB_QUERY_LATENCY
+
+_PLACEHOLDER = re.compile(r"\?")
+
+
+def to_postgres(sql: str) -> str:
+    """Convert SQLite ``?`` placeholders to PostgreSQL ``$1, $2, ...``"""
+    counter = iter(range(1, 10_000))
+    return _PLACEHOLDER.sub(lambda _: f"${next(counter)}", sql)
+
+
+class PostgresDatabase(Database):
+    """PostgreSQL backend behind the same async interface as ``Database``"""
+
+    dialect = "postgres"
+
+    def __init__(self, dsn: str, min_size=1, max_size=10, trace_sql=False):
+        self.dsn = dsn
+        self.trace_sql = trace_sql
+        if trace_sql:
+            sql_log.setLevel(logging.DEBUG)
+        self.min_size = min_size
+        self.max_size = max_size
+        self.path_to_db = None
+        self._pool = None
+
+    async def connect(self):
+        """Create the connection pool (idempotent)"""
+        if self._pool is None:
+            self._pool = await asyncpg.create_pool(self.dsn, min_size=self.min_size, max_size=self.max_size)
+            logging.info(f"📊 PostgreSQL ga ulanildi (pool: {self.min_size}-{self.max_size})")
+
+    async def close(self):
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+
+    @staticmethod
+    def _rowcount(status: str):
+        # asyncpg "INSERT 0 1" / "UPDATE 3" ko'rinishidagi status qaytaradi
+        try:
+            return int(status.split()[-1])
+        except (ValueError, IndexError, AttributeError):
+            return -1
+
+    async def execute(self, sql: str, parameters: tuple = None, fetchone=False, fetchall=False, commit=False):
+        """Execute SQL query on a pooled connection"""
+        if parameters is None:
+            parameters = ()
+        if self._pool is None:
+            await self.connect()
+        if self.trace_sql:
+            sql_log.debug("[SQL] %s %r", sql, parameters)
+
+        started = time.perf_counter()
+        try:
+            async with self._pool.acquire() as connection:
+                if fetchall:
+                    return await connection.fetch(to_postgres(sql), *parameters)
+                if fetchone:
+                    return await connection.fetchrow(to_postgres(sql), *parameters)
+                return self._rowcount(await connection.execute(to_postgres(sql), *parameters))
+        except asyncpg.PostgresError as e:
+            logging.error(f"SQL xatolik: {e}")
+            return None
+        finally:
+            DB_QUERY_LATENCY.labels(query_op(sql)).observe(time.perf_counter() - started)
+
+    async def executemany(self, sql: str, seq_of_parameters):
+        """Execute one statement for many parameter sets in a single transaction"""
+        seq_of_parameters = list(seq_of_parameters)
+        if not seq_of_parameters:
+            return 0
+        if self._pool is None:
+            await self.connect()
+        if self.trace_sql:
+            sql_log.debug("[SQL] %s (x%d)", sql, len(seq_of_parameters))
+
+        started = time.perf_counter()
+        try:
+            async with self._pool.acquire() as connection:
+                async with connection.transaction():
+                    await connection.executemany(to_postgres(sql), seq_of_parameters)
+            return len(seq_of_parameters)
+        except asyncpg.PostgresError as e:
+            logging.error(f"SQL xatolik: {e}")
+            return None
+        finally:
+            DB_QUERY_LATENCY.labels(f"{query_op(sql)}_MANY").observe(time.perf_counter() - started)
+
+    async def execute_transaction(self, statements):
+        """Run ``[(sql, parameters), ...]`` atomically; returns True, or None on error"""
+        if self._pool is None:
+            await self.connect()
+        try:
+            async with self._pool.acquire() as connection:
+                async with connection.transaction():
+                    for sql, parameters in statements:
+                        await connection.execute(to_postgres(sql), *(parameters or ()))
+            return True
+        except asyncpg.PostgresError as e:
+            logging.error(f"SQL xatolik: {e}")
+            return None
+
+    async def executemany_transaction(self, batches):
+        """Run ``[(sql, seq_of_parameters), ...]`` as one transaction; returns True, or None on error"""
+        if self._pool is None:
+            await self.connect()
+        try:
+            async with self._pool.acquire() as connection:
+                async with connection.transaction():
+                    for sql, seq_of_parameters in batches:
+                        seq_of_parameters = list(seq_of_parameters)
+                        if seq_of_parameters:
+                            await connection.executemany(to_postgres(sql), seq_of_parameters)
+            return True
+        except asyncpg.PostgresError as e:
+            logging.error(f"SQL xatolik: {e}")
+            return None
+
+    async def create_table_users(self):
+        """Create users table if not exists"""
+        sql = """
+        CREATE TABLE IF NOT EXISTS Users (
+            id BIGSERIAL PRIMARY KEY,
+            user_id BIGINT NOT NULL UNIQUE,
+            name TEXT NOT NULL,
+            voice TEXT DEFAULT 'women',
+            created_at BIGINT
+        );
+        """
+
+        try:
+            await self.execute(sql, commit=True)
+            logging.info("📊 Users jadvali muvaffaqiyatli yaratildi")
+            return True
+        except Exception as e:
+            logging.error(f"Jadval yaratishda xatolik: {e}")
+            return False
+
+    async def table_columns(self, table: str):
+        """Column names of ``table`` (empty if the table does not exist)"""
+        sql = "SELECT column_name FROM information_schema.columns WHERE table_name = ?"
+        # Qo'shtirnoqsiz nomlar PostgreSQL'da kichik harfga o'tkaziladi
+        rows = await self.execute(sql, parameters=(table.lower(),), fetchall=True) or []
+        return [row[0] for row in rows]
+
+    async def ensure_column(self, table: str, column: str, definition: str):
+        """Add a column to an existing table if it is missing"""
+        await self.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} {definition}", commit=True)
+
+    async def create_table_broadcasts(self):
+        """Create broadcasts table (persisted /send progress and cursor)"""
+        sql = """
+        CREATE TABLE IF NOT EXISTS Broadcasts (
+            id BIGSERIAL PRIMARY KEY,
+            chat_id BIGINT NOT NULL,
+            message_id BIGINT,
+            text TEXT NOT NULL,
+            last_id BIGINT DEFAULT 0,
+            total INTEGER DEFAULT 0,
+            success INTEGER DEFAULT 0,
+            failed INTEGER DEFAULT 0,
+            blocked INTEGER DEFAULT 0,
+            status TEXT DEFAULT 'running'
+        );
+        """
+        try:
+            await self.execute(sql, commit=True)
+            return True
+        except Exception as e:
+            logging.error(f"Jadval yaratishda xatolik: {e}")
+            return False
+
+    USAGE_ROLLUP_TABLES = (
+        """
+        CREATE TABLE IF NOT EXISTS UsageDaily (
+            day INTEGER PRIMARY KEY,
+            users BIGINT NOT NULL DEFAULT 0,
+            requests BIGINT NOT NULL DEFAULT 0,
+            chars BIGINT NOT NULL DEFAULT 0,
+            cache_hits BIGINT NOT NULL DEFAULT 0
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS UsageDayUsers (
+            day INTEGER NOT NULL,
+            user_id BIGINT NOT NULL,
+            PRIMARY KEY (day, user_id)
+        );
+        """,
+        """
+        CREATE OR REPLACE FUNCTION usage_day_users_trigger() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO UsageDaily(day, users) VALUES (NEW.day, 1)
+            ON CONFLICT (day) DO UPDATE SET users = UsageDaily.users + 1;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+        """,
+        """
+        DO $$
+        BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'trg_usage_day_users') THEN
+                CREATE TRIGGER trg_usage_day_users AFTER INSERT ON UsageDayUsers
+                FOR EACH ROW EXECUTE FUNCTION usage_day_users_trigger();
+            END IF;
+        END
+        $$;
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS UsageLatency (
+            hour INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,
+            requests BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (hour, bucket)
+        );
+        """,
+    )
+
+    async def create_table_usage(self):
+        """Create synthesis events table (usage log)"""
+        sql = """
+        CREATE TABLE IF NOT EXISTS SynthesisEvents (
+            id BIGSERIAL PRIMARY KEY,
+            user_id BIGINT NOT NULL,
+            created_at BIGINT NOT NULL,
+            chars INTEGER NOT NULL,
+            voice TEXT,
+            latency_ms INTEGER,
+            cache_hit INTEGER DEFAULT 0,
+            provider TEXT,
+            outcome TEXT NOT NULL
+        );
+        """
+        index_sql = "CREATE INDEX IF NOT EXISTS idx_events_created ON SynthesisEvents(created_at, user_id);"
+        try:
+            await self.execute(sql, commit=True)
+            await self.execute(index_sql, commit=True)
+            for rollup_sql in self.USAGE_ROLLUP_TABLES:
+                await self.execute(rollup_sql, commit=True)
+            return True
+        except Exception as e:
+            logging.error(f"Jadval yaratishda xatolik: {e}")
+            return False
+
+    async def create_table_user_stats(self):
+        """Create the per-voice user counters table kept current by a trigger on Users"""
+        statements = (
+            """
+            CREATE TABLE IF NOT EXISTS UserStats (
+                voice TEXT PRIMARY KEY,
+                users BIGINT NOT NULL DEFAULT 0
+            );
+            """,
+            """
+            CREATE OR REPLACE FUNCTION user_stats_trigger() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP = 'UPDATE' AND OLD.voice IS NOT DISTINCT FROM NEW.voice THEN
+                    RETURN NULL;
+                END IF;
+                IF TG_OP IN ('DELETE', 'UPDATE') THEN
+                    UPDATE UserStats SET users = users - 1 WHERE voice = COALESCE(OLD.voice, '');
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    INSERT INTO UserStats(voice, users) VALUES (COALESCE(NEW.voice, ''), 1)
+                    ON CONFLICT (voice) DO UPDATE SET users = UserStats.users + 1;
+                END IF;
+                RETURN NULL;
+            END
+            $$ LANGUAGE plpgsql;
+            """,
+            """
+            DO $$
+            BEGIN
+                IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'trg_user_stats') THEN
+                    CREATE TRIGGER trg_user_stats AFTER INSERT OR DELETE OR UPDATE OF voice ON Users
+                    FOR EACH ROW EXECUTE FUNCTION user_stats_trigger();
+                END IF;
+            END
+            $$;
+            """,
+        )
+        try:
+            for sql in statements:
+                await self.execute(sql, commit=True)
+            if not await self.select_user_stats():
+                await self.reconcile_user_stats()
+            return True
+        except Exception as e:
+            logging.error(f"Jadval yaratishda xatolik: {e}")
+            return False
+
+    async def create_table_phrases(self):
+        """Create short-phrase frequency table (mined by the warm-up job)"""
+        sql = """
+        CREATE TABLE IF NOT EXISTS PhraseStats (
+            text TEXT PRIMARY KEY,
+            hits BIGINT NOT NULL DEFAULT 0,
+            last_seen BIGINT NOT NULL
+        );
+        """
+        try:
+            await self.execute(sql, commit=True)
+            return True
+        except Exception as e:
+            logging.error(f"Jadval yaratishda xatolik: {e}")
+            return False
+
+    async def create_table_shared_state(self):
+        """Create the key/value table used by ``DatabaseState`` (STATE_BACKEND=database)"""
+        sql = """
+        CREATE TABLE IF NOT EXISTS SharedState (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL,
+            expires_at DOUBLE PRECISION
+        );
+        """
+        try:
+            await self.execute(sql, commit=True)
+            return True
+        except Exception as e:
+            logging.error(f"Jadval yaratishda xatolik: {e}")
+            return False
+
+    async def backup_database(self, backup_path: str):
+        """PostgreSQL zahirasi pg_dump orqali olinadi"""
+        logging.warning("⚠️ PostgreSQL uchun zahiralashni pg_dump bilan bajaring")
+        return False
@@ -0,0 +1,397 @@
+import asyncio
+import io
+import logging
+import random
+import shutil
+import tempfile
+import time
+import wave
+from metrics import AUDIO_BYTES, PROVIDER_ATTEMPTS, PROVIDER_RESPONSES, timed
+from log_pipeline import SAMPLED
+import deadline
+
+
+class ProviderError(Exception):
+    """Synthesis failed on one backend (router may fail over to another)"""
+
+
+# Javob tanasini oqim bilan o'qish: kichik kliplar xotirada (bytes),
+# spill_bytes dan kattalari nomsiz vaqtinchalik faylga (yopilganda o'zi o'chadi)
+async def read_audio_body(response, spill_bytes):
+    buffer = bytearray()
+    spill = None
+    try:
+        async for chunk in response.content.iter_chunked(64 * 1024):
+            if spill is not None:
+                spill.write(chunk)
+                continue
+            buffer += chunk
+            if len(buffer) > spill_bytes:
+                spill = tempfile.TemporaryFile()
+                spill.write(buffer)
+                buffer = None
+    except BaseException:
+        if spill is not None:
+            spill.close()
+        raise
+
+    if spill is not None:
+        spill.seek(0)
+        return spill
+    return bytes(buffer)
+
+
+class TTSProvider:
+    """Base class for synthesis backends.
+
+    ``voices`` - ovoz registri: bot ichidagi ovoz kodi ('male'/'women') -> provayder ovozi.
+    ``synthesize`` muvaffaqiyatda ``{'audio': bytes|file, 'content_type': str}`` qaytaradi,
+    aks holda ``ProviderError`` ko'taradi.
+    """
+
+    name = "base"
+    voices = {}
+    # Natijani audio keshga saqlash mumkinmi (zaxira/sinov provayderlari uchun False)
+    cacheable = True
+    # Zaxira provayderlar faqat asosiylar ishlamaganda tanlanadi
+    fallback = False
+
+    def voice_for(self, voice: str) -> str:
+        try:
+            return self.voices[voice]
+        except KeyError:
+            raise ProviderError(f"{self.name}: '{voice}' ovozi mavjud emas")
+
+    async def synthesize(self, voice: str, text: str):
+        raise NotImplementedError
+
+
+class PlayHTProvider(TTSProvider):
+    """play.ht public transcribe endpoint"""
+
+    name = "playht"
+    voices = {
+        'male': "uz-UZ-SardorNeural",
+        'women': "uz-UZ-MadinaNeural",
+    }
+
+    def __init__(self, http, url="https://play.ht/api/transcribe", spill_bytes=8 * 1024 * 1024):
+        self.http = http
+        self.url = url
+        self.spill_bytes = spill_bytes
+
+    async def synthesize(self, voice, text):
+        headers = {
+            'Content-Type': 'application/json',
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+        }
+
+        json_data = {
+            "userId": "public-access",
+            "platform": "landing_demo",
+            "ssml": f"<speak><p>{text}</p></speak>",
+            "voice": self.voice_for(voice),
+            "narrationStyle": "regular"
+        }
+
+        async with self.http.session.post(self.url, json=json_data, headers=headers) as response:
+            PROVIDER_RESPONSES.labels(self.name, response.status).inc()
+            content_type = response.headers.get("Content-Type", "")
+
+            # Audio fayl kelgan holatda
+            if "audio" in content_type:
+                logging.info("✅ Audio fayl olindi: %s", content_type, extra=SAMPLED)
+                return {'audio': await read_audio_body(response, self.spill_bytes), 'content_type': content_type}
+
+            # JSON javob kelgan holatda - audio URL orqali yuklab olinadi
+            if "application/json" in content_type:
+                data = await response.json()
+                # To'liq javob faqat DEBUG darajasida (va faqat shunda formatlanadi)
+                logging.info("✅ JSON javob olindi", extra=SAMPLED)
+                logging.debug("JSON javob: %s", data)
+                if isinstance(data.get('file'), str):
+                    return await self._download(data['file'])
+                raise ProviderError("Noma'lum javob formati")
+
+            # Javobni text sifatida o'qib ko'ramiz
+            text_response = await response.text()
+            raise ProviderError(f"Noma'lum content type: {content_type} ({response.status}): {text_response[:200]}")
+
+    @timed("download")
+    async def _download(self, url):
+        async with self.http.session.get(url) as response:
+            if response.status != 200:
+                raise ProviderError(f"Yuklab olishda xatolik: {response.status}")
+            return {
+                'audio': await read_audio_body(response, self.spill_bytes),
+                'content_type': response.headers.get("Content-Type", "audio/mpeg"),
+            }
+
+
+class EspeakProvider(TTSProvider):
+    """Local offline engine (espeak-ng), used as a last-resort fallback"""
+
+    name = "espeak"
+    voices = {
+        'male': "uz",
+        'women': "uz+f3",
+    }
+    cacheable = False
+    fallback = True
+
+    def __init__(self, binary="espeak-ng"):
+        self.binary = shutil.which(binary) or shutil.which("espeak")
+
+    @property
+    def available(self):
+        return self.binary is not None
+
+    async def synthesize(self, voice, text):
+        if not self.available:
+            raise ProviderError("espeak-ng o'rnatilmagan")
+        process = await asyncio.create_subprocess_exec(
+            self.binary, "-v", self.voice_for(voice), "--stdout", text,
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+        )
+        try:
+            stdout, stderr = await process.communicate()
+        except asyncio.CancelledError:
+            process.kill()
+            raise
+        if process.returncode != 0 or not stdout:
+            raise ProviderError(f"espeak xatolik: {stderr.decode(errors='ignore')[:200]}")
+        return {'audio': stdout, 'content_type': "audio/wav"}
+
+
+class MockProvider(TTSProvider):
+    """Offline stand-in for tests: silent WAV with configurable latency and error rate"""
+
+    name = "mock"
+    voices = {
+        'male': "mock-male",
+        'women': "mock-women",
+    }
+    cacheable = False
+
+    def __init__(self, latency=0.0, error_rate=0.0):
+        self.latency = latency
+        self.error_rate = error_rate
+
+    async def synthesize(self, voice, text):
+        self.voice_for(voice)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if random.random() < self.error_rate:
+            raise ProviderError("mock: sun'iy xatolik")
+
+        # Har bir belgi uchun ~60 ms jimlik, 8 kHz mono
+        frames = int(8000 * min(30.0, 0.06 * len(text)))
+        buffer = io.BytesIO()
+        with wave.open(buffer, "wb") as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(8000)
+            wav.writeframes(b"\x00\x00" * frames)
+        return {'audio': buffer.getvalue(), 'content_type': "audio/wav"}
+
+
+class ProviderHealth:
+    """EWMA latency / error rate and a circuit breaker for one backend"""
+
+    def __init__(self, alpha=0.2, failure_threshold=5, open_seconds=30.0):
+        self.alpha = alpha
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+
+        self.latency = None  # EWMA, soniya
+        self.error_rate = 0.0  # EWMA, 0..1
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.requests = 0
+        self.failures = 0
+        self.probing = False  # half-open holatida bitta sinov so'rovi ketayotgani
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.open_seconds:
+            return "half-open"
+        return "open"
+
+    def available(self):
+        state = self.state
+        return state == "closed" or (state == "half-open" and not self.probing)
+
+    def begin(self) -> bool:
+        """Claim an attempt; in half-open state only one probe is let through at a time"""
+        state = self.state
+        if state == "half-open":
+            if self.probing:
+                return False
+            self.probing = True
+            return True
+        return state == "closed"
+
+    def release(self):
+        """The attempt ended without a verdict (cancelled or the request deadline passed)"""
+        self.probing = False
+
+    def score(self):
+        # Kichik - yaxshi. Hali muvaffaqiyatli javob bermagan provayder uchun 1 s deb olinadi
+        latency = self.latency if self.latency is not None else 1.0
+        return latency * (1 + 4 * self.error_rate)
+
+    def record(self, ok: bool, latency: float):
+        self.probing = False
+        self.requests += 1
+        a = self.alpha
+        self.error_rate = (1 - a) * self.error_rate + a * (0.0 if ok else 1.0)
+        if ok:
+            self.latency = latency if self.latency is None else (1 - a) * self.latency + a * latency
+            self.consecutive_failures = 0
+            self.opened_at = None
+            return
+
+        self.failures += 1
+        self.consecutive_failures += 1
+        if self.state == "half-open" or self.consecutive_failures >= self.failure_threshold:
+            # Sinov so'rovi ham muvaffaqiyatsiz - yana ochamiz
+            self.opened_at = time.monotonic()
+
+
+class ProviderRouter:
+    """Latency-aware routing with hedged requests and automatic failover.
+
+    Provayderlar sog'lig'i (EWMA kechikish va xatolik darajasi) bo'yicha tartiblanadi.
+    Birinchisi ``hedge_after`` soniyada javob bermasa, keyingi asosiy provayder parallel ishga
+    tushiriladi; birinchi muvaffaqiyatli javob qabul qilinadi, qolganlari bekor qilinadi.
+    Zaxira (``fallback``) provayderlar hedge qilinmaydi - faqat barcha asosiylar xato bergan
+    yoki ularning circuit breaker'i ochiq bo'lganda ishlatiladi.
+    """
+
+    def __init__(self, providers, hedge_after=3.0, timeout=30.0, alpha=0.2,
+                 failure_threshold=5, open_seconds=30.0):
+        self.providers = list(providers)
+        self.hedge_after = hedge_after
+        self.timeout = timeout
+        self.health = {
+            provider.name: ProviderHealth(alpha, failure_threshold, open_seconds)
+            for provider in self.providers
+        }
+        self.stats = {'hedged': 0, 'failovers': 0, 'exhausted': 0}
+
+    def ranked(self):
+        """Available providers, best first: primaries before fallbacks, then by health score"""
+        candidates = [p for p in self.providers if self.health[p.name].available()]
+        return sorted(candidates, key=lambda p: (p.fallback, self.health[p.name].score()))
+
+    async def _attempt(self, provider, voice, text):
+        started = time.monotonic()
+        try:
+            # So'rov muddatidan oshmaydi (yuklab olish ham shu vaqt ichida)
+            result = await asyncio.wait_for(provider.synthesize(voice, text), deadline.remaining(self.timeout))
+        except asyncio.CancelledError:
+            self.health[provider.name].release()
+            PROVIDER_ATTEMPTS.labels(provider.name, "cancelled").inc()
+            raise
+        except Exception as e:
+            timeout = isinstance(e, asyncio.TimeoutError)
+            if timeout and deadline.expired():
+                # Umumiy muddat tugadi - provayder aybdor emas, sog'ligi hisobiga yozilmaydi
+                self.health[provider.name].release()
+                PROVIDER_ATTEMPTS.labels(provider.name, "deadline").inc()
+                raise deadline.DeadlineExceeded(f"{provider.name}: so'rov muddati tugadi")
+            self.health[provider.name].record(False, time.monotonic() - started)
+            PROVIDER_ATTEMPTS.labels(provider.name, "timeout" if timeout else "error").inc()
+            if timeout:
+                logging.error(f"❌ TTS provayder xatolik ({provider.name}): timeout")
+                raise ProviderError(f"{provider.name}: timeout") from e
+            logging.error(f"❌ TTS provayder xatolik ({provider.name}): {e}")
+            raise
+        self.health[provider.name].record(True, time.monotonic() - started)
+        PROVIDER_ATTEMPTS.labels(provider.name, "ok").inc()
+        if isinstance(result['audio'], bytes):
+            AUDIO_BYTES.labels(provider.name).observe(len(result['audio']))
+        result['provider'] = provider
+        return result
+
+    async def synthesize(self, voice: str, text: str):
+        """Return ``{'audio', 'content_type', 'provider'}`` or None if every backend failed"""
+        if deadline.expired():
+            raise deadline.DeadlineExceeded("so'rov muddati tugadi")
+        candidates = self.ranked()
+        if not candidates:
+            self.stats['exhausted'] += 1
+            logging.error("❌ Barcha TTS provayderlar o'chirilgan (circuit open)")
+            return None
+
+        pending = set()
+        next_index = 0
+
+        def launch(hedge=False):
+            # Ro'yxat tuzilgandan keyin boshqa so'rov half-open provayderni sinovga olgan bo'lishi mumkin
+            nonlocal next_index
+            while next_index < len(candidates):
+                provider = candidates[next_index]
+                if hedge and provider.fallback:
+                    return False
+                next_index += 1
+                if self.health[provider.name].begin():
+                    pending.add(asyncio.create_task(self._attempt(provider, voice, text)))
+                    return True
+            return False
+
+        if not launch():
+            self.stats['exhausted'] += 1
+            return None
+        try:
+            while pending:
+                # Faqat asosiy provayderlar hedge qilinadi; zaxiralar - faqat failover uchun
+                can_hedge = next_index < len(candidates) and not candidates[next_index].fallback
+                done, pending = await asyncio.wait(
+                    pending,
+                    timeout=deadline.remaining(self.hedge_after) if can_hedge else None,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not done:
+                    if deadline.expired():
+                        raise deadline.DeadlineExceeded("so'rov muddati tugadi")
+                    # Sekin javob - zaxira provayderga parallel so'rov (hedge)
+                    if launch(hedge=True):
+                        self.stats['hedged'] += 1
+                    continue
+
+                winner = None
+                for task in done:
+                    if task.exception() is None and winner is None:
+                        winner = task.result()
+                if winner is not None:
+                    return winner
+
+                # Hammasi xato bilan tugadi - keyingi provayderga o'tamiz (muddat tugagan bo'lsa foydasiz)
+                if deadline.expired():
+                    raise deadline.DeadlineExceeded("so'rov muddati tugadi")
+                if not pending and launch():
+                    self.stats['failovers'] += 1
+        finally:
+            for task in pending:
+                task.cancel()
+
+        self.stats['exhausted'] += 1
+        return None
+
+    def summary(self):
+        return {
+            **self.stats,
+            'providers': {
+                name: {
+                    'state': health.state,
+                    'latency': health.latency,
+                    'error_rate': health.error_rate,
+                    'requests': health.requests,
+                    'failures': health.failures,
+                }
+                for name, health in self.health.items()
+            },
+        }
@@ -0,0 +1,85 @@
+import math
+import time
+
+# Bir nechta chelakdan atomar olish (MemoryBucketStore.take bilan bir xil mantiq).
+# KEYS - chelaklar; ARGV: now, keyin har bir kalit uchun: o'lchamlar soni, ttl_ms, (rate, capacity, cost) * n
+_TAKE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local pos = 2
+local plans = {}
+local wait, blocked = 0, 0
+for k = 1, #KEYS do
+    local n = tonumber(ARGV[pos])
+    local ttl = tonumber(ARGV[pos + 1])
+    pos = pos + 2
+    local fields = {'u'}
+    for d = 1, n do fields[d + 1] = tostring(d) end
+    local values = redis.call('HMGET', KEYS[k], unpack(fields))
+    local updated = tonumber(values[1])
+    local left = {}
+    for d = 1, n do
+        local rate = tonumber(ARGV[pos])
+        local capacity = tonumber(ARGV[pos + 1])
+        local cost = math.min(tonumber(ARGV[pos + 2]), capacity)
+        pos = pos + 3
+        local tokens = capacity
+        if updated and values[d + 1] then
+            tokens = math.min(capacity, tonumber(values[d + 1]) + math.max(0, now - updated) * rate)
+        end
+        if tokens < cost and (cost - tokens) / rate > wait then
+            wait = (cost - tokens) / rate
+            blocked = k
+        end
+        left[d] = tokens - cost
+    end
+    plans[k] = {left, ttl}
+end
+if wait > 0 then
+    return {tostring(wait), blocked}
+end
+for k = 1, #KEYS do
+    local args = {'u', tostring(now)}
+    for d, tokens in ipairs(plans[k][1]) do
+        args[#args + 1] = tostring(d)
+        args[#args + 1] = tostring(tokens)
+    end
+    redis.call('HSET', KEYS[k], unpack(args))
+    redis.call('PEXPIRE', KEYS[k], plans[k][2])
+end
+return {'0', 0}
+"""
+
+
+class RedisBucketStore:
+    """Token buckets shared by several bot processes (same interface as ``MemoryBucketStore``).
+
+    Holat Redis hash'larida saqlanadi, olish Lua skripti bilan atomar bajariladi;
+    ishlatilmagan kalitlar to'liq to'lish vaqtidan keyin TTL bilan o'chadi.
+    Ulanish ``RedisState`` ga tegishli va u bilan birga yopiladi.
+    """
+
+    def __init__(self, redis, prefix="tts:bucket:"):
+        self.prefix = prefix
+        self._script = redis.register_script(_TAKE_SCRIPT)
+
+    async def take(self, requests):
+        keys = []
+        args = [repr(time.time())]
+        for key, limits, costs in requests:
+            keys.append(f"{self.prefix}{key}")
+            ttl_ms = math.ceil(max(limit.refill_seconds for limit in limits) * 1000) + 1000
+            args += [len(limits), ttl_ms]
+            for limit, cost in zip(limits, costs):
+                args += [repr(limit.rate), repr(limit.capacity), repr(cost)]
+
+        wait, blocked = await self._script(keys=keys, args=args)
+        wait = float(wait)
+        if not wait:
+            return 0.0, None
+        return wait, requests[int(blocked) - 1][0]
+
+    def summary(self):
+        return {}
+
+    async def close(self):
+        pass
@@ -0,0 +1,228 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+from limiter import MemoryBucketStore
+
+# Ushbu jarayonning identifikatori (lease/qulf egasi sifatida yoziladi)
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+class MemoryState:
+    """Process-local key/value store with TTL (single worker and tests).
+
+    Ma'lumot faqat shu jarayonda ko'rinadi, shuning uchun ``shared`` False - chaqiruvchilar
+    jarayonlararo muvofiqlashtirishni (lease, umumiy file_id) o'tkazib yuborishi mumkin.
+    """
+
+    shared = False
+
+    def __init__(self, sweep_interval=60.0):
+        self.owner = WORKER_ID
+        self.sweep_interval = sweep_interval
+        self._data = {}  # key -> (value, expires_at yoki None)
+        self._swept_at = time.monotonic()
+        self._buckets = MemoryBucketStore()
+
+    async def start(self):
+        pass
+
+    def _alive(self, key, now):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= now:
+            del self._data[key]
+            return None
+        return entry
+
+    async def get(self, key: str):
+        entry = self._alive(key, time.monotonic())
+        return entry[0] if entry else None
+
+    async def set(self, key: str, value: str, ttl: float = None):
+        now = time.monotonic()
+        self._data[key] = (value, now + ttl if ttl else None)
+        if now - self._swept_at >= self.sweep_interval:
+            self.sweep(now)
+
+    async def add(self, key: str, value: str, ttl: float = None) -> bool:
+        """Set ``key`` only if it is absent (or expired); True if this call set it"""
+        if self._alive(key, time.monotonic()) is not None:
+            return False
+        await self.set(key, value, ttl)
+        return True
+
+    async def delete(self, key: str, value: str = None):
+        """Delete ``key``; with ``value`` only if it still holds that value (lease release)"""
+        entry = self._data.get(key)
+        if entry is not None and (value is None or entry[0] == value):
+            del self._data[key]
+
+    def sweep(self, now=None):
+        now = time.monotonic() if now is None else now
+        self._swept_at = now
+        for key in [key for key, (_, expires) in self._data.items() if expires is not None and expires <= now]:
+            del self._data[key]
+
+    def buckets(self):
+        return self._buckets
+
+    def summary(self):
+        return {'backend': "memory", 'keys': len(self._data)}
+
+    async def close(self):
+        pass
+
+
+class RedisState:
+    """Key/value store shared by all workers through Redis (or a compatible server)"""
+
+    shared = True
+
+    _RELEASE_SCRIPT = """
+    if redis.call('GET', KEYS[1]) == ARGV[1] then
+        return redis.call('DEL', KEYS[1])
+    end
+    return 0
+    """
+
+    def __init__(self, url: str, prefix="tts:"):
+        import redis.asyncio as aioredis
+        from redis_limiter import RedisBucketStore
+
+        self.owner = WORKER_ID
+        self.prefix = prefix
+        self._redis = aioredis.from_url(url, decode_responses=True)
+        self._release = self._redis.register_script(self._RELEASE_SCRIPT)
+        self._buckets = RedisBucketStore(self._redis, prefix=f"{prefix}bucket:")
+
+    async def start(self):
+        await self._redis.ping()
+        logging.info("🔗 Umumiy holat: Redis")
+
+    async def get(self, key: str):
+        return await self._redis.get(self.prefix + key)
+
+    async def set(self, key: str, value: str, ttl: float = None):
+        await self._redis.set(self.prefix + key, value, px=int(ttl * 1000) if ttl else None)
+
+    async def add(self, key: str, value: str, ttl: float = None) -> bool:
+        return bool(await self._redis.set(self.prefix + key, value, px=int(ttl * 1000) if ttl else None, nx=True))
+
+    async def delete(self, key: str, value: str = None):
+        if value is None:
+            await self._redis.delete(self.prefix + key)
+        else:
+            await self._release(keys=[self.prefix + key], args=[value])
+
+    def buckets(self):
+        return self._buckets
+
+    def summary(self):
+        return {'backend': "redis"}
+
+    async def close(self):
+        await self._redis.close()
+
+
+class DatabaseState:
+    """Key/value store in the bot's own database (``SharedState`` table).
+
+    PostgreSQL bilan barcha ishchilar (turli serverlarda ham) umumiy holatni ko'radi; SQLite bilan
+    bitta serverdagi jarayonlar. Muddati o'tgan yozuvlar fon vazifasida tozalanadi. Rate limit
+    chelaklari har bir so'rovda yoziladi, shuning uchun ular jarayon xotirasida qoladi - umumiy
+    cheklov kerak bo'lsa Redis ishlating.
+    """
+
+    shared = True
+
+    def __init__(self, db, purge_interval=300.0):
+        self.owner = WORKER_ID
+        self.db = db
+        self.purge_interval = purge_interval
+        self._buckets = MemoryBucketStore()
+        self._task = None
+        self.stats = {'purged': 0}
+
+    async def start(self):
+        await self.db.create_table_shared_state()
+        if self._task is None:
+            self._task = asyncio.create_task(self._purge_loop())
+        logging.info("🔗 Umumiy holat: ma'lumotlar bazasi")
+
+    async def get(self, key: str):
+        row = await self.db.execute(
+            "SELECT value FROM SharedState WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            parameters=(key, time.time()), fetchone=True,
+        )
+        return row[0] if row else None
+
+    async def set(self, key: str, value: str, ttl: float = None):
+        await self.db.execute(
+            "INSERT INTO SharedState(key, value, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at",
+            parameters=(key, value, time.time() + ttl if ttl else None), commit=True,
+        )
+
+    async def add(self, key: str, value: str, ttl: float = None) -> bool:
+        now = time.time()
+        # Muddati o'tgan yozuv bo'sh deb hisoblanadi va qayta egallanadi
+        changed = await self.db.execute(
+            "INSERT INTO SharedState(key, value, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at "
+            "WHERE SharedState.expires_at IS NOT NULL AND SharedState.expires_at <= ?",
+            parameters=(key, value, now + ttl if ttl else None, now), commit=True,
+        )
+        return bool(changed and changed > 0)
+
+    async def delete(self, key: str, value: str = None):
+        if value is None:
+            await self.db.execute("DELETE FROM SharedState WHERE key = ?", parameters=(key,), commit=True)
+        else:
+            await self.db.execute(
+                "DELETE FROM SharedState WHERE key = ? AND value = ?", parameters=(key, value), commit=True,
+            )
+
+    async def purge(self):
+        deleted = await self.db.execute(
+            "DELETE FROM SharedState WHERE expires_at IS NOT NULL AND expires_at <= ?",
+            parameters=(time.time(),), commit=True,
+        )
+        if deleted:
+            self.stats['purged'] += deleted
+
+    async def _purge_loop(self):
+        while True:
+            await asyncio.sleep(self.purge_interval)
+            try:
+                await self.purge()
+            except Exception as e:
+                logging.error(f"Umumiy holatni tozalashda xatolik: {e}")
+
+    def buckets(self):
+        return self._buckets
+
+    def summary(self):
+        return {'backend': "database", **self.stats}
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+def create_state(backend: str, db=None, redis_url: str = None):
+    """Build the state backend named by ``STATE_BACKEND`` (memory, redis or database)"""
+    if backend == "redis":
+        return RedisState(redis_url or "redis://localhost:6379/0")
+    if backend in ("database", "postgres"):
+        return DatabaseState(db)
+    if backend != "memory":
+        logging.warning(f"⚠️ Noma'lum STATE_BACKEND: {backend}, xotira ishlatiladi")
+    return MemoryState()
@@ -1,150 +1,580 @@
 import sqlite3
+import asyncio
 import logging
-from contextlib import contextmanager
+import time
+from concurrent.futures import ThreadPoolExecutor
+from metrics import DB_QUERY_LATENCY
+
+sql_log = logging.getLogger("sql")
+
+def query_op(sql: str) -> str:
+    """Statement verb used as the metrics label (SELECT, INSERT, ...)"""
+    return sql.lstrip().split(None, 1)[0].upper() if sql.strip() else "EMPTY"
 
 class Database:
-    def __init__(self, path_to_db="main.db"):
+    """Async SQLite layer: one persistent WAL connection driven by a dedicated thread"""
+
+    dialect = "sqlite"
+
+    # SQLite uchun sozlamalar (har bir ulanishda bir marta)
+    PRAGMAS = (
+        "PRAGMA journal_mode=WAL",
+        "PRAGMA synchronous=NORMAL",
+        "PRAGMA temp_store=MEMORY",
+        "PRAGMA cache_size=-16000",
+        "PRAGMA mmap_size=134217728",
+        "PRAGMA busy_timeout=5000",
+    )
+
+    def __init__(self, path_to_db="main.db", trace_sql=False, metrics_prefix=""):
         self.path_to_db = path_to_db
+        # Boshqa fayldagi bazalar (masalan, ishlar jurnali) metrikada asosiy bazadan ajratiladi
+        self.metrics_prefix = metrics_prefix
+        # SQL_TRACE: har bir so'rov "sql" loggeriga yoziladi (faqat yoqilganda ulanadi)
+        self.trace_sql = trace_sql
+        if trace_sql:
+            sql_log.setLevel(logging.DEBUG)
+        self._connection = None
+        # Bitta oqim: sqlite3 ulanishi faqat shu oqimda ishlatiladi, so'rovlar navbat bilan bajariladi
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+        self._connect_lock = asyncio.Lock()
 
-    @contextmanager
-    def get_connection(self):
-        """Context manager for database connections"""
-        connection = sqlite3.connect(self.path_to_db)
-        connection.set_trace_callback(self.logger)
+    async def connect(self):
+        """Open the persistent connection (idempotent)"""
+        async with self._connect_lock:
+            if self._connection is None:
+                await self._run(self._connect_sync)
+                logging.info(f"📊 Ma'lumotlar bazasiga ulanildi: {self.path_to_db}")
+
+    def _connect_sync(self):
+        connection = sqlite3.connect(self.path_to_db, check_same_thread=False, isolation_level=None)
+        if self.trace_sql:
+            connection.set_trace_callback(self.logger)
+        for pragma in self.PRAGMAS:
+            connection.execute(pragma)
+        self._connection = connection
+
+    async def close(self):
+        """Close the connection and stop the worker thread"""
+        if self._connection is not None:
+            await self._run(self._close_sync)
+        self._executor.shutdown(wait=True)
+
+    def _close_sync(self):
         try:
-            yield connection
-        except Exception as e:
-            connection.rollback()
-            logging.error(f"Database xatolik: {e}")
-            raise
+            self._connection.execute("PRAGMA optimize")
+        finally:
+            self._connection.close()
+            self._connection = None
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _execute_sync(self, sql, parameters, fetchone, fetchall):
+        cursor = self._connection.execute(sql, parameters)
+        try:
+            if fetchall:
+                return cursor.fetchall()
+            if fetchone:
+                return cursor.fetchone()
+            return cursor.rowcount
         finally:
-            connection.close()
+            cursor.close()
+
+    def _executemany_sync(self, sql, seq_of_parameters):
+        connection = self._connection
+        connection.execute("BEGIN")
+        try:
+            cursor = connection.executemany(sql, seq_of_parameters)
+            rowcount = cursor.rowcount
+            cursor.close()
+            connection.execute("COMMIT")
+            return rowcount
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
 
-    def execute(self, sql: str, parameters: tuple = None, fetchone=False, fetchall=False, commit=False):
-        """Execute SQL query with proper error handling"""
+    def _executemany_transaction_sync(self, batches):
+        connection = self._connection
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            for sql, seq_of_parameters in batches:
+                if seq_of_parameters:
+                    connection.executemany(sql, seq_of_parameters).close()
+            connection.execute("COMMIT")
+            return True
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+    def _transaction_sync(self, statements):
+        connection = self._connection
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            for sql, parameters in statements:
+                connection.execute(sql, parameters).close()
+            connection.execute("COMMIT")
+            return True
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+    async def execute(self, sql: str, parameters: tuple = None, fetchone=False, fetchall=False, commit=False):
+        """Execute SQL query off the event loop with proper error handling.
+
+        Ulanish autocommit rejimida, shuning uchun ``commit`` faqat moslik uchun qoldirilgan.
+        Natija qaytarilmasa, o'zgargan qatorlar soni qaytariladi.
+        """
         if parameters is None:
             parameters = ()
-        
-        try:
-            with self.get_connection() as connection:
-                cursor = connection.cursor()
-                cursor.execute(sql, parameters)
-                
-                data = None
-                if fetchall:
-                    data = cursor.fetchall()
-                elif fetchone:
-                    data = cursor.fetchone()
-                
-                if commit:
-                    connection.commit()
-                
-                return data
+        if self._connection is None:
+            await self.connect()
+
+        started = time.perf_counter()
+        try:
+            return await self._run(self._execute_sync, sql, parameters, fetchone, fetchall)
         except sqlite3.Error as e:
             logging.error(f"SQL xatolik: {e}")
             return None
+        finally:
+            DB_QUERY_LATENCY.labels(f"{self.metrics_prefix}{query_op(sql)}").observe(time.perf_counter() - started)
 
-    def create_table_users(self):
+    async def executemany(self, sql: str, seq_of_parameters):
+        """Execute one statement for many parameter sets in a single transaction"""
+        seq_of_parameters = list(seq_of_parameters)
+        if not seq_of_parameters:
+            return 0
+        if self._connection is None:
+            await self.connect()
+
+        started = time.perf_counter()
+        try:
+            return await self._run(self._executemany_sync, sql, seq_of_parameters)
+        except sqlite3.Error as e:
+            logging.error(f"SQL xatolik: {e}")
+            return None
+        finally:
+            DB_QUERY_LATENCY.labels(f"{self.metrics_prefix}{query_op(sql)}_MANY").observe(time.perf_counter() - started)
+
+    async def execute_transaction(self, statements):
+        """Run ``[(sql, parameters), ...]`` atomically; returns True, or None on error"""
+        if self._connection is None:
+            await self.connect()
+        try:
+            return await self._run(self._transaction_sync, [(sql, params or ()) for sql, params in statements])
+        except sqlite3.Error as e:
+            logging.error(f"SQL xatolik: {e}")
+            return None
+
+    async def executemany_transaction(self, batches):
+        """Run ``[(sql, seq_of_parameters), ...]`` as one transaction; returns True, or None on error"""
+        if self._connection is None:
+            await self.connect()
+        try:
+            return await self._run(self._executemany_transaction_sync, [(sql, list(seq)) for sql, seq in batches])
+        except sqlite3.Error as e:
+            logging.error(f"SQL xatolik: {e}")
+            return None
+
+    async def create_table_users(self):
         """Create users table if not exists"""
         sql = """
         CREATE TABLE IF NOT EXISTS Users (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             user_id INTEGER NOT NULL UNIQUE,
             name TEXT NOT NULL,
-            voice TEXT DEFAULT 'women'
+            voice TEXT DEFAULT 'women',
+            created_at INTEGER
         );
         """
-        
+
         # Index qo'shish tezlik uchun
         index_sql = """
         CREATE INDEX IF NOT EXISTS idx_user_id ON Users(user_id);
         """
-        
+
         try:
-            self.execute(sql, commit=True)
-            self.execute(index_sql, commit=True)
+            await self.execute(sql, commit=True)
+            await self.execute(index_sql, commit=True)
             logging.info("📊 Users jadvali muvaffaqiyatli yaratildi")
             return True
         except Exception as e:
             logging.error(f"Jadval yaratishda xatolik: {e}")
             return False
 
-    def add_user(self, user_id: int, name: str, voice: str = 'women'):
+    async def table_columns(self, table: str):
+        """Column names of ``table`` (empty if the table does not exist)"""
+        rows = await self.execute(f"PRAGMA table_info({table})", fetchall=True) or []
+        return [row[1] for row in rows]
+
+    async def ensure_column(self, table: str, column: str, definition: str):
+        """Add a column to an existing table if it is missing"""
+        if column not in await self.table_columns(table):
+            await self.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}", commit=True)
+            logging.info(f"📊 {table} jadvaliga {column} ustuni qo'shildi")
+
+    async def create_table_broadcasts(self):
+        """Create broadcasts table (persisted /send progress and cursor)"""
+        sql = """
+        CREATE TABLE IF NOT EXISTS Broadcasts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER NOT NULL,
+            message_id INTEGER,
+            text TEXT NOT NULL,
+            last_id INTEGER DEFAULT 0,
+            total INTEGER DEFAULT 0,
+            success INTEGER DEFAULT 0,
+            failed INTEGER DEFAULT 0,
+            blocked INTEGER DEFAULT 0,
+            status TEXT DEFAULT 'running'
+        );
+        """
+        try:
+            await self.execute(sql, commit=True)
+            return True
+        except Exception as e:
+            logging.error(f"Jadval yaratishda xatolik: {e}")
+            return False
+
+    # /stat uchun agregatlar: kunlik hisoblagichlar, kunlik faol foydalanuvchilar (trigger UsageDaily.users
+    # ni oshiradi) va soatlik kechikish gistogrammasi. UsageLog har flush'da ularga qo'shadi
+    USAGE_ROLLUP_TABLES = (
+        """
+        CREATE TABLE IF NOT EXISTS UsageDaily (
+            day INTEGER PRIMARY KEY,
+            users INTEGER NOT NULL DEFAULT 0,
+            requests INTEGER NOT NULL DEFAULT 0,
+            chars INTEGER NOT NULL DEFAULT 0,
+            cache_hits INTEGER NOT NULL DEFAULT 0
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS UsageDayUsers (
+            day INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            PRIMARY KEY (day, user_id)
+        ) WITHOUT ROWID;
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_usage_day_users AFTER INSERT ON UsageDayUsers
+        BEGIN
+            INSERT INTO UsageDaily(day, users) VALUES (NEW.day, 1)
+            ON CONFLICT(day) DO UPDATE SET users = users + 1;
+        END;
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS UsageLatency (
+            hour INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,
+            requests INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (hour, bucket)
+        ) WITHOUT ROWID;
+        """,
+    )
+
+    async def create_table_usage(self):
+        """Create synthesis events table (usage log)"""
+        sql = """
+        CREATE TABLE IF NOT EXISTS SynthesisEvents (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            created_at INTEGER NOT NULL,
+            chars INTEGER NOT NULL,
+            voice TEXT,
+            latency_ms INTEGER,
+            cache_hit INTEGER DEFAULT 0,
+            provider TEXT,
+            outcome TEXT NOT NULL
+        );
+        """
+        # Saqlash muddati bo'yicha tozalash vaqt oralig'ini o'chiradi
+        index_sql = """
+        CREATE INDEX IF NOT EXISTS idx_events_created ON SynthesisEvents(created_at, user_id);
+        """
+        try:
+            await self.execute(sql, commit=True)
+            await self.execute(index_sql, commit=True)
+            for rollup_sql in self.USAGE_ROLLUP_TABLES:
+                await self.execute(rollup_sql, commit=True)
+            return True
+        except Exception as e:
+            logging.error(f"Jadval yaratishda xatolik: {e}")
+            return False
+
+    async def add_user(self, user_id: int, name: str, voice: str = 'women'):
         """Add new user or ignore if exists"""
-        sql = "INSERT OR IGNORE INTO Users(user_id, name, voice) VALUES (?, ?, ?)"
+        sql = "INSERT INTO Users(user_id, name, voice, created_at) VALUES (?, ?, ?, ?) ON CONFLICT(user_id) DO NOTHING"
         try:
-            result = self.execute(sql, parameters=(user_id, name, voice), commit=True)
+            await self.execute(sql, parameters=(user_id, name, voice, int(time.time())), commit=True)
             return True
         except Exception as e:
             logging.error(f"Foydalanuvchi qo'shishda xatolik: {e}")
             return False
 
-    def update_user_voice(self, voice: str, user_id: int):
+    async def add_users(self, rows):
+        """Insert many (user_id, name, voice) rows in one transaction, ignoring existing users"""
+        sql = "INSERT INTO Users(user_id, name, voice, created_at) VALUES (?, ?, ?, ?) ON CONFLICT(user_id) DO NOTHING"
+        now = int(time.time())
+        return await self.executemany(sql, [(*row, now) for row in rows])
+
+    async def update_user_voice(self, voice: str, user_id: int):
         """Update user's voice preference"""
         sql = "UPDATE Users SET voice = ? WHERE user_id = ?"
         try:
-            self.execute(sql, parameters=(voice, user_id), commit=True)
-            logging.info(f"✅ Ovoz yangilandi: user_id={user_id}, voice={voice}")
+            await self.execute(sql, parameters=(voice, user_id), commit=True)
+            logging.info("✅ Ovoz yangilandi: user_id=%s, voice=%s", user_id, voice)
             return True
         except Exception as e:
             logging.error(f"Ovozni yangilashda xatolik: {e}")
             return False
 
-    def get_user_voice(self, user_id: int):
+    async def get_user_voice(self, user_id: int):
         """Get user's voice preference"""
         sql = "SELECT voice FROM Users WHERE user_id = ?"
         try:
-            result = self.execute(sql, parameters=(user_id,), fetchone=True)
+            result = await self.execute(sql, parameters=(user_id,), fetchone=True)
             return result[0] if result else 'women'
         except Exception as e:
             logging.error(f"Foydalanuvchi ovozini olishda xatolik: {e}")
             return 'women'
 
-    def stat(self):
-        """Get user statistics"""
+    async def create_table_user_stats(self):
+        """Create the per-voice user counters table kept current by triggers on Users"""
+        statements = (
+            """
+            CREATE TABLE IF NOT EXISTS UserStats (
+                voice TEXT PRIMARY KEY,
+                users INTEGER NOT NULL DEFAULT 0
+            );
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_user_stats_insert AFTER INSERT ON Users
+            BEGIN
+                INSERT INTO UserStats(voice, users) VALUES (COALESCE(NEW.voice, ''), 1)
+                ON CONFLICT(voice) DO UPDATE SET users = users + 1;
+            END;
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_user_stats_delete AFTER DELETE ON Users
+            BEGIN
+                UPDATE UserStats SET users = users - 1 WHERE voice = COALESCE(OLD.voice, '');
+            END;
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_user_stats_voice AFTER UPDATE OF voice ON Users
+            WHEN OLD.voice IS NOT NEW.voice
+            BEGIN
+                UPDATE UserStats SET users = users - 1 WHERE voice = COALESCE(OLD.voice, '');
+                INSERT INTO UserStats(voice, users) VALUES (COALESCE(NEW.voice, ''), 1)
+                ON CONFLICT(voice) DO UPDATE SET users = users + 1;
+            END;
+            """,
+        )
         try:
-            total_users = self.execute("SELECT COUNT(*) FROM Users", fetchone=True)
-            male_users = self.execute("SELECT COUNT(*) FROM Users WHERE voice = 'male'", fetchone=True)
-            female_users = self.execute("SELECT COUNT(*) FROM Users WHERE voice = 'women'", fetchone=True)
-            
-            return (total_users[0] if total_users else 0,)  # Tuple formatida qaytarish
+            for sql in statements:
+                await self.execute(sql, commit=True)
+            # Birinchi ishga tushishda hisoblagichlar mavjud foydalanuvchilardan to'ldiriladi
+            if not await self.select_user_stats():
+                await self.reconcile_user_stats()
+            return True
+        except Exception as e:
+            logging.error(f"Jadval yaratishda xatolik: {e}")
+            return False
+
+    async def create_table_shared_state(self):
+        """Create the key/value table used by ``DatabaseState`` (STATE_BACKEND=database)"""
+        sql = """
+        CREATE TABLE IF NOT EXISTS SharedState (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL,
+            expires_at REAL
+        );
+        """
+        try:
+            await self.execute(sql, commit=True)
+            return True
+        except Exception as e:
+            logging.error(f"Jadval yaratishda xatolik: {e}")
+            return False
+
+    async def select_user_stats(self):
+        """Per-voice user counts from the summary table: {voice: users}"""
+        rows = await self.execute("SELECT voice, users FROM UserStats", fetchall=True) or []
+        return {voice: users for voice, users in rows}
+
+    async def reconcile_user_stats(self):
+        """Recount users per voice (one full scan) and atomically replace the counters"""
+        return await self.execute_transaction([
+            ("DELETE FROM UserStats", None),
+            ("INSERT INTO UserStats(voice, users) "
+             "SELECT COALESCE(voice, ''), COUNT(*) FROM Users GROUP BY COALESCE(voice, '')", None),
+        ])
+
+    async def stat(self):
+        """Get user statistics: (total, male, women) from the incrementally maintained counters"""
+        try:
+            counts = await self.select_user_stats()
+            return (sum(counts.values()), counts.get('male', 0), counts.get('women', 0))
         except Exception as e:
             logging.error(f"Statistika olishda xatolik: {e}")
-            return (0,)
+            return (0, 0, 0)
 
-    def select_all_users(self):
+    async def select_all_users(self):
         """Get all users"""
         try:
-            return self.execute("SELECT * FROM Users", fetchall=True) or []
+            return await self.execute("SELECT * FROM Users", fetchall=True) or []
         except Exception as e:
             logging.error(f"Barcha foydalanuvchilarni olishda xatolik: {e}")
             return []
 
-    def is_user(self, user_id: int):
+    async def select_user_voices(self):
+        """Get (user_id, voice) pairs ordered by user_id"""
+        try:
+            return await self.execute("SELECT user_id, voice FROM Users ORDER BY user_id", fetchall=True) or []
+        except Exception as e:
+            logging.error(f"Foydalanuvchi ovozlarini olishda xatolik: {e}")
+            return []
+
+    async def select_active_user_ids(self, after_id: int = 0, limit: int = 500):
+        """Get a page of (id, user_id) for active users with id > after_id (keyset pagination)"""
+        sql = "SELECT id, user_id FROM Users WHERE id > ? AND active = 1 ORDER BY id LIMIT ?"
+        return await self.execute(sql, parameters=(after_id, limit), fetchall=True)
+
+    async def count_active_users(self):
+        result = await self.execute("SELECT COUNT(*) FROM Users WHERE active = 1", fetchone=True)
+        return result[0] if result else 0
+
+    async def set_user_active(self, user_id: int, active: bool):
+        """Mark a user as reachable (1) or blocked/deactivated (0)"""
+        sql = "UPDATE Users SET active = ? WHERE user_id = ? AND active <> ?"
+        value = 1 if active else 0
+        return await self.execute(sql, parameters=(value, user_id, value), commit=True)
+
+    async def create_broadcast(self, chat_id: int, text: str, total: int):
+        sql = "INSERT INTO Broadcasts(chat_id, text, total) VALUES (?, ?, ?) RETURNING id"
+        result = await self.execute(sql, parameters=(chat_id, text, total), fetchone=True, commit=True)
+        return result[0] if result else None
+
+    async def update_broadcast(self, broadcast_id: int, **fields):
+        """Persist broadcast progress (last_id cursor, counters, status, message_id)"""
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        sql = f"UPDATE Broadcasts SET {columns} WHERE id = ?"
+        return await self.execute(sql, parameters=(*fields.values(), broadcast_id), commit=True)
+
+    async def select_running_broadcasts(self):
+        sql = ("SELECT id, chat_id, message_id, text, last_id, total, success, failed, blocked "
+               "FROM Broadcasts WHERE status = 'running' ORDER BY id")
+        return await self.execute(sql, fetchall=True) or []
+
+    async def add_synthesis_events(self, rows, days=(), day_users=(), latency=()):
+        """Insert buffered events and add them to the /stat rollups in one transaction.
+
+        ``rows``: (user_id, created_at, chars, voice, latency_ms, cache_hit, provider, outcome),
+        ``days``: (day, requests, chars, cache_hits), ``day_users``: (day, user_id),
+        ``latency``: (hour, bucket, requests). Returns None on error (nothing is written).
+        """
+        # Hodisa va agregat birga yoziladi - fondagi to'ldirish (migratsiya 4) ularni ikki marta sanamaydi
+        return await self.executemany_transaction([
+            ("""
+            INSERT INTO SynthesisEvents(user_id, created_at, chars, voice, latency_ms, cache_hit, provider, outcome)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, rows),
+            ("""
+            INSERT INTO UsageDaily(day, requests, chars, cache_hits) VALUES (?, ?, ?, ?)
+            ON CONFLICT(day) DO UPDATE SET requests = UsageDaily.requests + excluded.requests,
+                chars = UsageDaily.chars + excluded.chars, cache_hits = UsageDaily.cache_hits + excluded.cache_hits
+            """, days),
+            ("INSERT INTO UsageDayUsers(day, user_id) VALUES (?, ?) ON CONFLICT(day, user_id) DO NOTHING", day_users),
+            ("""
+            INSERT INTO UsageLatency(hour, bucket, requests) VALUES (?, ?, ?)
+            ON CONFLICT(hour, bucket) DO UPDATE SET requests = UsageLatency.requests + excluded.requests
+            """, latency),
+        ])
+
+    async def delete_synthesis_events(self, before: int):
+        """Delete events and rollups older than ``before`` (unix time); returns deleted event count"""
+        await self.execute("DELETE FROM UsageDaily WHERE day < ?", parameters=(before // 86400,), commit=True)
+        await self.execute("DELETE FROM UsageDayUsers WHERE day < ?", parameters=(before // 86400,), commit=True)
+        await self.execute("DELETE FROM UsageLatency WHERE hour < ?", parameters=(before // 3600,), commit=True)
+        return await self.execute("DELETE FROM SynthesisEvents WHERE created_at < ?", parameters=(before,), commit=True)
+
+    async def create_table_phrases(self):
+        """Create short-phrase frequency table (mined by the warm-up job)"""
+        sql = """
+        CREATE TABLE IF NOT EXISTS PhraseStats (
+            text TEXT PRIMARY KEY,
+            hits INTEGER NOT NULL DEFAULT 0,
+            last_seen INTEGER NOT NULL
+        );
+        """
+        try:
+            await self.execute(sql, commit=True)
+            return True
+        except Exception as e:
+            logging.error(f"Jadval yaratishda xatolik: {e}")
+            return False
+
+    async def add_phrase_hits(self, rows):
+        """Upsert buffered (text, hits, last_seen) rows in one transaction"""
+        sql = """
+        INSERT INTO PhraseStats(text, hits, last_seen) VALUES (?, ?, ?)
+        ON CONFLICT(text) DO UPDATE SET hits = PhraseStats.hits + excluded.hits, last_seen = excluded.last_seen
+        """
+        return await self.executemany(sql, rows)
+
+    async def delete_phrases(self, before: int):
+        """Forget phrases not seen since ``before`` (unix time)"""
+        return await self.execute("DELETE FROM PhraseStats WHERE last_seen < ?", parameters=(before,), commit=True)
+
+    async def top_phrases(self, limit: int, since: int = 0):
+        """Most requested short texts seen since ``since``: [(text, hits), ...]"""
+        sql = "SELECT text, hits FROM PhraseStats WHERE last_seen >= ? ORDER BY hits DESC LIMIT ?"
+        return await self.execute(sql, parameters=(since, limit), fetchall=True) or []
+
+    async def usage_by_day(self, since: int):
+        """Per UTC day since ``since``: (day, active users, requests, chars, cache hits), newest first"""
+        sql = """
+        SELECT day, users, requests, chars, cache_hits FROM UsageDaily
+        WHERE day >= ?
+        ORDER BY day DESC
+        """
+        return await self.execute(sql, parameters=(since // 86400,), fetchall=True) or []
+
+    async def latency_histogram(self, since: int):
+        """Successful-request latency histogram since ``since``: [(bucket, requests), ...]"""
+        # CAST: PostgreSQL'da SUM(BIGINT) numeric (Decimal) qaytaradi
+        sql = """
+        SELECT bucket, CAST(SUM(requests) AS BIGINT) FROM UsageLatency
+        WHERE hour >= ?
+        GROUP BY bucket ORDER BY bucket
+        """
+        return await self.execute(sql, parameters=(since // 3600,), fetchall=True) or []
+
+    async def is_user(self, user_id: int):
         """Check if user exists and return user data"""
         sql = "SELECT * FROM Users WHERE user_id = ?"
         try:
-            result = self.execute(sql, parameters=(user_id,), fetchone=True)
+            result = await self.execute(sql, parameters=(user_id,), fetchone=True)
             return [result] if result else []  # List formatida qaytarish
         except Exception as e:
             logging.error(f"Foydalanuvchini tekshirishda xatolik: {e}")
             return []
 
-    def delete_user(self, user_id: int):
+    async def delete_user(self, user_id: int):
         """Delete user from database"""
         sql = "DELETE FROM Users WHERE user_id = ?"
         try:
-            self.execute(sql, parameters=(user_id,), commit=True)
+            await self.execute(sql, parameters=(user_id,), commit=True)
             return True
         except Exception as e:
             logging.error(f"Foydalanuvchini o'chirishda xatolik: {e}")
             return False
 
-    def get_recent_users(self, limit: int = 10):
-        """Get recently added users"""
-        sql = "SELECT * FROM Users ORDER BY created_at DESC LIMIT ?"
+    async def get_recent_users(self, limit: int = 10):
+        """Get recently added users (rows created before created_at existed sort last)"""
+        sql = "SELECT id, user_id, name, voice, created_at FROM Users ORDER BY created_at IS NULL, created_at DESC, id DESC LIMIT ?"
         try:
-            return self.execute(sql, parameters=(limit,), fetchall=True) or []
+            return await self.execute(sql, parameters=(limit,), fetchall=True) or []
         except Exception as e:
             logging.error(f"So'nggi foydalanuvchilarni olishda xatolik: {e}")
             return []
@@ -152,27 +582,31 @@ class Database:
     @staticmethod
     def logger(statement):
         """Log SQL statements"""
-        logging.debug(f"[SQL] {statement}")
+        sql_log.debug("[SQL] %s", statement)
 
-    def backup_database(self, backup_path: str):
+    def _backup_sync(self, backup_path):
+        with sqlite3.connect(backup_path) as backup:
+            self._connection.backup(backup)
+
+    async def backup_database(self, backup_path: str):
         """Create database backup"""
         try:
-            with self.get_connection() as source:
-                with sqlite3.connect(backup_path) as backup:
-                    source.backup(backup)
+            if self._connection is None:
+                await self.connect()
+            await self._run(self._backup_sync, backup_path)
             logging.info(f"✅ Ma'lumotlar bazasi zahiralandi: {backup_path}")
             return True
         except Exception as e:
             logging.error(f"Zahiralashda xatolik: {e}")
             return False
 
-    def optimize_database(self):
+    async def optimize_database(self):
         """Optimize database performance"""
         try:
-            self.execute("VACUUM", commit=True)
-            self.execute("ANALYZE", commit=True)
+            await self.execute("VACUUM", commit=True)
+            await self.execute("ANALYZE", commit=True)
             logging.info("✅ Ma'lumotlar bazasi optimallashtirildi")
             return True
         except Exception as e:
             logging.error(f"Optimallashtirishda xatolik: {e}")
-            return False
\ No newline at end of file
+            return False
@@ -0,0 +1,42 @@
+import re
+
+# Bo'linish nuqtalari: avval gap oxiri, keyin bo'lak (vergul va h.k.), keyin oddiy probel
+_SENTENCE_END = re.compile(r"(?<=[.!?…])\s+|\n+")
+_CLAUSE_END = re.compile(r"(?<=[,;:—–-])\s+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def _split(text, limit, patterns):
+    if len(text) <= limit:
+        return [text]
+    if not patterns:
+        # Hech qanday chegara topilmadi - qattiq kesish
+        return [text[i:i + limit] for i in range(0, len(text), limit)]
+
+    pattern, rest = patterns[0], patterns[1:]
+    pieces = [piece for piece in pattern.split(text) if piece.strip()]
+    if len(pieces) == 1:
+        return _split(text, limit, rest)
+
+    chunks = []
+    current = ""
+    for piece in pieces:
+        for part in _split(piece, limit, rest):
+            candidate = f"{current} {part}" if current else part
+            if len(candidate) <= limit:
+                current = candidate
+            else:
+                if current:
+                    chunks.append(current)
+                current = part
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def split_text(text: str, limit: int = 1000):
+    """Split text into chunks of at most ``limit`` characters at sentence/clause boundaries"""
+    text = text.strip()
+    if not text:
+        return []
+    return [chunk.strip() for chunk in _split(text, limit, (_SENTENCE_END, _CLAUSE_END, _WHITESPACE))]
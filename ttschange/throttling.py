@@ -0,0 +1,135 @@
+import asyncio
+import logging
+import time
+from aiogram import types
+from aiogram.dispatcher.handler import CancelHandler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+from metrics import THROTTLED
+
+GLOBAL_KEY = "global"
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """Token-bucket limits on text messages: per user and global, requests and characters per minute.
+
+    Chelaklar ``store`` da saqlanadi (``MemoryBucketStore`` yoki bir nechta jarayon uchun
+    ``RedisBucketStore``). Cheklangan foydalanuvchiga bitta ogohlantirish yuboriladi, keyingi
+    xabarlari cheklov tugaguncha jimgina tashlanadi. Buyruqlar va adminlar cheklanmaydi.
+    """
+
+    def __init__(self, store, user_limits, global_limits, is_exempt=None, notice_interval=10.0):
+        super().__init__()
+        self.store = store
+        self.user_limits = tuple(user_limits)
+        self.global_limits = tuple(global_limits)
+        self.is_exempt = is_exempt or (lambda user_id: False)
+        self.notice_interval = notice_interval
+
+        self._notified = {}  # user_id -> ogohlantirish amal qiladigan vaqt (monotonic)
+        self._pruned_at = time.monotonic()
+        self.stats = {'allowed': 0, 'throttled_user': 0, 'throttled_global': 0, 'notices': 0}
+
+    async def on_process_message(self, message: types.Message, data: dict):
+        if not message.text or message.is_command() or self.is_exempt(message.from_user.id):
+            return
+
+        user_id = message.from_user.id
+        # Narx: 1 so'rov va matn uzunligi (belgilar) - ikkala o'lcham bir vaqtda tekshiriladi
+        costs = (1, len(message.text))
+        try:
+            wait, blocked = await self.store.take([
+                (f"user:{user_id}", self.user_limits, costs),
+                (GLOBAL_KEY, self.global_limits, costs),
+            ])
+        except Exception as e:
+            # Ombor ishlamasa cheklovsiz davom etamiz (fail open)
+            logging.error(f"Rate limit omborida xatolik: {e}")
+            return
+
+        if not wait:
+            self.stats['allowed'] += 1
+            return
+
+        scope = "global" if blocked == GLOBAL_KEY else "user"
+        self.stats[f'throttled_{scope}'] += 1
+        THROTTLED.labels(scope).inc()
+        await self._notify(message, scope, wait)
+        raise CancelHandler()
+
+    async def _notify(self, message, scope, wait):
+        now = time.monotonic()
+        if self._notified.get(message.from_user.id, 0) > now:
+            return
+        self._notified[message.from_user.id] = now + max(wait, self.notice_interval)
+        self._prune(now)
+
+        self.stats['notices'] += 1
+        if scope == "global":
+            text = "😔 Hozir bot juda band, birozdan so'ng qayta urinib ko'ring"
+        else:
+            text = f"⏳ Juda ko'p so'rov yubordingiz, {int(wait) + 1} soniyadan so'ng qayta urinib ko'ring"
+        try:
+            await message.answer(text)
+        except Exception as e:
+            logging.error(f"Cheklov haqida xabar yuborishda xatolik: {e}")
+
+    def _prune(self, now):
+        if now - self._pruned_at < 60:
+            return
+        self._pruned_at = now
+        self._notified = {user_id: until for user_id, until in self._notified.items() if until > now}
+
+    def summary(self):
+        return {**self.stats, **self.store.summary(), 'notified': len(self._notified)}
+
+
+class StaleUpdateMiddleware(BaseMiddleware):
+    """Silently drop messages older than ``max_age`` seconds (backlog left after a restart).
+
+    Qayta ishga tushgandan keyin kutib turgan yangilanishlar endi butunlay tashlanmaydi
+    (``skip_updates``) - faqat ``max_age`` dan eskilari o'tkazib yuboriladi.
+    """
+
+    def __init__(self, max_age: float):
+        super().__init__()
+        self.max_age = max_age
+        self.stats = {'stale': 0}
+
+    async def on_pre_process_message(self, message: types.Message, data: dict):
+        if self.max_age and message.date and time.time() - message.date.timestamp() > self.max_age:
+            self.stats['stale'] += 1
+            raise CancelHandler()
+
+    def summary(self):
+        return dict(self.stats)
+
+
+class InflightUpdates(BaseMiddleware):
+    """Counts updates being handled, so shutdown can wait for them before draining the job queue.
+
+    Polling rejimida aiogram har bir yangilanishlar partiyasini alohida vazifada ishlaydi va
+    ``stop_polling`` ularni kutmaydi. Handler ishni navbatga qo'yib ulgurishi uchun ``drain``
+    navbatni to'xtatishdan oldin chaqiriladi.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.active = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    async def on_pre_process_update(self, update: types.Update, data: dict):
+        self.active += 1
+        self._idle.clear()
+
+    async def on_post_process_update(self, update: types.Update, results, data: dict):
+        self.active -= 1
+        if not self.active:
+            self._idle.set()
+
+    async def drain(self, timeout: float):
+        """Wait up to ``timeout`` seconds for the updates being handled"""
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            logging.warning(f"⚠️ {self.active} ta yangilanish {timeout} s ichida tugamadi")
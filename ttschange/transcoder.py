@@ -0,0 +1,152 @@
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+import time
+from metrics import TRANSCODE_BYTES, timed
+
+
+class TranscodeError(Exception):
+    """ffmpeg could not convert the clip (caller falls back to the original bytes)"""
+
+
+class Transcoder:
+    """Normalize provider output (MP3/WAV/...) to mono Opus in OGG via ffmpeg.
+
+    Har bir konvertatsiya alohida ffmpeg jarayonida bajariladi, bir vaqtdagi jarayonlar soni
+    ``workers`` bilan cheklanadi - event loop bloklanmaydi. ffmpeg topilmasa audio o'zgarishsiz
+    qaytariladi (``enabled`` False).
+    """
+
+    def __init__(self, bitrate="32k", sample_rate=48000, loudnorm=True, workers=None,
+                 timeout=60.0, binary="ffmpeg", enabled=True):
+        self.bitrate = bitrate
+        self.sample_rate = sample_rate
+        self.loudnorm = loudnorm
+        self.timeout = timeout
+        self.binary = shutil.which(binary) if enabled else None
+        self._slots = asyncio.Semaphore(workers or os.cpu_count() or 1)
+
+        self.stats = {'transcoded': 0, 'failed': 0, 'bytes_in': 0, 'bytes_out': 0}
+        if enabled and self.binary is None:
+            logging.warning("⚠️ ffmpeg topilmadi - audio transkod qilinmaydi")
+
+    @property
+    def enabled(self):
+        return self.binary is not None
+
+    @property
+    def format_tag(self):
+        """Identifies the output format in cache keys, so changing settings does not serve stale clips"""
+        if not self.enabled:
+            return "raw"
+        return f"opus-{self.bitrate}{'-ln' if self.loudnorm else ''}"
+
+    def _encode_args(self):
+        args = ["-vn", "-ac", "1", "-ar", str(self.sample_rate)]
+        if self.loudnorm:
+            args += ["-af", "loudnorm=I=-16:TP=-1.5:LRA=11"]
+        return args + ["-c:a", "libopus", "-b:a", self.bitrate, "-application", "voip", "-f", "ogg", "pipe:1"]
+
+    async def _run(self, args, stdin_data=None, stdin_file=None):
+        async with self._slots:
+            process = await asyncio.create_subprocess_exec(
+                self.binary, "-hide_banner", "-loglevel", "error", *args,
+                stdin=stdin_file if stdin_file is not None else asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+            )
+            try:
+                stdout, stderr = await asyncio.wait_for(process.communicate(stdin_data), self.timeout)
+            except BaseException:
+                # Bekor qilish yoki timeout - ffmpeg jarayoni qolib ketmasin
+                if process.returncode is None:
+                    process.kill()
+                    await process.wait()
+                raise
+        if process.returncode != 0 or not stdout:
+            raise TranscodeError(f"ffmpeg xatolik: {stderr.decode(errors='ignore')[:200]}")
+        return stdout
+
+    async def transcode(self, audio):
+        """Convert ``audio`` (bytes or a file object, left open for the caller) to OGG/Opus bytes"""
+        if not self.enabled:
+            return audio
+        with timed("transcode"):
+            return await self._transcode(audio)
+
+    async def _transcode(self, audio):
+        try:
+            if isinstance(audio, bytes):
+                size = len(audio)
+                output = await self._run(["-i", "pipe:0", *self._encode_args()], stdin_data=audio)
+            else:
+                size = os.fstat(audio.fileno()).st_size
+                output = await self._run(["-i", "pipe:0", *self._encode_args()], stdin_file=audio)
+        except (TranscodeError, asyncio.TimeoutError, OSError) as e:
+            self.stats['failed'] += 1
+            raise TranscodeError(str(e) or "ffmpeg timeout") from e
+
+        self.stats['transcoded'] += 1
+        self.stats['bytes_in'] += size
+        self.stats['bytes_out'] += len(output)
+        TRANSCODE_BYTES.labels("in").inc(size)
+        TRANSCODE_BYTES.labels("out").inc(len(output))
+        return output
+
+    async def concat(self, clips):
+        """Join already transcoded OGG clips into one stream without re-encoding.
+
+        Alohida OGG oqimlarini baytlab qo'shib bo'lmaydi - ffmpeg bo'lmasa yoki xato bersa
+        ``TranscodeError`` ko'tariladi va chaqiruvchi kliplarni alohida yuboradi.
+        """
+        if len(clips) == 1:
+            return clips[0]
+        if not self.enabled:
+            raise TranscodeError("ffmpeg o'chirilgan")
+
+        try:
+            with tempfile.TemporaryDirectory(prefix="tts-concat-") as workdir:
+                list_path = await asyncio.get_running_loop().run_in_executor(None, self._write_clips, workdir, clips)
+                return await self._run(["-f", "concat", "-safe", "0", "-i", list_path, "-c", "copy", "-f", "ogg", "pipe:1"])
+        except (TranscodeError, asyncio.TimeoutError, OSError) as e:
+            self.stats['failed'] += 1
+            raise TranscodeError(str(e) or "ffmpeg timeout") from e
+
+    @staticmethod
+    def sweep(max_age=300.0):
+        """Remove concat work dirs left by a killed process; returns how many were removed"""
+        removed = 0
+        root = tempfile.gettempdir()
+        for name in os.listdir(root):
+            path = os.path.join(root, name)
+            try:
+                # Boshqa ishchining hozir ishlatayotgan papkasi yangi - tegilmaydi
+                if not name.startswith("tts-concat-") or time.time() - os.stat(path).st_mtime < max_age:
+                    continue
+                shutil.rmtree(path)
+                removed += 1
+            except OSError:
+                continue
+        return removed
+
+    @staticmethod
+    def _write_clips(workdir, clips):
+        listing = []
+        for index, clip in enumerate(clips):
+            path = os.path.join(workdir, f"{index}.ogg")
+            with open(path, "wb") as f:
+                f.write(clip)
+            listing.append(f"file '{path}'")
+        list_path = os.path.join(workdir, "list.txt")
+        with open(list_path, "w") as f:
+            f.write("\n".join(listing))
+        return list_path
+
+    def summary(self):
+        bytes_in = self.stats['bytes_in']
+        return {
+            **self.stats,
+            'enabled': self.enabled,
+            'saved_ratio': 1 - self.stats['bytes_out'] / bytes_in if bytes_in else 0.0,
+        }
@@ -0,0 +1,158 @@
+import asyncio
+import bisect
+import logging
+import time
+from audio_cache import normalize_text
+
+# /stat kechikish gistogrammasi chegaralari (ms); oxirgi bucket - undan kattalar
+LATENCY_BOUNDS_MS = (100, 250, 500, 750, 1000, 1500, 2000, 3000, 5000, 7500, 10000, 20000, 30000, 60000)
+
+
+def latency_bucket(latency_ms: int) -> int:
+    return bisect.bisect_left(LATENCY_BOUNDS_MS, latency_ms)
+
+
+class UsageLog:
+    """Buffered synthesis event log written in batched transactions.
+
+    ``record`` faqat xotiradagi ro'yxatga qo'shadi (so'rov yo'lida SQL yo'q); fon vazifasi
+    har ``flush_interval`` soniyada to'plangan yozuvlarni bitta tranzaksiyada yozadi.
+    Baza ishlamay qolsa bufer ``max_buffer`` bilan cheklanadi - eng eski yozuvlar tashlanadi.
+
+    ``phrase_max_chars`` dan qisqa matnlar chastotasi ham sanaladi (warm-up uchun eng ko'p
+    so'raladigan iboralar shu jadvaldan olinadi).
+
+    Har bir partiya o'sha tranzaksiyada /stat agregatlariga ham qo'shiladi (kunlik hisoblagichlar va
+    soatlik kechikish gistogrammasi) - /stat xom hodisalarni skanerlamaydi.
+    """
+
+    def __init__(self, db, flush_interval=5.0, max_buffer=50_000, retention_days=90, prune_interval=3600.0,
+                 phrase_max_chars=64):
+        self.db = db
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.retention_days = retention_days
+        self.prune_interval = prune_interval
+        self.phrase_max_chars = phrase_max_chars
+
+        self._buffer = []
+        self._phrases = {}  # normallashtirilgan matn -> so'rovlar soni
+        self._flush_lock = asyncio.Lock()
+        self._task = None
+        self._pruned_at = 0.0
+
+        self.stats = {'recorded': 0, 'flushed': 0, 'dropped': 0, 'pruned': 0}
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def record(self, user_id: int, chars: int, voice: str, latency: float, cache_hit: bool,
+               provider: str = None, outcome: str = "ok", text: str = None):
+        """Queue one synthesis event (latency in seconds)"""
+        if text is not None and chars <= self.phrase_max_chars:
+            phrase = normalize_text(text)
+            count = self._phrases.get(phrase)
+            if count is not None or len(self._phrases) < self.max_buffer:
+                self._phrases[phrase] = (count or 0) + 1
+        self._buffer.append((
+            user_id, int(time.time()), chars, voice, int(latency * 1000), int(cache_hit), provider, outcome,
+        ))
+        self.stats['recorded'] += 1
+        overflow = len(self._buffer) - self.max_buffer
+        if overflow > 0:
+            del self._buffer[:overflow]
+            self.stats['dropped'] += overflow
+
+    async def flush(self):
+        """Write all buffered events in one transaction"""
+        async with self._flush_lock:
+            if self._phrases:
+                phrases, self._phrases = self._phrases, {}
+                now = int(time.time())
+                if await self.db.add_phrase_hits([(text, hits, now) for text, hits in phrases.items()]) is None:
+                    for text, hits in phrases.items():
+                        self._phrases[text] = self._phrases.get(text, 0) + hits
+            if not self._buffer:
+                return
+            batch, self._buffer = self._buffer, []
+            if await self.db.add_synthesis_events(batch, *self._rollups(batch)) is None:
+                # Keyingi urinishda qayta yozish uchun bufer boshiga qaytaramiz
+                self._buffer[:0] = batch[-self.max_buffer:]
+            else:
+                self.stats['flushed'] += len(batch)
+
+    @staticmethod
+    def _rollups(batch):
+        days, day_users, latency = {}, set(), {}
+        for user_id, created_at, chars, _, latency_ms, cache_hit, _, outcome in batch:
+            day = created_at // 86400
+            counters = days.setdefault(day, [0, 0, 0])
+            counters[0] += 1
+            counters[1] += chars
+            counters[2] += cache_hit
+            day_users.add((day, user_id))
+            if outcome == "ok":
+                key = (created_at // 3600, latency_bucket(latency_ms))
+                latency[key] = latency.get(key, 0) + 1
+        return (
+            [(day, *counters) for day, counters in days.items()],
+            sorted(day_users),
+            [(hour, bucket, count) for (hour, bucket), count in latency.items()],
+        )
+
+    async def latency_percentiles(self, since: int, quantiles=(0.5, 0.95, 0.99)):
+        """Label of the histogram bucket holding each quantile of successful requests ("≤500", ">60000" ms)"""
+        histogram = [(bucket, int(count)) for bucket, count in await self.db.latency_histogram(since)]
+        total = sum(count for _, count in histogram)
+        result = {}
+        for q in quantiles:
+            result[q] = "—"
+            seen = 0
+            for bucket, count in histogram:
+                seen += count
+                if total and seen >= q * total:
+                    # Oxirgi bucket yuqori chegarasiz
+                    if bucket < len(LATENCY_BOUNDS_MS):
+                        result[q] = f"≤{LATENCY_BOUNDS_MS[bucket]}"
+                    else:
+                        result[q] = f">{LATENCY_BOUNDS_MS[-1]}"
+                    break
+        return result
+
+    async def prune(self):
+        """Delete events older than ``retention_days``"""
+        before = int(time.time()) - self.retention_days * 86400
+        deleted = await self.db.delete_synthesis_events(before)
+        await self.db.delete_phrases(before)
+        if deleted:
+            self.stats['pruned'] += deleted
+            logging.info(f"🧹 Eski statistika yozuvlari o'chirildi: {deleted} ta")
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+                if self.retention_days and time.monotonic() - self._pruned_at >= self.prune_interval:
+                    self._pruned_at = time.monotonic()
+                    await self.prune()
+            except Exception as e:
+                logging.error(f"Statistika yozuvlarini yozishda xatolik: {e}")
+
+    def summary(self):
+        return {
+            **self.stats,
+            'pending': len(self._buffer),
+            'pending_phrases': len(self._phrases),
+        }
@@ -0,0 +1,181 @@
+import asyncio
+import logging
+from array import array
+from bisect import bisect_left
+from log_pipeline import SAMPLED
+
+# Ovoz nomlari kichik butun son kodlari sifatida saqlanadi
+VOICES = ('women', 'male')
+DEFAULT_VOICE = 'women'
+_VOICE_CODES = {voice: code for code, voice in enumerate(VOICES)}
+
+
+class UserCache:
+    """In-memory user -> voice map with write-through updates and batched inserts.
+
+    Ma'lumotlar ixcham saqlanadi: tartiblangan ``array('q')`` (user_id) va unga parallel
+    ``bytearray`` (ovoz kodi) - bir foydalanuvchiga ~9 bayt. Yangi foydalanuvchilar avval
+    kichik lug'atga tushadi va flush vaqtida asosiy massivlarga qo'shiladi.
+
+    Bir nechta ishchi bilan ``state`` (umumiy holat) berilsa, ovoz o'zgarishi u yerga ham yoziladi
+    va ``resolve`` orqali boshqa ishchilar keshi ham yangilanadi.
+    """
+
+    def __init__(self, db, flush_interval=2.0, merge_threshold=10_000, state=None):
+        self.db = db
+        self.state = state if state is not None and state.shared else None
+        self.flush_interval = flush_interval
+        self.merge_threshold = merge_threshold
+
+        self._ids = array('q')
+        self._voices = bytearray()
+        self._overflow = {}  # user_id -> ovoz kodi (hali massivga qo'shilmagan)
+        self._pending = {}  # user_id -> (name, voice) bazaga yozilmagan yangi foydalanuvchilar
+        self._flush_lock = asyncio.Lock()
+        self._task = None
+
+        self.stats = {'hits': 0, 'new_users': 0, 'flushed': 0, 'shared_updates': 0}
+
+    async def warm(self):
+        """Load every (user_id, voice) pair from the database"""
+        rows = await self.db.select_user_voices()
+        ids = array('q')
+        voices = bytearray()
+        for user_id, voice in rows:
+            ids.append(user_id)
+            voices.append(_VOICE_CODES.get(voice, 0))
+        self._ids, self._voices = ids, voices
+        self._overflow.clear()
+        logging.info(f"👥 Foydalanuvchilar keshi yuklandi: {len(ids)} ta")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def __len__(self):
+        return len(self._ids) + len(self._overflow)
+
+    # --- O'qish ---
+
+    def _lookup(self, user_id):
+        code = self._overflow.get(user_id)
+        if code is not None:
+            return code
+        i = bisect_left(self._ids, user_id)
+        if i < len(self._ids) and self._ids[i] == user_id:
+            return self._voices[i]
+        return None
+
+    def get_voice(self, user_id: int):
+        """Return the cached voice, or None for an unknown user"""
+        code = self._lookup(user_id)
+        return VOICES[code] if code is not None else None
+
+    def ensure_user(self, user_id: int, name: str, voice: str = DEFAULT_VOICE):
+        """Return user's voice, registering a new user for the next batched insert"""
+        code = self._lookup(user_id)
+        if code is not None:
+            self.stats['hits'] += 1
+            return VOICES[code]
+
+        self._overflow[user_id] = _VOICE_CODES.get(voice, 0)
+        self._pending[user_id] = (name, voice)
+        self.stats['new_users'] += 1
+        logging.info("➕ Yangi foydalanuvchi qo'shildi: %s", user_id, extra=SAMPLED)
+        return voice
+
+    async def resolve(self, user_id: int, name: str):
+        """``ensure_user`` that also picks up a voice changed on another worker"""
+        voice = self.ensure_user(user_id, name)
+        if self.state is None:
+            return voice
+        shared = await self.state.get(f"voice:{user_id}")
+        if shared in _VOICE_CODES and shared != voice:
+            self._store(user_id, _VOICE_CODES[shared])
+            self.stats['shared_updates'] += 1
+            return shared
+        return voice
+
+    # --- Yozish ---
+
+    def _store(self, user_id, code):
+        i = bisect_left(self._ids, user_id)
+        if i < len(self._ids) and self._ids[i] == user_id:
+            self._voices[i] = code
+        else:
+            self._overflow[user_id] = code
+
+    async def set_voice(self, user_id: int, name: str, voice: str):
+        """Write-through voice update"""
+        if self._lookup(user_id) is None:
+            self.ensure_user(user_id, name, voice)
+            await self._publish(user_id, voice)
+            return True
+
+        # flush bilan bir vaqtda ishlamasligi uchun (INSERT UPDATE dan oldin bajarilsin)
+        async with self._flush_lock:
+            pending = self._pending.get(user_id)
+            if pending is not None:
+                # Hali bazaga yozilmagan - navbatdagi yozuvni yangilash kifoya
+                self._pending[user_id] = (pending[0], voice)
+            elif not await self.db.update_user_voice(voice=voice, user_id=user_id):
+                return False
+
+        self._store(user_id, _VOICE_CODES.get(voice, 0))
+        await self._publish(user_id, voice)
+        return True
+
+    async def _publish(self, user_id, voice):
+        # Muddatsiz: ishchi qayta ishga tushguncha eski qiymat keshda qolmasligi uchun
+        if self.state is not None:
+            await self.state.set(f"voice:{user_id}", voice)
+
+    async def flush(self):
+        """Insert all pending new users in one batch"""
+        async with self._flush_lock:
+            if self._pending:
+                batch, self._pending = self._pending, {}
+                rows = [(user_id, name, voice) for user_id, (name, voice) in batch.items()]
+                if await self.db.add_users(rows) is None:
+                    # Keyingi urinishda qayta yozish uchun qaytaramiz
+                    for user_id, entry in batch.items():
+                        self._pending.setdefault(user_id, entry)
+                else:
+                    self.stats['flushed'] += len(rows)
+
+            if len(self._overflow) >= self.merge_threshold:
+                self._merge()
+
+    def _merge(self):
+        """Fold overflow entries into the sorted arrays"""
+        merged = dict(zip(self._ids, self._voices))
+        merged.update(self._overflow)
+        ids = array('q', sorted(merged))
+        self._voices = bytearray(merged[user_id] for user_id in ids)
+        self._ids = ids
+        self._overflow.clear()
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logging.error(f"Foydalanuvchilarni yozishda xatolik: {e}")
+
+    def summary(self):
+        return {
+            **self.stats,
+            'size': len(self),
+            'pending': len(self._pending),
+        }
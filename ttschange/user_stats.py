@@ -0,0 +1,56 @@
+import asyncio
+import logging
+
+
+class UserStats:
+    """Per-voice user counters for /stat.
+
+    Hisoblagichlar ``UserStats`` jadvalida saqlanadi va Users jadvalidagi triggerlar orqali
+    har bir INSERT/UPDATE/DELETE da o'zgaradi - /stat bir necha qatorni o'qiydi, jadvalni
+    skanerlamaydi. Qo'lda o'zgartirishlar yoki migratsiyalardan keyingi farqlar
+    ``reconcile_interval`` da bir marta to'liq qayta sanash bilan tuzatiladi.
+    """
+
+    def __init__(self, db, reconcile_interval=3600.0):
+        self.db = db
+        self.reconcile_interval = reconcile_interval
+        self._task = None
+        self.stats = {'reconciled': 0, 'drift': 0}
+
+    def start(self):
+        if self._task is None and self.reconcile_interval:
+            self._task = asyncio.create_task(self._reconcile_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def counts(self):
+        """Return {'total', 'male', 'women'} without scanning Users"""
+        total, male, women = await self.db.stat()
+        return {'total': total, 'male': male, 'women': women}
+
+    async def reconcile(self):
+        """Recount from Users and log any drift of the incremental counters"""
+        before = await self.db.select_user_stats()
+        if await self.db.reconcile_user_stats() is None:
+            return
+        after = await self.db.select_user_stats()
+        self.stats['reconciled'] += 1
+        drift = sum(abs(after.get(voice, 0) - before.get(voice, 0)) for voice in set(before) | set(after))
+        if drift:
+            self.stats['drift'] += drift
+            logging.warning(f"⚠️ Foydalanuvchi hisoblagichlari tuzatildi: {before} -> {after}")
+
+    async def _reconcile_loop(self):
+        while True:
+            await asyncio.sleep(self.reconcile_interval)
+            try:
+                await self.reconcile()
+            except Exception as e:
+                logging.error(f"Hisoblagichlarni tekshirishda xatolik: {e}")
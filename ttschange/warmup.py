@@ -0,0 +1,170 @@
+"""Offline warm-up: pre-synthesize popular phrases and pre-upload them to get reusable file_ids.
+
+    python warmup.py --phrases phrases.txt
+    python warmup.py --top 200 --since-days 30          # foydalanish tarixidan eng ko'p so'ralganlar
+    python warmup.py --phrases phrases.txt --top 100 --voices women
+
+Audio ``--chat-id`` (sukut bo'yicha WARMUP_CHAT_ID yoki birinchi admin) chatiga yuklanadi, olingan
+file_id'lar PHRASE_INDEX_PATH fayliga yoziladi. Ishlab turgan bot faylni o'zi qayta o'qiydi.
+Bot sozlamalari (BOT_TOKEN, TTS_PROVIDERS, DATABASE_URL, ...) odatdagidek muhitdan o'qiladi.
+"""
+import argparse
+import asyncio
+import importlib
+import io
+import logging
+import os
+import time
+from audio_cache import normalize_text
+from limiter import TokenBucket
+
+
+def read_phrases(path):
+    """One phrase per line; blank lines and ``#`` comments are skipped"""
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+
+
+class WarmUp:
+    """Synthesizes ``(voice, phrase)`` pairs through the bot pipeline and uploads each clip once"""
+
+    def __init__(self, app, chat_id, concurrency=3, upload_rate=1.0, force=False, max_retries=3):
+        self.app = app
+        self.chat_id = chat_id
+        self.concurrency = concurrency
+        self.force = force
+        self.max_retries = max_retries
+        # Bitta chatga yuborish tezligi Telegram tomonidan cheklangan
+        self.bucket = TokenBucket(rate=upload_rate, capacity=1)
+        self.stats = {'uploaded': 0, 'skipped': 0, 'failed': 0, 'fallback': 0}
+
+    async def run(self, phrases, voices):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        jobs = [(voice, phrase) for phrase in phrases for voice in voices]
+        await asyncio.gather(*(self._warm(semaphore, voice, phrase) for voice, phrase in jobs))
+        return self.stats
+
+    async def _warm(self, semaphore, voice, phrase):
+        library = self.app.phrases
+        if not self.force and library.get(voice, phrase):
+            self.stats['skipped'] += 1
+            return
+
+        async with semaphore:
+            audio, error_msg, source, cacheable = await self.app.synthesize(voice, phrase)
+            if audio is None:
+                logging.error(f"❌ {voice}: {phrase!r} - {error_msg}")
+                self.stats['failed'] += 1
+                return
+            if not cacheable:
+                # Zaxira ovoz indeksga yozilmaydi - ibora keyingi warm-up'da qayta urinib ko'riladi
+                if not isinstance(audio, bytes):
+                    audio.close()
+                logging.warning(f"⚠️ {voice}: {phrase!r} - zaxira provayder ({source}), o'tkazib yuborildi")
+                self.stats['fallback'] += 1
+                return
+            file_id = await self._upload(audio, phrase)
+
+        if file_id is None:
+            self.stats['failed'] += 1
+            return
+        library.put(voice, phrase, file_id)
+        await self.app.audio_cache.put_file_id(voice, phrase, file_id)
+        self.stats['uploaded'] += 1
+        logging.info(f"✅ {voice}: {phrase!r} ({source})")
+
+    async def _upload(self, audio, phrase):
+        from aiogram import types
+        from aiogram.utils import exceptions
+
+        if isinstance(audio, bytes):
+            data = audio
+        else:
+            with audio:
+                data = audio.read()
+        for _ in range(self.max_retries + 1):
+            await self.bucket.acquire()
+            try:
+                sent = await self.app.bot.send_voice(
+                    chat_id=self.chat_id,
+                    voice=types.InputFile(io.BytesIO(data), filename="voice.ogg"),
+                    caption=phrase[:1024],
+                    disable_notification=True,
+                )
+                return sent.voice.file_id if sent.voice else None
+            except exceptions.RetryAfter as e:
+                self.bucket.pause(e.timeout)
+            except Exception as e:
+                logging.error(f"❌ Yuklashda xatolik ({phrase!r}): {e}")
+                return None
+        return None
+
+
+async def collect_phrases(app, args):
+    phrases = []
+    if args.phrases:
+        phrases += read_phrases(args.phrases)
+    if args.top:
+        since = int(time.time()) - args.since_days * 86400
+        phrases += [text for text, _ in await app.db.top_phrases(limit=args.top, since=since)]
+    # Takrorlar va juda uzun matnlar olib tashlanadi
+    unique = {}
+    for phrase in phrases:
+        phrase = normalize_text(phrase)
+        if phrase and len(phrase) <= app.phrases.max_chars:
+            unique.setdefault(phrase, None)
+    return list(unique)
+
+
+async def main(args):
+    # app modul darajasida sozlamalarni o'qiydi va komponentlarni yaratadi
+    app = importlib.import_module("app")
+    chat_id = args.chat_id or int(os.getenv("WARMUP_CHAT_ID", "0")) or min(app.ADMIN_IDS, default=0)
+    if not chat_id:
+        raise SystemExit("--chat-id, WARMUP_CHAT_ID yoki ADMIN_IDS kerak")
+
+    await app.db.connect()
+    await app.db.create_table_phrases()
+    await app.shared_state.start()
+    await app.http.start()
+    app.audio_cache.load()
+    app.phrases.load()
+    try:
+        phrases = await collect_phrases(app, args)
+        voices = args.voices.split(",") if args.voices else list(app.bot_ctx.voices)
+        logging.warning(f"🔥 Warm-up: {len(phrases)} ta ibora x {len(voices)} ta ovoz -> chat {chat_id}")
+        warmup = WarmUp(app, chat_id, concurrency=args.concurrency, upload_rate=args.upload_rate, force=args.force)
+        try:
+            stats = await warmup.run(phrases, voices)
+        finally:
+            # To'xtatilsa ham shu paytgacha yuklanganlar saqlanadi
+            app.phrases.save()
+        logging.warning(f"🔥 Yakunlandi: {stats}, indeksda {len(app.phrases)} ta")
+    finally:
+        await app.http.close()
+        await app.shared_state.close()
+        await app.db.close()
+        session = await app.bot.get_session()
+        await session.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Pre-synthesize and pre-upload popular phrases")
+    parser.add_argument("--phrases", help="iboralar fayli (har qatorda bittadan)")
+    parser.add_argument("--top", type=int, default=0, help="foydalanish tarixidan eng ko'p so'ralgan N ta matn")
+    parser.add_argument("--since-days", type=int, default=30)
+    parser.add_argument("--voices", help="vergul bilan, masalan women,male (sukut bo'yicha hammasi)")
+    parser.add_argument("--chat-id", type=int, default=0, help="audio yuklanadigan shaxsiy chat")
+    parser.add_argument("--concurrency", type=int, default=3, help="bir vaqtdagi sintezlar")
+    parser.add_argument("--upload-rate", type=float, default=1.0, help="yuklash tezligi, xabar/s")
+    parser.add_argument("--force", action="store_true", help="indeksdagi iboralarni ham qayta yuklash")
+    args = parser.parse_args(argv)
+    if not args.phrases and not args.top:
+        parser.error("--phrases yoki --top kerak")
+    return args
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(main(args))
@@ -0,0 +1,156 @@
+import asyncio
+import hmac
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+from aiohttp import web
+from aiogram.utils import executor
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def secret_token_middleware(path: str, secret: str):
+    """Reject webhook calls that do not carry Telegram's secret token header"""
+
+    @web.middleware
+    async def middleware(request, handler):
+        if secret and request.path == path:
+            token = request.headers.get(SECRET_HEADER, "")
+            if not hmac.compare_digest(token, secret):
+                logging.warning(f"⚠️ Webhook: noto'g'ri secret token ({request.remote})")
+                raise web.HTTPForbidden()
+        return await handler(request)
+
+    return middleware
+
+
+class InflightRequests:
+    """Counts webhook requests being handled, so shutdown can wait for them before closing resources.
+
+    aiohttp to'xtashda avval ``on_shutdown`` ni chaqiradi va ochiq so'rovlarni (``shutdown_timeout``)
+    faqat undan keyin kutadi - ya'ni handler'lar yopilgan baza va HTTP klient bilan qolardi.
+    Shuning uchun ``on_shutdown`` dan oldin ``drain`` bilan ularni o'zimiz kutamiz; bu vaqtda
+    keep-alive ulanishlardan kelgan yangi so'rovlarga 503 qaytariladi (Telegram keyinroq qayta yuboradi).
+    """
+
+    def __init__(self):
+        self.active = 0
+        self.closing = False
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    @web.middleware
+    async def middleware(self, request, handler):
+        if self.closing:
+            raise web.HTTPServiceUnavailable()
+        self.active += 1
+        self._idle.clear()
+        try:
+            return await handler(request)
+        finally:
+            self.active -= 1
+            if not self.active:
+                self._idle.set()
+
+    async def drain(self, timeout: float):
+        """Refuse new requests and wait up to ``timeout`` seconds for the open ones"""
+        self.closing = True
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            logging.warning(f"⚠️ Webhook: {self.active} ta so'rov {timeout} s ichida tugamadi")
+
+
+async def register_webhook(bot, url: str, secret: str, drop_pending_updates=True):
+    """Point Telegram at our public URL (done once, not per worker)"""
+    await bot.set_webhook(url, secret_token=secret or None, drop_pending_updates=drop_pending_updates)
+    logging.info(f"🔗 Webhook o'rnatildi: {url}")
+
+
+def _run_worker(index, dispatcher, path, secret, host, port, drain_timeout, on_startup, on_shutdown):
+    # Har bir ishchi jarayon o'z event loop'ida ishlaydi; is_primary_worker() shu qiymatni o'qiydi
+    os.environ["WORKER_INDEX"] = str(index)
+    asyncio.set_event_loop(asyncio.new_event_loop())
+
+    inflight = InflightRequests()
+    app = web.Application(middlewares=[inflight.middleware, secret_token_middleware(path, secret)])
+
+    async def shutdown(dp):
+        # Ochiq so'rovlar tugaguncha (drain_timeout) kutiladi, keyin resurslar yopiladi
+        await inflight.drain(drain_timeout)
+        if on_shutdown is not None:
+            await on_shutdown(dp)
+
+    webhook = executor.set_webhook(
+        dispatcher,
+        webhook_path=path,
+        on_startup=on_startup,
+        on_shutdown=shutdown,
+        web_app=app,
+    )
+    logging.info(f"🌐 Webhook ishchisi #{index} ishga tushdi: {host}:{port}{path}")
+    # reuse_port: barcha ishchilar bitta portni tinglaydi, yadro ulanishlarni taqsimlaydi.
+    # shutdown_timeout: on_shutdown'dan keyin ham qolgan so'rovlar uchun oxirgi muhlat
+    # (asosiy kutish on_shutdown'dan oldin - InflightRequests.drain)
+    webhook.run_app(host=host, port=port, reuse_port=workers_share_port(),
+                    shutdown_timeout=drain_timeout, print=None)
+
+
+def workers_share_port():
+    return hasattr(socket, "SO_REUSEPORT")
+
+
+def start_webhook(dispatcher, url: str, path: str, secret: str, host: str, port: int,
+                  workers=1, drain_timeout=30.0, on_startup=None, on_shutdown=None, shared_state=False):
+    """Register the webhook and serve it from ``workers`` processes behind a reverse proxy"""
+    bot = dispatcher.bot
+    if workers > 1 and not shared_state:
+        # Har bir ishchining o'z keshi bo'lardi: ovoz o'zgarishi va file_id'lar boshqa ishchilarga yetmaydi
+        raise RuntimeError("Bir nechta ishchi uchun umumiy holat kerak (STATE_BACKEND=redis yoki database)")
+
+    async def register():
+        try:
+            # Qayta ishga tushish paytida kelgan yangilanishlar saqlanadi (eskilari StaleUpdateMiddleware'da tashlanadi)
+            await register_webhook(bot, url, secret, drop_pending_updates=False)
+        finally:
+            # Ota jarayon sessiyasini yopamiz - ishchilar o'zlarinikini ochadi
+            session = await bot.get_session()
+            await session.close()
+
+    asyncio.run(register())
+
+    if workers <= 1:
+        _run_worker(0, dispatcher, path, secret, host, port, drain_timeout, on_startup, on_shutdown)
+        return
+
+    if not workers_share_port():
+        raise RuntimeError("Bir nechta ishchi uchun SO_REUSEPORT kerak (Linux)")
+
+    context = multiprocessing.get_context("fork")
+    processes = [
+        context.Process(
+            target=_run_worker,
+            args=(index, dispatcher, path, secret, host, port, drain_timeout, on_startup, on_shutdown),
+            name=f"webhook-worker-{index}",
+        )
+        for index in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    # SIGTERM ishchilarga uzatiladi - har biri ochiq so'rovlarni tugatib, on_shutdown'ni bajaradi
+    def forward_sigterm(signum, frame):
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    signal.signal(signal.SIGTERM, forward_sigterm)
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        # SIGINT butun jarayon guruhiga yuboriladi - ishchilar o'zlari drain qiladi
+        for process in processes:
+            process.join()